@@ -152,16 +152,19 @@ def fit_gaussian(chans, counts):
 def compress_array(array, compress):
    """
    Compresses an 1-D array by the integer factor "compress".  
+   If the array has more than one dimension then the last dimension is
+   compressed, e.g. each row of a 2-D array.
    Temporary fix until the equivalent of IDL's 'rebin' is found.
    """
 
-   l = len(array)
+   array = Numeric.asarray(array)
+   l = array.shape[-1]
    if ((l % compress) != 0):
       print('Compression must be integer divisor of array length')
       return array
 
-   temp = Numeric.resize(array, (l/compress, compress))
-   return Numeric.sum(temp, 1)/compress
+   temp = Numeric.reshape(array, array.shape[:-1] + (l//compress, compress))
+   return Numeric.sum(temp, -1)/compress
 
 ############################################################
 def expand_array(array, expand, sample=0):
@@ -176,7 +179,7 @@ def expand_array(array, expand, sample=0):
    if (expand == 1): return array
    if (sample == 1): return Numeric.repeat(array, expand)
 
-   kernel = Numeric.ones(expand, Numeric.Float)/expand
+   kernel = Numeric.ones(expand, float)/expand
    # The following mimic the behavior of IDL's rebin when expanding
    temp = Numeric.convolve(Numeric.repeat(array, expand), kernel, mode=2)
    # Discard the first "expand-1" entries
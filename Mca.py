@@ -18,18 +18,52 @@ Modifications:
       - Added McaPeak.ignore field to fix problem with other fields getting
         clobbered in fitPeaks.
       - Fixed serious bug in .d_to_channel()
+   Oct. 18, 2026
+      - Added fit_background_array(), an array implementation of the
+        fit_background() loops which gives identical results.  The loops are
+        kept as fit_background_loops() and used with vectorize=0.
+      - Added write_binary_file() and read_binary_file(), a binary file
+        format with the data in one memory mappable block.  Used by
+        write_file() and read_file() with binary=1.
+      - write_ascii_file() and read_ascii_file() format and parse the DATA
+        section with single array operations rather than loops over
+        channels and detectors.  The file format is unchanged.
+      - Added write_netcdf_file(), read_netcdf_file() and read_netcdf_data()
+        which were called by write_file() and read_file() with netcdf=1 but
+        did not exist.  They use compressed HDF5 files via h5py, which can
+        hold many spectra and be read in parts.
+      - Added McaScanWriter, which writes all of the spectra of a scan to one
+        of these files, and McaScanReader which reads parts of them.
+      - get_roi_counts() uses the cumulative sum of the data, which is cached
+        until set_data() is called, and the new function roi_counts().
+      - Added rebin_matrix(), which rebins spectra between energy
+        calibrations conserving counts.
+      - energy_to_channel() and d_to_channel() convert sequences with array
+        operations.  energy_to_channel() used Numeric.ArrayType, which numpy
+        does not have.
+        channel_to_d() used two-theta rather than theta, unlike d_to_channel().
+        It now uses theta, so the d-spacings it returns are different from
+        those computed before this change.
+      - get_energy() and the new get_d() use arrays which are kept until
+        the calibration changes.  get_energy() returns a copy, get_d()
+        returns the shared array, which is read-only.
 """
 
 import numpy as Numeric
 # import Numeric
 import string
 import copy
+import io
 import math
 import sys
 import time
 import CARSMath
 import Xrf
 import fitPeaks
+try:
+   import h5py
+except ImportError:
+   h5py = None
 
 ########################################################################
 class McaBackground:
@@ -85,6 +119,9 @@ class McaFit:
       self.max_iter =     20     # Maximum number of iterations
       self.n_iter =       0      # Actual number of iterations
       self.tolerance =    1.e-4  # Convergence tolerance
+      self.autoderivative = 0    # Derivative flag
+                            #   0 = Analytic derivatives
+                            #   1 = Finite difference derivatives
       self.chisqr =       0.     # Chi-squared on output
       self.status =       0      # Output status code
       self.err_string =   ''     # Output error string
@@ -318,6 +355,8 @@ class Mca:
       self.n_detectors = 1
       nchans = 2048
       self.data = Numeric.zeros(nchans)
+      self.cumulative = None  # (data, cumulative sum) for get_roi_counts()
+      self.axes = None        # [calibration, energy, d] for get_energy()
       self.rois = []
       self.calibration = McaCalibration()
       self.elapsed = McaElapsed()
@@ -374,6 +413,7 @@ class Mca:
             An McaCalibration object
       """
       self.calibration = calibration
+      self.axes = None
 
    ########################################################################
    def get_presets(self):
@@ -493,28 +533,27 @@ class Mca:
          total, net = mca.get_roi_counts(background_width=3)
          print 'Net counts = ', net
       """
-      total = []
-      net = []
-      nchans = len(self.data)
-      for roi in self.rois:
-         left = roi.left
-         ll = max((left-background_width+1), 0)
-         if (background_width > 0):
-             bgd_left = sum(self.data[ll:(left+1)]) / (left-ll+1)
-         else: bgd_left = 0.
-         right = roi.right
-         rr = min((right+background_width-1), nchans-1)
-         if (background_width > 0):
-             bgd_right = sum(self.data[right:rr+1]) / (rr-right+1)
-         else: bgd_right = 0.
-         total_counts = self.data[left:right+1]
-         total.append(sum(total_counts))
-         n_sel        = right - left + 1
-         bgd_counts   = bgd_left + Numeric.arange(n_sel,float)/(n_sel-1) * \
-                                  (bgd_right - bgd_left)
-         net_counts   = total_counts - bgd_counts
-         net.append(sum(net_counts))
-      return (total, net)
+      if (len(self.rois) == 0): return ([], [])
+      left = Numeric.array([roi.left for roi in self.rois])
+      right = Numeric.array([roi.right for roi in self.rois])
+      total, net = roi_counts(self.get_cumulative_data(), left, right,
+                              background_width)
+      return (total.tolist(), net.tolist())
+
+   ########################################################################
+   def get_cumulative_data(self):
+      """
+      Returns the cumulative sum of the data with a leading 0, so that the
+      sum of data[i:j] is c[j]-c[i].  This is computed once for each
+      spectrum, and recomputed after set_data() or when the data attribute is
+      replaced.
+      """
+      if ((self.cumulative == None) or (self.cumulative[0] is not self.data)):
+         c = Numeric.zeros(len(self.data)+1, Numeric.result_type(self.data,
+                                                                  int))
+         Numeric.cumsum(self.data, out=c[1:])
+         self.cumulative = (self.data, c)
+      return self.cumulative[1]
 
    ########################################################################
    def get_environment(self):
@@ -550,22 +589,62 @@ class Mca:
             A Numeric array of data (counts).
       """
       self.data = data
+      self.cumulative = None
 
    ########################################################################
    def get_energy(self):
       """
-      Returns a list containing the energy of each channel in the MCA spectrum.
+      Returns an array containing the energy of each channel in the MCA
+      spectrum.
 
       Procedure:
-         Simply returns mca.channel_to_energy() for each channel
+         Returns mca.channel_to_energy() for each channel.  The energies are
+         kept until the calibration changes, and a copy is returned.
          
       Example:
           from Mca import *
           mca = Mca('mca.001')
           energy = mca.get_energy()
       """
-      channels = Numeric.arange(len(self.data))
-      return self.channel_to_energy(channels)
+      return self.__get_axes()[1].copy()
+
+   ########################################################################
+   def get_d(self):
+      """
+      Returns an array containing the "d-spacing" of each channel in the MCA
+      spectrum.  See channel_to_d().  The array is kept until the
+      calibration changes, and is read-only since it is shared.  The
+      d-spacing is infinite for channels where the energy is 0.
+
+      Example:
+          from Mca import *
+          mca = Mca('mca.001')
+          d = mca.get_d()
+      """
+      axes = self.__get_axes()
+      if (axes[2] is None):
+         with Numeric.errstate(divide='ignore'):
+            axes[2] = self.channel_to_d(Numeric.arange(len(self.data)))
+         axes[2].setflags(write=False)
+      return axes[2]
+
+   ########################################################################
+   def __get_axes(self):
+      """
+      Private function.
+      Returns [key, energy, d], the energy and d-spacing of each channel.
+      These are kept until set_calibration() is called, the calibration
+      values change or the number of channels changes.  d is None until
+      get_d() computes it.  The arrays are read-only since they are shared.
+      """
+      cal = self.calibration
+      key = (cal.offset, cal.slope, cal.quad, cal.two_theta, len(self.data))
+      if ((self.axes == None) or (self.axes[0] != key)):
+         channels = Numeric.arange(len(self.data))
+         energy = self.channel_to_energy(channels)
+         energy.setflags(write=False)
+         self.axes = [key, energy, None]
+      return self.axes
 
    ########################################################################
    def initial_calibration(self, energy):
@@ -702,7 +781,7 @@ class Mca:
       c = Numeric.asarray(channels)
       return self.calibration.offset + \
              self.calibration.slope * c + \
-             self.calibration.quad * Numeric.power(c, 2)
+             self.calibration.quad * (c * c)
 
    ########################################################################
    def channel_to_d(self, channels):
@@ -735,7 +814,8 @@ class Mca:
          d = mca.channel_to_d(channels)       # Get the "d-spacing" of these
       """
       e = self.channel_to_energy(channels)
-      return 12.398 / (2. * e * math.sin(self.calibration.two_theta*math.pi/180.))
+      return 12.398 / (2. * e *
+                       math.sin(self.calibration.two_theta*math.pi/180./2.))
 
    ########################################################################
    def energy_to_channel(self, energy, clip=0):
@@ -749,7 +829,8 @@ class Mca:
       Inputs:
          energy:
             The energy values to be converted to channels. This can be a
-            single number or a sequence energy values.
+            single number or a sequence energy values.  A sequence is
+            converted with one array operation.
             
       Keywords:
          clip:
@@ -766,22 +847,21 @@ class Mca:
          mca = Mca('mca.001')
          channel = mca.energy_to_channel(5.985)
       """
-      if (self.calibration.quad == 0.0):
-         channel = ((energy-self.calibration.offset) /
-                    self.calibration.slope)
+      e = Numeric.asarray(energy, float) - self.calibration.offset
+      a = self.calibration.quad
+      b = self.calibration.slope
+      if (a == 0.0):
+         channel = e / b
       else:
-         # Use the quadratic formula, use some shorthand
-         a = self.calibration.quad
-         b = self.calibration.slope
-         c = self.calibration.offset - energy
-         # There are 2 roots.  I think we always want the "+" root?
-         channel = (-b + Numeric.sqrt(b**2 - 4.*a*c))/(2.*a)
+         # The "+" root of the quadratic formula, in the form
+         # 2c/(-b - sqrt(b**2 - 4ac)) which is accurate when quad is small
+         channel = 2. * e / (b + Numeric.sqrt(b*b + 4.*a*e))
       channel = Numeric.around(channel)
       if (clip != 0): 
          nchans = len(self.data)
          channel = Numeric.clip(channel, 0, nchans-1)
-      if (type(channel) == Numeric.ArrayType): 
-         return channel.astype(Numeric.Int)
+      if (channel.ndim > 0):
+         return channel.astype(int)
       else:
          return int(channel)
 
@@ -817,15 +897,18 @@ class Mca:
          mca = Mca('mca.001')
          channel = mca.d_to_chan(1.598)
       """
+      d = Numeric.asarray(d, float)
       e = 12.398 / (2. * d * math.sin(self.calibration.two_theta*math.pi/180./2.))
       return self.energy_to_channel(e, clip=clip)
 
    ########################################################################
-   def write_file(self, file, netcdf=0):
+   def write_file(self, file, netcdf=0, binary=0, append=0):
       """
       Writes Mca or Med objects to a disk file.
       
       It calls Mca.write_netcdf_file if the netcdf keyword flg is set,
+      Mca.write_binary_file if the binary keyword flag is set, and
+      Mca.write_ascii_file otherwise.
 
       Note that users who want to read such files with Python are strongly
       encouraged to use Mca.read_file()
@@ -840,6 +923,16 @@ class Mca:
             the file is written in ASCII format.  See the documentation
             for Mca.write_ascii_file and Mca.write_netcdf_file for 
             information on the formats.
+
+         binary:
+            Set this flag to write the file in the binary format of
+            Mca.write_binary_file.  This is much faster than the ASCII format
+            for large files, e.g. Meds with many detectors and channels.
+
+         append:
+            Set this flag with netcdf=1 to add the data to the end of an 
+            existing file, e.g. to write all of the points of a scan to one
+            file.
  
       Example:
          mca = Mca()
@@ -855,6 +948,9 @@ class Mca:
 
       if (netcdf != 0):
         write_netcdf_file(file, data, calibration, elapsed, presets, rois,
+                          environment, append=append)
+      elif (binary != 0):
+        write_binary_file(file, data, calibration, elapsed, presets, rois,
                           environment)
       else:
         write_ascii_file(file, data, calibration, elapsed, presets, rois,
@@ -862,10 +958,11 @@ class Mca:
 
 
    ########################################################################
-   def read_file(self, file, netcdf=0, detector=0):
+   def read_file(self, file, netcdf=0, detector=0, binary=0, point=0):
       """
       Reads a disk file into an MCA object.  If the netcdf=1 flag is set it
-      reads a netcdf file, else it assumes the file is ASCII.
+      reads a netcdf file, if the binary=1 flag is set it reads a binary file,
+      else it assumes the file is ASCII.
       If the data file has multiple detectors then the detector keyword can be
       used to specify which detector data to return.
 
@@ -882,13 +979,23 @@ class Mca:
 
          detector:
             Specifies which detector to read if the file has multiple detectors.
+
+         binary:
+            Set this flag to read files written in the binary format of
+            Mca.write_binary_file.
+
+         point:
+            Specifies which spectrum to read if a netCDF file contains more
+            than one.
             
       Example:
          mca = Mca()
          mca.read_file('mca.001')
       """
       if (netcdf != 0):
-         r = read_netcdf_file(file)
+         r = read_netcdf_file(file, point=point)
+      elif (binary != 0):
+         r = read_binary_file(file)
       else:
          r = read_ascii_file(file)
       self.name = file
@@ -897,11 +1004,12 @@ class Mca:
       self.elapsed = r['elapsed'][detector]
       self.rois = r['rois'][detector]
       self.environment = r['environment']
+      if ('presets' in r): self.presets = r['presets'][detector]
 
 
    ########################################################################
    def fit_background(self, bottom_width=4., top_width=0., exponent=2, 
-                      tangent=0, compress=4):
+                      tangent=0, compress=4, vectorize=1):
       """
       This function fits a background to an MCA spectrum. The background is
       fitted using an enhanced version of the algorithm published by
@@ -950,6 +1058,12 @@ class Mca:
             200 MHz Pentium it takes about 3 seconds to fit a 2048 channel
             spectrum with COMPRESS=1 (no compression), but only 0.2 seconds
             with COMPRESS=4 (the default).
+
+         vectorize:
+            Set this flag to 0 to use the original channel-by-channel Python
+            loops (fit_background_loops()).  The default is 1, which uses the
+            array implementation in fit_background_array().  Both give
+            identical results, the array version is much faster.
             
      Procedure:
          1) At each channel "i" an n'th degree polynomial which is concave up
@@ -1016,13 +1130,7 @@ class Mca:
         mca.read_file('mca.001')
         bgd = mca.fit_background(mca, bottom=6, exponent=4)
       """
-      REFERENCE_AMPL=100.
-      TINY = 1.E-20
-      HUGE = 1.E20
-      MAX_TANGENT=2
-
       bgd = copy.copy(self)
-      nchans = len(bgd.data)
       calibration = bgd.get_calibration()
       scratch = copy.copy(bgd.get_data())
       slope = calibration.slope
@@ -1031,90 +1139,21 @@ class Mca:
       if (compress > 1):
          scratch = CARSMath.compress_array(scratch, compress)
          slope = slope * compress
-         nchans = nchans / compress
-
-      # Copy scratch spectrum to background spectrum
-      bckgnd = copy.copy(scratch)
-
-      # Find maximum counts in input spectrum. This information is used to
-      # limit the size of the function lookup table
-      max_counts = max(scratch)
-
-      #  Fit functions which come down from top
-      if (top_width > 0.):
-         #   First make a lookup table of this function
-         chan_width = top_width / (2. * slope)
-         denom = chan_width**exponent
-         indices = Numeric.arange(float(nchans*2+1)) - nchans
-         power_funct = indices**exponent * (REFERENCE_AMPL / denom)
-         power_funct = Numeric.compress((power_funct <= max_counts), power_funct)
-         max_index = len(power_funct)/2 - 1
-
-         for center_chan in range(nchans):
-            first_chan = max((center_chan - max_index), 0)
-            last_chan = min((center_chan + max_index), (nchans-1))
-            f = first_chan - center_chan + max_index
-            l = last_chan - center_chan + max_index
-            test = scratch[center_chan] + power_funct[f:l+1]
-            sub = bckgnd[first_chan:last_chan+1] 
-            bckgnd[first_chan:last_chan+1] = Numeric.maximum(sub, test)
-
-      # Copy this approximation of background to scratch
-      scratch = copy.copy(bckgnd)
-
-      # Find maximum counts in scratch spectrum. This information is used to
-      #   limit the size of the function lookup table
-      max_counts = max(scratch)
-
-      # Fit functions which come up from below
-      bckgnd = Numeric.arange(float(nchans)) - HUGE
-
-      # First make a lookup table of this function
-      chan_width = bottom_width / (2. * slope)
-      if (chan_width == 0.): denom = TINY
-      else: denom = chan_width**exponent
-      indices = Numeric.arange(float(nchans*2+1)) - nchans
-      power_funct = indices**exponent  * (REFERENCE_AMPL / denom)
-      power_funct = Numeric.compress((power_funct <= max_counts), power_funct)
-      max_index = len(power_funct)/2 - 1
-
-      for center_chan in range(nchans-1):
-         tangent_slope = 0.
-         if (tangent):
-            # Find slope of tangent to spectrum at this channel
-            first_chan = max((center_chan - MAX_TANGENT), 0)
-            last_chan = min((center_chan + MAX_TANGENT), (nchans-1))
-            denom = center_chan - Numeric.arange(float(last_chan - first_chan + 1))
-            tangent_slope = (scratch[center_chan] - 
-                             scratch[first_chan:last_chan+1]) / max(denom, 1)
-            tangent_slope = Numeric.sum(tangent_slope) / (last_chan - first_chan)
-
-         first_chan = max((center_chan - max_index), 0)
-         last_chan = min((center_chan + max_index), (nchans-1))
-         last_chan = max(last_chan, first_chan)
-         nc = last_chan - first_chan + 1
-         lin_offset = scratch[center_chan] + \
-                     (Numeric.arange(float(nc)) - nc/2) * tangent_slope
-
-         # Find the maximum height of a function centered on this channel
-         # such that it is never higher than the counts in any channel
-
-         f = first_chan - center_chan + max_index
-         l = last_chan - center_chan + max_index
-         test = scratch[first_chan:last_chan+1] - lin_offset + \
-                                                            power_funct[f:l+1]
-         height = min(test)
-
-         # We now have the function height. Set the background to the
-         # height of the maximum function amplitude at each channel
 
-         test = height + lin_offset - power_funct[f:l+1]
-         sub = bckgnd[first_chan:last_chan+1]
-         bckgnd[first_chan:last_chan+1] = Numeric.maximum(sub, test)
+      if (vectorize != 0):
+         bckgnd = fit_background_array(scratch[Numeric.newaxis,:], [slope],
+                                       bottom_width=bottom_width,
+                                       top_width=top_width, exponent=exponent,
+                                       tangent=tangent)[0]
+      else:
+         bckgnd = fit_background_loops(scratch, slope,
+                                       bottom_width=bottom_width,
+                                       top_width=top_width, exponent=exponent,
+                                       tangent=tangent)
 
       # Expand spectrum
       if (compress > 1): bckgnd = CARSMath.expand_array(bckgnd, compress)
-      bgd.set_data(bckgnd.astype(Numeric.Int))
+      bgd.set_data(bckgnd.astype(int))
       return bgd
 
 
@@ -1358,70 +1397,455 @@ class Mca:
          spread_fp.write('\n')
          spread_fp.close()
 
+########################################################################
+def rebin_matrix(calibration, nchans, ref_calibration, ref_nchans):
+   """
+   Returns a sparse matrix which rebins a spectrum onto the channels of a
+   spectrum with a different energy calibration, conserving counts.  The
+   counts in each channel are assumed to be spread evenly in energy between
+   the channel edges, half way between channels, and are divided among the
+   new channels in proportion to the overlap.  Counts outside the energy
+   range of the new channels are lost.
+
+   Inputs:
+      calibration:
+         The McaCalibration of the spectrum.
+      nchans:
+         The number of channels in the spectrum.
+      ref_calibration:
+         The McaCalibration of the channels to rebin onto.
+      ref_nchans:
+         The number of channels to rebin onto.
+
+   Outputs:
+      A tuple (rows, columns, weights) of 1-D arrays: each channel
+      columns[k] contributes weights[k] of its counts to channel rows[k].
+      The rebinned spectrum is
+         Numeric.bincount(rows, weights*data[columns], ref_nchans)
+
+   Example:
+      rows, cols, weights = rebin_matrix(mca.calibration, 2048,
+                                         ref.calibration, 2048)
+   """
+   def edges(cal, n):
+      c = Numeric.arange(n+1) - 0.5
+      return cal.offset + cal.slope*c + cal.quad*c*c
+   source = edges(calibration, nchans)
+   target = edges(ref_calibration, ref_nchans)
+   # The range of new channels that each channel overlaps
+   first = Numeric.searchsorted(target, source[0:nchans], 'right') - 1
+   last = Numeric.searchsorted(target, source[1:], 'left') - 1
+   first = Numeric.clip(first, 0, ref_nchans-1)
+   last = Numeric.clip(last, first, ref_nchans-1)
+   count = last - first + 1
+   columns = Numeric.repeat(Numeric.arange(nchans), count)
+   start = Numeric.cumsum(count) - count
+   rows = first[columns] + Numeric.arange(len(columns)) - start[columns]
+   overlap = (Numeric.minimum(source[columns+1], target[rows+1]) -
+              Numeric.maximum(source[columns], target[rows]))
+   weights = overlap / (source[columns+1] - source[columns])
+   keep = weights > 0.
+   return (rows[keep], columns[keep], weights[keep])
+
+########################################################################
+def roi_counts(cumulative, left, right, background_width=1):
+   """
+   Returns the total and net counts of regions-of-interest, computed the same
+   way as Mca.get_roi_counts() but from the cumulative sum of the data, so
+   that the time for each ROI does not depend on its width.
+
+   Inputs:
+      cumulative:
+         The output of Mca.get_cumulative_data(), or a 2-D array of these
+         dimensioned [n_detectors, nchans+1].
+      left, right:
+         Arrays of the first and last channels of each ROI.  For 2-D
+         cumulative these are dimensioned [n_detectors, nrois].
+
+   Keywords:
+      background_width:
+         The width of the background region on either side of the peaks.
+
+   Outputs:
+      A tuple (total, net) of arrays with the same dimensions as left.
+   """
+   cumulative = Numeric.asarray(cumulative)
+   nchans = cumulative.shape[-1] - 1
+   left = Numeric.asarray(left)
+   right = Numeric.asarray(right)
+   def counts(first, last):
+      # Sum of data[first:last+1]
+      first = Numeric.clip(first, 0, nchans)
+      last = Numeric.clip(last+1, first, nchans)
+      return (Numeric.take_along_axis(cumulative, last, -1) -
+              Numeric.take_along_axis(cumulative, first, -1))
+   total = counts(left, right)
+   if (background_width > 0):
+      ll = Numeric.maximum(left-background_width+1, 0)
+      bgd_left = counts(ll, left) / (left-ll+1)
+      rr = Numeric.minimum(right+background_width-1, nchans-1)
+      bgd_right = counts(right, rr) / (rr-right+1)
+   else:
+      bgd_left = bgd_right = 0.
+   # The background is a straight line from bgd_left to bgd_right
+   n_sel = right - left + 1
+   net = total - n_sel * (bgd_left + bgd_right) / 2.
+   return (total, net)
+
 #######################################################################
-def write_ascii_file(file, data, calibration, elapsed, presets, rois,
-                     environment):
+def background_kernel(width, slope, exponent, max_counts, nchans):
    """
-   Writes Mca or Med data to a disk file.  The file 
-   format is a tagged ASCII format.  The file contains the information 
-   from the Mca object which it makes sense to store permanently, but 
-   does not contain all of the internal state information for the Mca.  
-   Files written with this routine can be read with read_ascii_file(), which
-   is called by Mca.read_file() if the netcdf flag is 0.
+   Builds the power-function lookup table used by fit_background().
 
-   This procedure is typically not called directly, but is called
-   by Mca.write_file if the netcdf=1 keyword is not used.
+   Inputs:
+      width:
+         Full width in energy units at which the polynomial is 100 counts.
+      slope:
+         Energy calibration slope of the (compressed) spectrum.
+      exponent:
+         Power of the polynomial.
+      max_counts:
+         Maximum counts in the spectrum.  Entries larger than this are
+         discarded to limit the size of the table.
+      nchans:
+         Number of channels in the (compressed) spectrum.
 
-   This function can be used for writing for Mca objects, in which case
-   each input parameter is an object, such as McaElapsed, etc.
-   It can also be used for writing Med objects, in which case each input
-   parameter is a list.
-   
-   If the rank of data is 2 then this is an Med, and the number of detectors
-   is the first dimension of data
+   Outputs:
+      Returns a tuple (power_funct, max_index).  Channel offset "d" from the
+      center of the polynomial uses entry power_funct[d + max_index].
+   """
+   REFERENCE_AMPL=100.
+   TINY = 1.E-20
+   chan_width = width / (2. * slope)
+   if (chan_width == 0.): denom = TINY
+   else: denom = chan_width**exponent
+   indices = Numeric.arange(float(nchans*2+1)) - nchans
+   power_funct = indices**exponent * (REFERENCE_AMPL / denom)
+   power_funct = Numeric.compress((power_funct <= max_counts), power_funct)
+   max_index = len(power_funct)//2 - 1
+   return power_funct, max_index
+
+#######################################################################
+def tangent_slope(scratch, center_chan):
+   """
+   Returns the slope of the tangent to the spectrum at channel center_chan
+   that fit_background(tangent=1) subtracts before fitting the concave down
+   polynomials.
+   """
+   MAX_TANGENT=2
+   nchans = len(scratch)
+   first_chan = max((center_chan - MAX_TANGENT), 0)
+   last_chan = min((center_chan + MAX_TANGENT), (nchans-1))
+   denom = center_chan - Numeric.arange(float(last_chan - first_chan + 1))
+   slope = (scratch[center_chan] - 
+            scratch[first_chan:last_chan+1]) / Numeric.maximum(denom, 1)
+   return Numeric.sum(slope) / (last_chan - first_chan)
+
+#######################################################################
+def fit_background_loops(scratch, slope, bottom_width=4., top_width=0.,
+                         exponent=2, tangent=0):
+   """
+   Fits the background to a single, already compressed, spectrum with the
+   original channel-by-channel loops.  This is the reference implementation
+   for fit_background_array(), see Mca.fit_background() for the algorithm
+   and the meaning of the keywords.
 
    Inputs:
-      file:
-         The name of the disk file to write.
-         
-      data:
-         The data to write.  Either 1-D array or list of 1-D arrays.
+      scratch:
+         1-D array with the (compressed) spectrum.
+      slope:
+         Energy calibration slope of the (compressed) spectrum.
 
-      calibration:
-         An object of type McaCalibration, or a list of such objects.
+   Outputs:
+      Returns a 1-D array with the background.
+   """
+   HUGE = 1.E20
+   nchans = len(scratch)
+
+   # Copy scratch spectrum to background spectrum
+   bckgnd = copy.copy(scratch)
+
+   #  Fit functions which come down from top
+   if (top_width > 0.):
+      #   First make a lookup table of this function
+      power_funct, max_index = background_kernel(top_width, slope, exponent,
+                                                 max(scratch), nchans)
+      for center_chan in range(nchans):
+         first_chan = max((center_chan - max_index), 0)
+         last_chan = min((center_chan + max_index), (nchans-1))
+         f = first_chan - center_chan + max_index
+         l = last_chan - center_chan + max_index
+         test = scratch[center_chan] + power_funct[f:l+1]
+         sub = bckgnd[first_chan:last_chan+1] 
+         bckgnd[first_chan:last_chan+1] = Numeric.maximum(sub, test)
 
-      elapsed:
-         An object of type McaElapsed, or a list of such objects.
+   # Copy this approximation of background to scratch
+   scratch = copy.copy(bckgnd)
 
-      presets:
-         An object of type McaPresets, or a list of such objects.
+   # Fit functions which come up from below
+   bckgnd = Numeric.arange(float(nchans)) - HUGE
 
-      rois:
-         A list of McaROI objects, or a list of lists of such objects.
-      
-      environment:
-         A list of McaEnvironment objects, or a list of lists of such objects.
+   # First make a lookup table of this function
+   power_funct, max_index = background_kernel(bottom_width, slope, exponent,
+                                              max(scratch), nchans)
+
+   for center_chan in range(nchans-1):
+      slope = 0.
+      if (tangent):
+         # Find slope of tangent to spectrum at this channel
+         slope = tangent_slope(scratch, center_chan)
+
+      first_chan = max((center_chan - max_index), 0)
+      last_chan = min((center_chan + max_index), (nchans-1))
+      last_chan = max(last_chan, first_chan)
+      nc = last_chan - first_chan + 1
+      lin_offset = scratch[center_chan] + \
+                  (Numeric.arange(float(nc)) - nc//2) * slope
+
+      # Find the maximum height of a function centered on this channel
+      # such that it is never higher than the counts in any channel
+
+      f = first_chan - center_chan + max_index
+      l = last_chan - center_chan + max_index
+      test = scratch[first_chan:last_chan+1] - lin_offset + \
+                                                         power_funct[f:l+1]
+      height = min(test)
+
+      # We now have the function height. Set the background to the
+      # height of the maximum function amplitude at each channel
+
+      test = height + lin_offset - power_funct[f:l+1]
+      sub = bckgnd[first_chan:last_chan+1]
+      bckgnd[first_chan:last_chan+1] = Numeric.maximum(sub, test)
+   return bckgnd
+
+#######################################################################
+def fit_background_array(scratch, slope, bottom_width=4., top_width=0.,
+                         exponent=2, tangent=0):
+   """
+   Fits the background to one or more already compressed spectra.  This is
+   an array implementation of fit_background_loops() which gives identical
+   results.  Instead of looping over the center channel of each polynomial
+   it evaluates all of the polynomials at once as a sliding window of the
+   power-function lookup table, in blocks of channels to limit the memory
+   used.  See Mca.fit_background() for the algorithm and the meaning of the
+   keywords.
+
+   Inputs:
+      scratch:
+         2-D array [n_spectra, nchans] of (compressed) spectra.
+      slope:
+         A list with the energy calibration slope of each (compressed)
+         spectrum.
+
+   Outputs:
+      Returns a 2-D Float array [n_spectra, nchans] with the backgrounds.
+   """
+   HUGE = 1.E20
+   window_view = Numeric.lib.stride_tricks.sliding_window_view
+   scratch = Numeric.asarray(scratch)
+   nspectra, nchans = scratch.shape
+
+   #  Fit functions which come down from top
+   if (top_width > 0.):
+      kernel, max_index = _background_kernels(scratch, slope, top_width,
+                                              exponent, -Numeric.inf)
+      # A polynomial with a negative max_index does not cover any channels
+      mi = max(max_index)
+      if (mi >= 0):
+         # Column k of the window of channel j is the polynomial centered
+         # on channel j-mi+k, so the lookup table is used reversed
+         kernel = kernel[:, ::-1]
+         padded = Numeric.pad(scratch.astype(float), ((0,0), (mi,mi)),
+                              constant_values=-Numeric.inf)
+         windows = window_view(padded, 2*mi+1, axis=1)
+         top = Numeric.zeros((nspectra, nchans))
+         for rows, first, last in _background_blocks(nspectra, nchans,
+                                                     2*mi+1):
+            test = windows[rows, first:last] + kernel[rows, Numeric.newaxis, :]
+            top[rows, first:last] = Numeric.maximum.reduce(test, axis=2)
+         # Assign back to the input type, like the loops do
+         scratch = Numeric.maximum(scratch, top).astype(scratch.dtype)
+
+   # Fit functions which come up from below
+   bckgnd = Numeric.zeros((nspectra, nchans)) + \
+            (Numeric.arange(float(nchans)) - HUGE)
+   kernel, max_index = _background_kernels(scratch, slope, bottom_width,
+                                           exponent, Numeric.inf)
+   # The loops treat a polynomial narrower than 1 channel specially, those
+   # spectra are done with the loops at the end
+   narrow = Numeric.nonzero(max_index < 0)[0]
+   kernel[narrow] = 0.
+   max_index = Numeric.maximum(max_index, 0)
+   mi = max(max_index)
+   width = 2*mi+1
+
+   # Everything below is computed for the polynomial centered on each
+   # channel except the last one
+   ncenters = nchans-1
+   centers = Numeric.arange(ncenters)
+   first_chan = Numeric.maximum(centers - max_index[:,Numeric.newaxis], 0)
+   last_chan = Numeric.minimum(centers + max_index[:,Numeric.newaxis],
+                               nchans-1)
+   half = (last_chan - first_chan + 1)//2
+   data = scratch.astype(float)
+   center_counts = data[:, :ncenters]
+   slopes = Numeric.zeros((nspectra, ncenters))
+   if (tangent):
+      slopes[:] = _tangent_slopes(scratch)
+
+   # Find the maximum height of a function centered on each channel
+   # such that it is never higher than the counts in any channel
+   height = Numeric.zeros((nspectra, ncenters))
+   padded = Numeric.pad(data, ((0,0), (mi,mi)), constant_values=Numeric.inf)
+   windows = window_view(padded, width, axis=1)
+   offsets = Numeric.arange(width) - mi
+   for rows, first, last in _background_blocks(nspectra, ncenters, width):
+      if (tangent):
+         chan = centers[first:last, Numeric.newaxis] + offsets
+         chan = chan - first_chan[rows, first:last, Numeric.newaxis]
+         lin_offset = center_counts[rows, first:last, Numeric.newaxis] + \
+              (chan.astype(float) - half[rows, first:last, Numeric.newaxis]) * \
+              slopes[rows, first:last, Numeric.newaxis]
+      else:
+         # Without the tangent lin_offset is just the center channel counts
+         lin_offset = center_counts[rows, first:last, Numeric.newaxis]
+      test = windows[rows, first:last] - lin_offset + \
+                                            kernel[rows, Numeric.newaxis, :]
+      height[rows, first:last] = Numeric.minimum.reduce(test, axis=2)
+
+   # We now have the function heights. Set the background to the
+   # height of the maximum function amplitude at each channel.  Pad the
+   # quantities for each center channel so that windows at the ends of the
+   # spectrum only see polynomials which are not there.
+   def pad(array, value=0):
+      return window_view(Numeric.pad(array, ((0,0), (mi,mi+1)),
+                                     constant_values=value), width, axis=1)
+   if (not tangent): height = height + center_counts
+   height = pad(height, -Numeric.inf)
+   center_counts = pad(center_counts)
+   slopes = pad(slopes)
+   first_chan = pad(first_chan)
+   half = pad(half)
+   kernel = kernel[:, ::-1]
+   chans = Numeric.arange(nchans)
+   for rows, first, last in _background_blocks(nspectra, nchans, width):
+      if (tangent):
+         chan = chans[first:last, Numeric.newaxis] - first_chan[rows, first:last]
+         lin_offset = center_counts[rows, first:last] + \
+                      (chan.astype(float) - half[rows, first:last]) * \
+                      slopes[rows, first:last]
+         test = height[rows, first:last] + lin_offset
+      else:
+         test = height[rows, first:last]
+      test = test - kernel[rows, Numeric.newaxis, :]
+      test = Numeric.maximum.reduce(test, axis=2)
+      bckgnd[rows, first:last] = Numeric.maximum(bckgnd[rows, first:last], test)
+   for i in narrow:
+      bckgnd[i] = fit_background_loops(scratch[i], slope[i],
+                                       bottom_width=bottom_width,
+                                       top_width=0., exponent=exponent,
+                                       tangent=tangent)
+   return bckgnd
+
+#######################################################################
+def _background_kernels(scratch, slope, width, exponent, fill):
+   """
+   Private function.  Builds the lookup table of each spectrum in
+   fit_background_array(), padded with "fill" to a common width so that the
+   entry for offset d is in column d + max(max_index).
+   """
+   nspectra, nchans = scratch.shape
+   tables = []
+   max_index = Numeric.zeros(nspectra, int)
+   for i in range(nspectra):
+      power_funct, max_index[i] = background_kernel(width, slope[i],
+                                                    exponent,
+                                                    max(scratch[i]), nchans)
+      tables.append(power_funct)
+   mi = max(max(max_index), 0)
+   kernel = Numeric.zeros((nspectra, 2*mi+1)) + fill
+   for i in range(nspectra):
+      if (max_index[i] < 0): continue
+      n = 2*max_index[i]+1
+      kernel[i, mi-max_index[i]:mi-max_index[i]+n] = tables[i][0:n]
+   return kernel, max_index
+
+#######################################################################
+def _tangent_slopes(scratch):
+   """
+   Private function.  Returns tangent_slope() for every channel but the last
+   of each spectrum in fit_background_array().
+   """
+   nspectra, nchans = scratch.shape
+   slopes = Numeric.zeros((nspectra, nchans-1))
+   # The end channels do not have a full 5 channel window
+   ends = [c for c in (0, 1, nchans-3, nchans-2) if 0 <= c < nchans-1]
+   for i in range(nspectra):
+      for c in ends:
+         slopes[i,c] = tangent_slope(scratch[i], c)
+   centers = Numeric.arange(2, nchans-3)
+   if (len(centers) == 0): return slopes
+   windows = Numeric.lib.stride_tricks.sliding_window_view(scratch, 5, axis=1)
+   denom = Numeric.maximum(centers[:,Numeric.newaxis] - 
+                           Numeric.arange(float(5)), 1)
+   slope = (scratch[:, centers, Numeric.newaxis] - windows[:, 0:len(centers)]) / denom
+   slopes[:, centers] = Numeric.sum(slope, axis=2) / 4
+   return slopes
+
+#######################################################################
+def _background_blocks(nspectra, nchans, width, size=2**16):
+   """
+   Private function.  Splits nspectra spectra of nchans channels into blocks
+   of (rows, first, last), where rows is a slice of spectra, so that arrays
+   [rows, first:last, width] have about "size" elements.
+   """
+   block = min(max(size // width, 1), nchans)
+   nrows = max(size // (block*width), 1)
+   blocks = []
+   for row in range(0, nspectra, nrows):
+      rows = slice(row, min(row+nrows, nspectra))
+      for first in range(0, nchans, block):
+         blocks.append((rows, first, min(first+block, nchans)))
+   return blocks
+
+#######################################################################
+def _detector_lists(data, calibration, elapsed, presets, rois):
    """
-   if (Numeric.rank(data) == 2):
+   Private function.  Converts the inputs of write_ascii_file() for a single
+   Mca (1-D data) into lists, and returns [n_det, nchans, data, calibration, elapsed,
+   presets, rois].
+   """
+   if (Numeric.ndim(data) == 2):
       n_det = len(data)
    else:
-      n_det = 1
-   fformat = '%f ' * n_det
-   eformat = '%e ' * n_det
-   iformat = '%d ' * n_det
-   sformat = '%s ' * n_det
-   if (n_det == 1):
       # For convenience we convert all attributes to lists
+      n_det = 1
       data = [data]
       rois = [rois]
       calibration = [calibration]
       presets = [presets]
       elapsed = [elapsed]
    nchans = len(data[0])
+   return [n_det, nchans, data, calibration, elapsed, presets, rois]
+
+########################################################################
+def _write_header(fp, version, n_det, nchans, calibration, elapsed, rois,
+                  environment, presets=None, exact=0):
+   """
+   Private function.  Writes the tagged header, everything before the DATA:
+   tag, for write_ascii_file() and write_binary_file().  The PRESET_ tags
+   are only written if presets is a list of McaPresets objects.  If exact
+   is set the floating point values are written with full precision.
+   """
+   fformat = '%f ' * n_det
+   eformat = '%e ' * n_det
+   if (exact): fformat = eformat = _exact_format * n_det
+   iformat = '%d ' * n_det
+   sformat = '%s ' * n_det
    start_time = elapsed[0].start_time
 
-   fp = open(file, 'w')
-   fp.write('VERSION:    '+'3.1'+'\n')
+   fp.write('VERSION:    '+version+'\n')
    fp.write('ELEMENTS:   '+str(n_det)+'\n')
    fp.write('DATE:       '+str(start_time)+'\n')
    fp.write('CHANNELS:   '+str(nchans)+'\n')
@@ -1446,6 +1870,13 @@ def write_ascii_file(file, data, calibration, elapsed, presets, rois,
    fp.write('CAL_SLOPE: '+(eformat % tuple(slope))+'\n')
    fp.write('CAL_QUAD: '+(eformat % tuple(quad))+'\n')
    fp.write('TWO_THETA: '+(fformat % tuple(two_theta))+'\n')
+   if (presets is not None):
+      for (tag, attr, format) in _preset_tags:
+         values = []
+         for p in presets:
+            values.append(getattr(p, attr))
+         if (exact and (format != '%d ')): format = _exact_format
+         fp.write(tag+' '+(format*n_det % tuple(values))+'\n')
 
    for i in range(max(nrois)):
       num = str(i)
@@ -1466,12 +1897,76 @@ def write_ascii_file(file, data, calibration, elapsed, presets, rois,
      fp.write('ENVIRONMENT: '       + str(e.name) +
                               '="'  + str(e.value) +
                               '" (' + str(e.description) + ')\n')
+
+# Format of floating point values which are written with full precision
+_exact_format = '%.17g '
+
+# Tags and formats of the McaPresets fields in the binary file header
+_preset_tags = [('PRESET_REAL:',     'real_time',       '%f '),
+                ('PRESET_LIVE:',     'live_time',       '%f '),
+                ('PRESET_COUNTS:',   'total_counts',    '%f '),
+                ('PRESET_START:',    'start_channel',   '%d '),
+                ('PRESET_END:',      'end_channel',     '%d '),
+                ('PRESET_DWELL:',    'dwell',           '%e '),
+                ('PRESET_ADVANCE:',  'channel_advance', '%d '),
+                ('PRESET_PRESCALE:', 'prescale',        '%d ')]
+
+########################################################################
+def write_ascii_file(file, data, calibration, elapsed, presets, rois,
+                     environment):
+   """
+   Writes Mca or Med data to a disk file.  The file 
+   format is a tagged ASCII format.  The file contains the information 
+   from the Mca object which it makes sense to store permanently, but 
+   does not contain all of the internal state information for the Mca.  
+   Files written with this routine can be read with read_ascii_file(), which
+   is called by Mca.read_file() if the netcdf flag is 0.
+
+   This procedure is typically not called directly, but is called
+   by Mca.write_file if the netcdf=1 keyword is not used.
+
+   This function can be used for writing for Mca objects, in which case
+   each input parameter is an object, such as McaElapsed, etc.
+   It can also be used for writing Med objects, in which case each input
+   parameter is a list.
+   
+   If the rank of data is 2 then this is an Med, and the number of detectors
+   is the first dimension of data
+
+   Inputs:
+      file:
+         The name of the disk file to write.
+         
+      data:
+         The data to write.  Either 1-D array or list of 1-D arrays.
+
+      calibration:
+         An object of type McaCalibration, or a list of such objects.
+
+      elapsed:
+         An object of type McaElapsed, or a list of such objects.
+
+      presets:
+         An object of type McaPresets, or a list of such objects.
+
+      rois:
+         A list of McaROI objects, or a list of lists of such objects.
+      
+      environment:
+         A list of McaEnvironment objects, or a list of lists of such objects.
+   """
+   [n_det, nchans, data, calibration, elapsed, presets, rois] = \
+         _detector_lists(data, calibration, elapsed, presets, rois)
+   iformat = '%d ' * n_det
+
+   fp = open(file, 'w')
+   _write_header(fp, '3.1', n_det, nchans, calibration, elapsed, rois,
+                 environment)
    fp.write('DATA: \n')
-   counts = Numeric.zeros(n_det)
-   for i in range(nchans):
-      for d in range(n_det):
-         counts[d]=data[d][i]
-      fp.write((iformat % tuple(counts))+'\n')
+   # Format all of the counts with one operation, one line per channel
+   counts = Numeric.transpose(Numeric.asarray(data)[:,0:nchans])
+   counts = counts.astype(int)  # Same truncation as %d of a float
+   fp.write(((iformat+'\n') * nchans) % tuple(counts.ravel().tolist()))
    fp.close()
 
 ########################################################################
@@ -1501,25 +1996,60 @@ def read_ascii_file(file):
       m['elapsed'][0].real_time
    """
    fp = open(file, 'r')
-   line = ''
-   start_time = ''
+   [r, data_found] = _read_header(fp, file)
+   n_detectors = r['n_detectors']
+   nchans = r['nchans']
    data = None
+   if (data_found):
+      # Parse all of the counts with one operation, one line per channel
+      counts = Numeric.fromstring(fp.read(), dtype='i', sep=' ',
+                                  count=nchans*n_detectors)
+      counts = Numeric.reshape(counts, (nchans, n_detectors))
+      data = list(Numeric.ascontiguousarray(Numeric.transpose(counts)))
+
+   # Make sure DATA array is defined, else this was not a valid data file
+   if (data is None): print(f'Not a valid data file: {file}.')
+   fp.close()
+   r['data'] = data
+   return r
+
+########################################################################
+def _read_header(fp, file):
+   """
+   Private function.  Reads the tagged header of a file written with
+   write_ascii_file() or write_binary_file(), up to and including the DATA:
+   tag.  fp can be opened in text or binary mode.
+
+   Returns [r, data_found], where r is a dictionary with the entries
+   described in read_ascii_file(), except 'data', plus 'nchans', 'version'
+   and, if the file contains them, 'presets', 'data_type' and 'data_offset'.
+   data_found is 1 if the DATA: tag was read.
+   """
+   start_time = ''
+   version = ''
+   nchans = 0
+   max_rois = 0
+   data_found = 0
+   data_type = None
+   data_offset = None
  
    environment = []
    n_detectors = 1  # Assume single element data
    elapsed = [McaElapsed()]
    calibration = [McaCalibration()]
+   presets = None
    rois = [[]]
    while(1):
       line = fp.readline()
+      if (isinstance(line, bytes)): line = line.decode()
       if (line == ''): break
-      pos = string.find(line, ' ')
+      pos = line.find(' ')
       if (pos == -1): pos = len(line)
       tag = line[0:pos]
-      value = string.strip(line[pos:])
-      values = string.split(value)
+      value = line[pos:].strip()
+      values = value.split()
       if (tag == 'VERSION:'):
-          pass
+         version = value
       elif (tag == 'DATE:'):  
          start_time = value
       elif (tag == 'ELEMENTS:'):
@@ -1557,23 +2087,31 @@ def read_ascii_file(file):
       elif (tag == 'TWO_THETA:'):
          for d in range(n_detectors):
             calibration[d].two_theta = float(values[d])
+      elif (tag.startswith('PRESET_')):
+         if (presets is None):
+            presets = []
+            for d in range(n_detectors):
+               presets.append(McaPresets())
+         for (preset_tag, attr, format) in _preset_tags:
+            if (tag == preset_tag):
+               convert = {'%d ': int}.get(format, float)
+               for d in range(n_detectors):
+                  setattr(presets[d], attr, convert(values[d]))
       elif (tag == 'ENVIRONMENT:'):
          env = McaEnvironment()
-         p1 = string.find(value, '=')
+         p1 = value.find('=')
          env.name = value[0:p1]
-         p2 = string.find(value[p1+2:], '"')
+         p2 = value[p1+2:].find('"')
          env.value = value[p1+2: p1+2+p2]
          env.description = value[p1+2+p2+3:-1]
          environment.append(env)
+      elif (tag == 'DATA_TYPE:'):
+         data_type = value
+      elif (tag == 'DATA_OFFSET:'):
+         data_offset = int(value)
       elif (tag == 'DATA:'):
-         data = []
-         for d in range(n_detectors):
-            data.append(Numeric.zeros(nchans, 'i'))
-         for chan in range(nchans):
-            line = fp.readline()
-            counts = string.split(line)
-            for d in range(n_detectors):
-               data[d][chan]=int(counts[d])
+         data_found = 1
+         break
       else:
          for i in range(max_rois):
              roi = 'ROI_'+str(i)+'_'
@@ -1588,27 +2126,559 @@ def read_ascii_file(file):
                       rois[d][i].right = int(values[d])
                 break
              elif (tag == roi+'LABEL:'):
-                labels = string.split(value, '&')
+                labels = value.split('&')
                 for d in range(n_detectors):
                    if (i < nrois[d]):
-                      rois[d][i].label = string.strip(labels[d])
+                      rois[d][i].label = labels[d].strip()
                 break
          else:
             print(f'Unknown tag = {tag} in file: {file}.')
 
-   # Make sure DATA array is defined, else this was not a valid data file
-   if (data == None): print('Not a valid data file: {file}.')
-   fp.close()
    # Built dictionary to return
    r = {}
+   r['version'] = version
    r['n_detectors'] = n_detectors
+   r['nchans'] = nchans
    r['calibration'] = calibration
    r['elapsed'] = elapsed
    r['rois'] = rois
-   r['data'] = data
    r['environment'] = environment
+   if (presets is not None): r['presets'] = presets
+   if (data_type is not None): r['data_type'] = data_type
+   if (data_offset is not None): r['data_offset'] = data_offset
+   return [r, data_found]
+
+########################################################################
+def write_binary_file(file, data, calibration, elapsed, presets, rois,
+                      environment):
+   """
+   Writes Mca or Med data to a disk file in a binary format which can be
+   written and read much faster than the ASCII format.  Files written with
+   this routine can be read with read_binary_file(), which is called by
+   Mca.read_file() if the binary flag is set.
+
+   This procedure is typically not called directly, but is called
+   by Mca.write_file if the binary=1 keyword is used.
+
+   The file starts with the same tagged ASCII header as write_ascii_file(),
+   with VERSION: BINARY 1.0, and in addition contains the presets (PRESET_
+   tags), the type of the data (DATA_TYPE:, always <i4, i.e. little-endian
+   32-bit integers) and the offset of the data from the start of the file
+   in bytes (DATA_OFFSET:).  The header ends with the DATA: tag, and is
+   padded with blanks to a multiple of 4096 bytes.  The data follow as a
+   single [n_detectors, nchans] array, so they can be memory mapped.
+
+   The inputs are the same as for write_ascii_file().
+   """
+   [n_det, nchans, data, calibration, elapsed, presets, rois] = \
+         _detector_lists(data, calibration, elapsed, presets, rois)
+   data = Numeric.asarray(data).astype(_binary_type).reshape(n_det, nchans)
+
+   header = io.StringIO()
+   _write_header(header, 'BINARY 1.0', n_det, nchans, calibration, elapsed,
+                 rois, environment, presets=presets, exact=1)
+   header.write('DATA_TYPE:  ' + _binary_type + '\n')
+   header = header.getvalue()
+   # The header is padded with blanks at the end of the DATA: line so that
+   # the data start at a multiple of _binary_align bytes
+   offset_line = 'DATA_OFFSET: %10d\n'
+   length = len(header.encode()) + len(offset_line % 0) + len('DATA: \n')
+   data_offset = -(-length // _binary_align) * _binary_align
+   header = header + (offset_line % data_offset) + 'DATA: ' + \
+            ' '*(data_offset - length) + '\n'
+   fp = open(file, 'wb')
+   fp.write(header.encode())
+   data.tofile(fp)
+   fp.close()
+
+# Data type and alignment of the data in binary files
+_binary_type = '<i4'
+_binary_align = 4096
+
+########################################################################
+def read_binary_file(file, mmap=1):
+   """
+   Reads a disk file written with write_binary_file().
+
+   Inputs:
+      file:
+         The name of the disk file to read.
+
+   Keywords:
+      mmap:
+         By default the data are memory mapped (copy-on-write) rather than 
+         read, so only the parts of the file which are used are read from
+         disk.  Set this flag to 0 to read all of the data into memory.
+         
+   Outputs:
+      Returns a dictionary with the same entries as read_ascii_file(), plus
+      'presets': [McaPresets()].  'data' is a 2-D array 
+      [n_detectors, nchans].
+
+   Example:
+      m = read_binary_file('med.bin')
+      counts = m['data'][3]
+   """
+   fp = open(file, 'rb')
+   [r, data_found] = _read_header(fp, file)
+   fp.close()
+   if (not data_found) or (not r['version'].startswith('BINARY')):
+      raise ValueError(f'Not a valid binary data file: {file}.')
+   shape = (r['n_detectors'], r['nchans'])
+   if (mmap):
+      data = Numeric.memmap(file, dtype=r['data_type'], mode='c',
+                            offset=r['data_offset'], shape=shape)
+   else:
+      data = Numeric.fromfile(file, dtype=r['data_type'], 
+                              count=shape[0]*shape[1],
+                              offset=r['data_offset']).reshape(shape)
+   r['data'] = data
    return r
 
+########################################################################
+def write_netcdf_file(file, data, calibration, elapsed, presets, rois,
+                      environment, append=0):
+   """
+   Writes Mca or Med data to a self-describing, compressed HDF5 file
+   (netCDF-4 files are HDF5 files).  The file can hold many spectra, for
+   example the points of a scan, each written by a call with append=1.
+   Files written with this routine can be read with read_netcdf_file(), which
+   is called by Mca.read_file() if the netcdf flag is set, and parts of the
+   data can be read with read_netcdf_data().
+
+   This procedure is typically not called directly, but is called
+   by Mca.write_file if the netcdf=1 keyword is used.  It requires the h5py
+   module.
+
+   The file contains the following datasets, where n_points is the number
+   of spectra written to the file:
+      /data                    [n_points, n_detectors, nchans] counts, 
+                               chunked by spectrum and compressed
+      /start_time              [n_points]
+      /detectors               [n_points, n_detectors] with the fields
+                               real_time, live_time, the McaCalibration
+                               fields, and the McaPresets fields with the
+                               prefix "preset_"
+      /environment/value       [n_points, n_environment]
+      /environment/name, description
+                               [n_environment]
+      /rois/left, right, label [n_detectors, max_rois]
+      /rois/nrois              [n_detectors]
+   The ROIs and the environment names are those of the first spectrum in the
+   file.  The environment values of appended spectra are matched by name.
+
+   The inputs are the same as for write_ascii_file().
+
+   Keywords:
+      append:
+         Set this flag to add the data to the end of an existing file.  The
+         number of detectors and channels must be the same as in the file.
+         If the file does not exist it is created.
+
+   Example:
+      for point in range(npoints):
+         ... acquire data ...
+         med.write_file('scan.h5', netcdf=1, append=1)
+   """
+   if (h5py is None):
+      raise ImportError('write_netcdf_file() requires the h5py module')
+   if (append): mode = 'a'
+   else: mode = 'w'
+   fp = h5py.File(file, mode)
+   try:
+      _write_netcdf_point(fp, data, calibration, elapsed, presets, rois,
+                          environment)
+   finally:
+      fp.close()
+
+########################################################################
+def _write_netcdf_point(fp, data, calibration, elapsed, presets, rois,
+                        environment, npoints=0):
+   """
+   Private function.  Writes one spectrum to the end of the open
+   write_netcdf_file() file fp.  If the file is empty its datasets are
+   created, with space for npoints spectra.
+   """
+   [n_det, nchans, data, calibration, elapsed, presets, rois] = \
+         _detector_lists(data, calibration, elapsed, presets, rois)
+   data = Numeric.asarray(data).astype(_binary_type).reshape(1, n_det, nchans)
+
+   # The values for this spectrum of each dataset with a row per spectrum
+   values = Numeric.zeros((1, n_det), _netcdf_detector_type)
+   for (field, source, attr, dtype) in _netcdf_detector_fields:
+      objects = {'elapsed': elapsed, 'calibration': calibration,
+                 'presets': presets}[source]
+      values[field][0] = [getattr(o, attr) for o in objects]
+   point = {'data': data,
+            'start_time': [str(elapsed[0].start_time)],
+            'detectors': values}
+
+   if ('data' not in fp):
+      _create_netcdf_file(fp, point, rois, environment, npoints)
+   elif (fp['data'].shape[1:] != (n_det, nchans)):
+      raise ValueError(f'Data must have {fp["data"].shape[1]} detectors '
+                       f'and {fp["data"].shape[2]} channels in {fp.filename}')
+   names = list(fp['environment/name'].asstr()[...])
+   values = [''] * len(names)
+   for e in environment:
+      if (e.name in names): values[names.index(e.name)] = str(e.value)
+   point['environment/value'] = [values]
+   n_points = _netcdf_points(fp)
+   for key in point:
+      dataset = fp[key]
+      if (dataset.shape[0] <= n_points): dataset.resize(n_points+1, axis=0)
+      dataset[n_points] = point[key][0]
+   fp.attrs['n_points'] = n_points + 1
+
+########################################################################
+def _netcdf_points(fp):
+   """
+   Private function.  Returns the number of spectra written to the open
+   write_netcdf_file() file fp, which can be less than the size of its
+   datasets if space was allocated in advance.
+   """
+   if ('n_points' in fp.attrs): return int(fp.attrs['n_points'])
+   return fp['data'].shape[0]
+
+# The fields of the detectors dataset in write_netcdf_file() files.
+# (field, list of objects, attribute, type)
+_netcdf_detector_fields = [('real_time', 'elapsed', 'real_time', 'f8'),
+                           ('live_time', 'elapsed', 'live_time', 'f8')]
+for attr in ('offset', 'slope', 'quad', 'two_theta'):
+   _netcdf_detector_fields.append((attr, 'calibration', attr, 'f8'))
+_netcdf_detector_fields.append(('units', 'calibration', 'units', 'S16'))
+for (tag, attr, format) in _preset_tags:
+   if (format == '%d '): dtype = 'i4'
+   else: dtype = 'f8'
+   _netcdf_detector_fields.append(('preset_'+attr, 'presets', attr, dtype))
+_netcdf_detector_type = Numeric.dtype([(field, dtype) for 
+                        (field, source, attr, dtype) in _netcdf_detector_fields])
+
+########################################################################
+def _create_netcdf_file(fp, point, rois, environment, npoints=0):
+   """
+   Private function.  Creates the datasets of a new write_netcdf_file() file
+   from the values of its first spectrum, with space for npoints spectra.
+   """
+   text = h5py.string_dtype()
+   fp.attrs['format'] = 'Mca HDF5 1.0'
+   fp.attrs['n_points'] = 0
+   data = point['data']
+   fp.create_dataset('data', shape=(npoints,)+data.shape[1:], 
+                     maxshape=(None,)+data.shape[1:], dtype=data.dtype,
+                     chunks=(1, 1, data.shape[2]), compression='gzip',
+                     compression_opts=1, shuffle=True)
+   fp.create_dataset('start_time', shape=(npoints,), maxshape=(None,), 
+                     dtype=text)
+   fp.create_dataset('detectors', shape=(npoints, data.shape[1]), 
+                     maxshape=(None, data.shape[1]), 
+                     dtype=_netcdf_detector_type)
+   fp.create_dataset('environment/value', 
+                     shape=(npoints, len(environment)),
+                     maxshape=(None, len(environment)), dtype=text)
+   fp.create_dataset('environment/name', dtype=text,
+                     data=[str(e.name) for e in environment])
+   fp.create_dataset('environment/description', dtype=text,
+                     data=[str(e.description) for e in environment])
+   n_det = len(rois)
+   nrois = [len(roi) for roi in rois]
+   max_rois = max(nrois + [0])
+   left = Numeric.zeros((n_det, max_rois), int)
+   right = Numeric.zeros((n_det, max_rois), int)
+   label = Numeric.zeros((n_det, max_rois), object)
+   label[...] = ''
+   for d in range(n_det):
+      for i in range(nrois[d]):
+         left[d,i] = rois[d][i].left
+         right[d,i] = rois[d][i].right
+         label[d,i] = str(rois[d][i].label)
+   fp.create_dataset('rois/nrois', data=nrois)
+   fp.create_dataset('rois/left', data=left)
+   fp.create_dataset('rois/right', data=right)
+   fp.create_dataset('rois/label', data=label, dtype=text)
+
+########################################################################
+def read_netcdf_file(file, point=0):
+   """
+   Reads one spectrum from a file written with write_netcdf_file().
+   Requires the h5py module.
+
+   Inputs:
+      file:
+         The name of the disk file to read.
+
+   Keywords:
+      point:
+         The index of the spectrum to read, if the file contains more than
+         one.  The default is the first spectrum.  Negative values count 
+         from the end of the file.
+         
+   Outputs:
+      Returns a dictionary with the same entries as read_ascii_file(), plus
+      'presets': [McaPresets()] and 'n_points', the number of spectra in the
+      file.  'data' is a 2-D array [n_detectors, nchans].
+
+   Example:
+      m = read_netcdf_file('scan.h5', point=10)
+      counts = m['data'][3]
+   """
+   if (h5py is None):
+      raise ImportError('read_netcdf_file() requires the h5py module')
+   fp = h5py.File(file, 'r')
+   try:
+      r = _read_netcdf_point(fp, point)
+   finally:
+      fp.close()
+   return r
+
+########################################################################
+def _read_netcdf_point(fp, point):
+   """
+   Private function.  Returns the read_netcdf_file() dictionary for one
+   spectrum of the open write_netcdf_file() file fp.
+   """
+   n_points = _netcdf_points(fp)
+   if (point < 0): point = point + n_points
+   if (point < 0) or (point >= n_points):
+      raise IndexError(f'Point {point} is not in {fp.filename}')
+   n_detectors = fp['data'].shape[1]
+   r = {}
+   r['n_points'] = n_points
+   r['n_detectors'] = n_detectors
+   r['data'] = fp['data'][point]
+   start_time = fp['start_time'].asstr()[point]
+   values = fp['detectors'][point]
+   r['elapsed'] = []
+   r['calibration'] = []
+   r['presets'] = []
+   for d in range(n_detectors):
+      r['elapsed'].append(McaElapsed(start_time=start_time))
+      r['calibration'].append(McaCalibration())
+      r['presets'].append(McaPresets())
+   for (field, source, attr, dtype) in _netcdf_detector_fields:
+      for d in range(n_detectors):
+         value = values[field][d]
+         if (dtype[0] == 'S'): value = value.decode()
+         else: value = value.item()
+         setattr(r[source][d], attr, value)
+   nrois = fp['rois/nrois'][...]
+   left = fp['rois/left'][...]
+   right = fp['rois/right'][...]
+   label = fp['rois/label'].asstr()[...]
+   r['rois'] = []
+   for d in range(n_detectors):
+      r['rois'].append([])
+      for i in range(nrois[d]):
+         r['rois'][d].append(McaROI(left=int(left[d,i]), 
+                                    right=int(right[d,i]),
+                                    label=label[d,i]))
+   names = fp['environment/name'].asstr()[...]
+   descriptions = fp['environment/description'].asstr()[...]
+   values = fp['environment/value'].asstr()[point]
+   r['environment'] = []
+   for i in range(len(names)):
+      r['environment'].append(McaEnvironment(name=names[i], 
+                                             value=values[i],
+                                             description=descriptions[i]))
+   return r
+
+########################################################################
+def read_netcdf_data(file, points=slice(None), detectors=slice(None),
+                     channels=slice(None)):
+   """
+   Reads part of the data from a file written with write_netcdf_file().
+   Only the parts of the file which contain the requested data are read
+   from disk.  Requires the h5py module.
+
+   Inputs:
+      file:
+         The name of the disk file to read.
+
+   Keywords:
+      points:
+         The spectra to read.  An index, a slice, or a list of increasing
+         indices.  The default is all of the spectra.
+
+      detectors:
+         The detectors to read, in the same form as points.  The default is 
+         all of the detectors.
+
+      channels:
+         The channels to read, in the same form as points.  The default is 
+         all of the channels.
+
+   Outputs:
+      Returns a Numeric array of counts [points, detectors, channels].  
+      Dimensions selected with an index rather than a slice or list are
+      removed.
+
+   Example:
+      # The counts in channels 500 to 599 of detector 3 for every point
+      counts = read_netcdf_data('scan.h5', detectors=3, 
+                                channels=slice(500, 600))
+   """
+   reader = McaScanReader(file)
+   try:
+      data = reader[points, detectors, channels]
+   finally:
+      reader.close()
+   return data
+
+########################################################################
+class McaScanWriter:
+   """
+   Writes the spectra of a scan to one file in the format of
+   write_netcdf_file().  Unlike calling write_netcdf_file() with append=1 for
+   each spectrum, the file is only opened once, and space for the expected 
+   number of spectra is allocated when the first one is written.  The
+   elapsed, presets, calibration and environment of each spectrum are saved.
+   Requires the h5py module.
+
+   Fields:
+      .n_points     # The number of spectra written so far
+
+   Example:
+      writer = McaScanWriter('map.h5', npoints=10000)
+      for point in range(10000):
+         ... acquire med ...
+         writer.write(med)
+      writer.close()
+   """
+   def __init__(self, file, npoints=0):
+      """
+      Creates a new file, deleting any existing file with the same name.
+
+      Inputs:
+         file:
+            The name of the file to write.
+
+      Keywords:
+         npoints:
+            The expected number of spectra.  More spectra can be written, 
+            in which case the file is extended.
+      """
+      if (h5py is None):
+         raise ImportError('McaScanWriter requires the h5py module')
+      self.file = file
+      self.npoints = npoints
+      self.n_points = 0
+      self.fp = h5py.File(file, 'w')
+
+   def __len__(self):
+      return self.n_points
+
+   def write(self, mca):
+      """
+      Writes the current data of an Mca or Med object as the next spectrum
+      of the scan.  The file is flushed so that the spectrum can be read
+      if the program stops.
+      """
+      _write_netcdf_point(self.fp, mca.get_data(), mca.get_calibration(),
+                          mca.get_elapsed(), mca.get_presets(), 
+                          mca.get_rois(), mca.get_environment(),
+                          npoints=self.npoints)
+      self.n_points = self.n_points + 1
+      self.fp.flush()
+
+   def close(self):
+      """ Closes the file. """
+      if (self.fp is not None): self.fp.close()
+      self.fp = None
+
+########################################################################
+class McaScanReader:
+   """
+   Reads parts of a file written with McaScanWriter or write_netcdf_file()
+   without reading the whole file.  The file is kept open until close() is
+   called.  Indexing the reader with [points, detectors, channels] reads
+   only those counts from disk, e.g. reader[:, 3, 500:600].  Requires the
+   h5py module.
+
+   Fields:
+      .n_points     # The number of spectra in the file
+      .n_detectors  # The number of detectors
+      .nchans       # The number of channels
+
+   Example:
+      reader = McaScanReader('map.h5')
+      live_time = reader.get_detector_values('live_time')
+      counts = reader[:, :, 500:600].sum(axis=2) / live_time
+      reader.close()
+      med = Med.Med(file='map.h5', netcdf=1, point=100)
+   """
+   def __init__(self, file):
+      """
+      Opens the file.
+
+      Inputs:
+         file:
+            The name of the file to read.
+      """
+      if (h5py is None):
+         raise ImportError('McaScanReader requires the h5py module')
+      self.file = file
+      self.fp = h5py.File(file, 'r')
+      self.n_points = _netcdf_points(self.fp)
+      [n, self.n_detectors, self.nchans] = self.fp['data'].shape
+
+   def __len__(self):
+      return self.n_points
+
+   def __getitem__(self, index):
+      """
+      Reads counts from the file.  index can be an index, a slice or a
+      list of increasing indices for each of points, detectors and channels.
+      """
+      if (not isinstance(index, tuple)): index = (index,)
+      points = index[0]
+      if (isinstance(points, slice)):
+         points = slice(*points.indices(self.n_points))
+      elif (Numeric.ndim(points) == 0):
+         if (points < 0): points = points + self.n_points
+         if (points < 0) or (points >= self.n_points):
+            raise IndexError(f'Point {index[0]} is not in {self.file}')
+      elif (len(points) > 0) and (max(points) >= self.n_points):
+         raise IndexError(f'Points {points} are not all in {self.file}')
+      return self.fp['data'][(points,) + index[1:]]
+
+   def get_detector_values(self, field):
+      """
+      Returns one field of the elapsed, calibration or presets of every
+      detector for every spectrum as a Numeric array [n_points, n_detectors].
+
+      Inputs:
+         field:
+            The name of the field, e.g. 'real_time', 'live_time', 'offset', 
+            'slope' or 'preset_live_time'.
+      """
+      return self.fp['detectors'].fields(field)[0:self.n_points]
+
+   def get_environment(self, name):
+      """
+      Returns the value of an environment parameter for every spectrum as a
+      list of strings.
+
+      Inputs:
+         name:
+            The name of the environment parameter, e.g. '13IDC:m1.VAL'.
+      """
+      names = list(self.fp['environment/name'].asstr()[...])
+      values = self.fp['environment/value'].asstr()[0:self.n_points, 
+                                                    names.index(name)]
+      return list(values)
+
+   def get_point(self, point):
+      """
+      Returns one spectrum as a dictionary, in the form returned by
+      read_netcdf_file().
+      """
+      return _read_netcdf_point(self.fp, point)
+
+   def close(self):
+      """ Closes the file. """
+      if (self.fp is not None): self.fp.close()
+      self.fp = None
+
 ########################################################################
 def read_peaks(file):
    """
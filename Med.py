@@ -4,8 +4,35 @@ Support for Multi-Element Detectors (Med).
 Author:        Mark Rivers
 Created:       Sept. 18, 2002.  Based on earlier IDL code.
 Modifications:
+   Oct. 18, 2026
+      - Added fit_background(), which fits all of the detectors as one 2-D
+        array, optionally in a pool of processes.
+      - read_file() reads the binary format of Mca.write_binary_file().
+      - read_file() can read any spectrum of a multi-spectrum netCDF file.
+      - Added MappedMed, an Med whose Mca data are rows of one 2-D array,
+        memory mapped for binary files.
+      - Moved the total and align processing of get_data() to process_data().
+      - get_roi_counts() computes the ROIs of all of the detectors at once
+        with Mca.roi_counts().
+      - Added extract_rois(), which extracts the ROI counts of a series of
+        spectrum files, in parallel and with an optional cache, and
+        spectrum_files(), which lists the files of a series.
+      - set_rois() treated a single list of more than one McaROI as a list
+        of lists.
+      - get_data(align=1) aligns all of the detectors in one call with
+        spline.SplineMap, which is kept until the calibrations change.
+        get_data(total=1) summed over all detectors and channels rather than
+        over the detectors.
+      - Added rebin_data() and get_data(align=2), which rebins the spectra
+        onto the calibration of the first detector conserving counts.
 """
+import os
+import copy
+import pickle
+import multiprocessing
 import Mca
+import Xrf
+import CARSMath
 import numpy as Numeric
 """ try:
    import Numeric
@@ -26,7 +53,7 @@ class Med(Mca.Mca):
    epicsMed class.
    """
 
-   def __init__(self, n_detectors=16, file=None):
+   def __init__(self, n_detectors=16, file=None, **filekw):
       """
       Initialization code for creating a new Med object.
 
@@ -38,13 +65,16 @@ class Med(Mca.Mca):
             The name of a disk file to read into the Med after it is created.
             The number of detectors in the Med will be changed if the number of
             Mca objects in the disk file is different from the Med.
+            Any other keywords are passed to read_file().
       """
       Mca.Mca.__init__(self)  # Invoke base class initialization
       self.n_detectors = n_detectors
+      self.alignment = None  # (calibrations, spline.SplineMap) for align=1
+      self.rebinning = None  # Rebin matrices for align=2
       self.mcas = []
       for i in range(n_detectors):
          self.mcas.append(Mca.Mca())
-      if (file != None): self.read_file(file)
+      if (file != None): self.read_file(file, **filekw)
 
    #########################################################################
    def initial_calibration(self, energy):
@@ -79,6 +109,80 @@ class Med(Mca.Mca):
       for mca in self.mcas:
          mca.final_calibration(peaks)
 
+   #########################################################################
+   def fit_background(self, bottom_width=4., top_width=0., exponent=2,
+                      tangent=0, compress=4, processes=1):
+      """
+      Fits the background to the spectrum of every Mca in the Med.
+      The spectra are fitted together as a single 2-D array with
+      Mca.fit_background_array(), rather than calling Mca.fit_background()
+      on each Mca, and give identical results.
+      
+      Keywords:
+         bottom_width, top_width, exponent, tangent, compress:
+            See the documentation for Mca.fit_background().
+
+         processes:
+            The number of processes to fit the spectra in.  If this is
+            greater than 1 then the detectors are divided into this many
+            groups, which are fitted in parallel in a multiprocessing.Pool.
+            The default is 1, which fits in the calling process.
+
+      Outputs:
+         Returns a Med object whose Mca objects are identical to those of
+         the calling object, except that the data have been replaced by the
+         background fit.
+
+      Example:
+         med = Med(file='T0345.001')
+         bgd = med.fit_background(bottom_width=6, exponent=4, processes=4)
+      """
+      data = self.get_data().astype(int)
+      calibration = self.get_calibration()
+      slope = []
+      for cal in calibration:
+         slope.append(cal.slope)
+      slope = Numeric.asarray(slope, float)
+
+      # Compress scratch spectra
+      scratch = data
+      if (compress > 1):
+         scratch = CARSMath.compress_array(scratch, compress)
+         slope = slope * compress
+
+      keywords = {'bottom_width': bottom_width, 'top_width': top_width,
+                  'exponent': exponent, 'tangent': tangent}
+      processes = min(processes, self.n_detectors)
+      if (processes > 1):
+         groups = Numeric.array_split(Numeric.arange(self.n_detectors),
+                                      processes)
+         pool = multiprocessing.Pool(processes)
+         try:
+            results = []
+            for group in groups:
+               results.append(pool.apply_async(Mca.fit_background_array,
+                                 (scratch[group], slope[group]), keywords))
+            bckgnd = Numeric.concatenate([r.get() for r in results])
+         finally:
+            pool.close()
+            pool.join()
+      else:
+         bckgnd = Mca.fit_background_array(scratch, slope, **keywords)
+
+      bgd = Med(n_detectors=0)
+      bgd.name = self.name
+      bgd.n_detectors = self.n_detectors
+      bgd.set_environment(self.get_environment())
+      for i in range(self.n_detectors):
+         # Expand spectrum
+         b = bckgnd[i]
+         if (compress > 1): b = CARSMath.expand_array(b, compress)
+         mca = copy.copy(self.mcas[i])
+         mca.set_name(self.mcas[i].get_name())
+         mca.set_data(b.astype(int))
+         bgd.mcas.append(mca)
+      return bgd
+
    #########################################################################
    def get_energy(self):
       """
@@ -240,10 +344,29 @@ class Med(Mca.Mca):
       """
       total = []
       net = []
-      for mca in self.mcas:
-         t, n = mca.get_roi_counts(background_width)
-         total.append(t)
-         net.append(n)
+      nrois = [len(mca.rois) for mca in self.mcas]
+      nchans = [len(mca.data) for mca in self.mcas]
+      if ((self.n_detectors == 0) or (max(nrois) == 0) or
+          (min(nchans) != max(nchans))):
+         for mca in self.mcas:
+            t, n = mca.get_roi_counts(background_width)
+            total.append(t)
+            net.append(n)
+         return (total, net)
+      # Compute the ROIs of all of the detectors at once.  Detectors with fewer
+      # ROIs are padded with 1 channel ROIs at channel 0.
+      cumulative = Numeric.array([mca.get_cumulative_data()
+                                  for mca in self.mcas])
+      left = Numeric.zeros((self.n_detectors, max(nrois)), int)
+      right = Numeric.zeros((self.n_detectors, max(nrois)), int)
+      for i in range(self.n_detectors):
+         for j in range(nrois[i]):
+            left[i,j] = self.mcas[i].rois[j].left
+            right[i,j] = self.mcas[i].rois[j].right
+      t, n = Mca.roi_counts(cumulative, left, right, background_width)
+      for i in range(self.n_detectors):
+         total.append(t[i,0:nrois[i]].tolist())
+         net.append(n[i,0:nrois[i]].tolist())
       return (total, net)
 
    #########################################################################
@@ -259,9 +382,11 @@ class Med(Mca.Mca):
             If a single list is passed then this is written to each Mca.
             If a list of lists is passed then rois[i][*] is written to Mca[i].
       """
-      if (len(rois) <= 1):
+      if ((len(rois) == 0) or isinstance(rois[0], Mca.McaROI)):
+         # Mca.set_rois(energy=1) converts the ROIs to channels in place, so
+         # each Mca needs its own copy of them
          for mca in self.mcas:
-            mca.set_rois(rois, energy=energy)
+            mca.set_rois(copy.deepcopy(rois), energy=energy)
       else:
          for i in range(self.n_detectors):
             self.mcas[i].set_rois(rois[i], energy=energy)
@@ -329,6 +454,9 @@ class Med(Mca.Mca):
             "channel-by-channel" basis. This keyword can be used alone
             or together with the TOTAL keyword, in which case the data
             are aligned before summing.
+            If align=2 the spectra are rebinned with rebin_data() rather
+            than interpolated.  This conserves counts, and the result is a
+            float array.
             
       Outputs:
          By default this function returns a long 2-D array of counts dimensioned
@@ -341,22 +469,101 @@ class Med(Mca.Mca):
       data = Numeric.zeros((self.n_detectors, nchans))
       for i in range(self.n_detectors):
          data[i,:] = self.mcas[i].get_data()
-      if (align != 0):
-         ref_energy = self.mcas[0].get_energy()
-         for i in range(self.n_detectors):
-            energy = self.mcas[i].get_energy()
-            temp = spline.spline_interpolate(energy, data[i,:], ref_energy)
-            data[i,:] = (temp+.5).astype(Numeric.Int)
+      return self.process_data(data, total=total, align=align)
+
+   ########################################################################
+   def process_data(self, data, total=0, align=0):
+      """
+      Applies the total and align keywords of get_data() to a 2-D array of
+      counts dimensioned [self.n_detectors, nchans], stores the result in
+      self.data and returns it.  This is used by get_data() and by
+      subclasses which read the data of all of the Mcas at once.
+      """
+      if (align == 2):
+         data = self.rebin_data(data, total=total)
+         if (total != 0):
+            self.data = data
+            return data
+      elif (align != 0):
+         nchans = data.shape[1]
+         key = [nchans]
+         for mca in self.mcas:
+            cal = mca.calibration
+            key.append((cal.offset, cal.slope, cal.quad))
+         # The spline setup only depends on the calibrations, so it is kept
+         # until they change.  All of the detectors are aligned at once.
+         if ((self.alignment == None) or (self.alignment[0] != key)):
+            channels = Numeric.arange(nchans)
+            energy = []
+            for mca in self.mcas:
+               energy.append(mca.channel_to_energy(channels))
+            self.alignment = (key, spline.SplineMap(energy, energy[0]))
+         temp = self.alignment[1](data)
+         # This is a new array, data may be the data of the Mcas
+         data = (temp+.5).astype(int)
       if (total != 0):
-         d = Numeric.sum(data)
+         d = Numeric.sum(data, axis=0)
          self.data = d
          return d
       else:
          self.data = data
          return data
 
+   ########################################################################
+   def rebin_data(self, data, total=0):
+      """
+      Rebins a 2-D array of counts dimensioned [self.n_detectors, nchans] onto
+      the energy calibration of the first detector with Mca.rebin_matrix(),
+      conserving counts.  This is used by get_data(align=2).  The matrix of
+      each detector is kept until its calibration or the calibration of the
+      first detector changes.
+
+      Keywords:
+         total:
+            Set this keyword to return the sum of the rebinned spectra as a
+            1-D array, rather than a 2-D array of rebinned spectra.
+
+      Outputs:
+         A float array dimensioned [self.n_detectors, nchans], or [nchans]
+         if total is set.
+      """
+      n_det, nchans = data.shape
+      ref = self.mcas[0].calibration
+      ref_key = (ref.offset, ref.slope, ref.quad, nchans)
+      if ((self.rebinning == None) or (self.rebinning[0] != ref_key)):
+         self.rebinning = (ref_key, [None]*n_det, None)
+      matrices = self.rebinning[1]
+      changed = 0
+      for i in range(n_det):
+         cal = self.mcas[i].calibration
+         key = (cal.offset, cal.slope, cal.quad)
+         if ((matrices[i] == None) or (matrices[i][0] != key)):
+            matrices[i] = (key,) + Mca.rebin_matrix(cal, nchans, ref, nchans)
+            changed = 1
+      # The matrices of all of the detectors combined into one, which maps
+      # the flattened data to the flattened rebinned data
+      combined = self.rebinning[2]
+      if (changed or (combined == None)):
+         rows = []
+         columns = []
+         weights = []
+         for i in range(n_det):
+            rows.append(matrices[i][1] + i*nchans)
+            columns.append(matrices[i][2] + i*nchans)
+            weights.append(matrices[i][3])
+         rows = Numeric.concatenate(rows)
+         combined = (rows, Numeric.concatenate(columns),
+                     Numeric.concatenate(weights), rows % nchans)
+         self.rebinning = (ref_key, matrices, combined)
+      rows, columns, weights, channels = combined
+      counts = weights * Numeric.ravel(data)[columns]
+      if (total != 0):
+         return Numeric.bincount(channels, counts, minlength=nchans)
+      return Numeric.bincount(rows, counts,
+                              minlength=n_det*nchans).reshape(n_det, nchans)
+
    #########################################################################
-   def read_file(self, file, netcdf=0):
+   def read_file(self, file, netcdf=0, binary=0, point=0):
       """
       Reads a disk file into an Med object. The file contains the information
       from the Med object which it makes sense to store permanently, but does
@@ -365,11 +572,36 @@ class Med(Mca.Mca):
       Inputs:
          file:
             The name of the disk file to read.
+
+      Keywords:
+         netcdf:
+            Set this flag to read files written in netCDF format.
+
+         point:
+            Specifies which spectrum to read if a netCDF file contains more
+            than one.
+
+         binary:
+            Set this flag to read files written in binary format with
+            write_file(binary=1).  The data of each Mca is then a row of
+            one memory mapped array.
+      """
+      r = read_file_dict(file, netcdf=netcdf, binary=binary, point=point)
+      self.set_file_dict(file, r)
+
+   #########################################################################
+   def set_file_dict(self, file, r):
+      """
+      Sets the detectors of the Med from the dictionary returned by
+      Mca.read_ascii_file() and the other file reading functions.
+
+      Inputs:
+         file:
+            The name of the file, used to name the Med and its Mcas.
+
+         r:
+            The dictionary.
       """
-      if (netcdf != 0):
-         r = Mca.read_netcdf_file(file)
-      else:
-         r = Mca.read_ascii_file(file)
       self.name = file
       self.n_detectors = r['n_detectors']
       self.mcas = []
@@ -381,3 +613,246 @@ class Med(Mca.Mca):
       self.set_elapsed(r['elapsed'])
       self.set_calibration(r['calibration'])
       self.set_environment(r['environment'])
+      if ('presets' in r): self.set_presets(r['presets'])
+
+   
+#########################################################################
+class MappedMed(Med):
+   """
+   An Med whose data are stored in one 2-D array [n_detectors, nchans].
+   The data of each Mca is a row of this array rather than a copy, and
+   get_data() returns the array itself.  For files written with
+   write_file(binary=1) the array is memory mapped, so reading the file only
+   reads the header, and only the parts of the data which are used are
+   read from disk.
+   """
+   def __init__(self, file=None, **filekw):
+      """
+      Initialization code for creating a new MappedMed object.
+
+      Keywords:
+         file:
+            The name of a disk file to read into the Med after it is created.
+
+         Any other keywords are passed to read_file().
+      """
+      Med.__init__(self, n_detectors=0)
+      self.mapped = None
+      if (file != None): self.read_file(file, **filekw)
+
+   #########################################################################
+   def read_file(self, file, netcdf=0, binary=1, point=0):
+      """
+      Reads a disk file into the MappedMed.  The keywords are the same as 
+      for Med.read_file(), except that binary=1 is the default.
+      """
+      r = read_file_dict(file, netcdf=netcdf, binary=binary, point=point)
+      # This does not copy the data if they are already a 2-D array
+      self.mapped = Numeric.asarray(r['data'])
+      r['data'] = self.mapped
+      self.set_file_dict(file, r)
+
+   #########################################################################
+   def get_data(self, total=0, align=0):
+      """
+      Returns the data from each Mca in the MappedMed as a 2-D Numeric array.
+      Without the total or align keywords this is the array the Mca data are
+      stored in, not a copy, unless set_data() has been called for an Mca.
+      See Med.get_data() for the keywords.
+      """
+      if (total == 0) and (align == 0) and (self.mapped is not None):
+         for i in range(self.n_detectors):
+            if (self.mcas[i].data.base is not self.mapped): break
+         else:
+            self.data = self.mapped
+            return self.mapped
+      return Med.get_data(self, total=total, align=align)
+
+#########################################################################
+def read_file_dict(file, netcdf=0, binary=0, point=0):
+   """
+   Reads a disk file with Mca.read_netcdf_file(), Mca.read_binary_file() or
+   Mca.read_ascii_file(), according to the keywords, which are the same as
+   for Med.read_file().  Returns the dictionary the function returns.
+   """
+   if (netcdf != 0):
+      return Mca.read_netcdf_file(file, point=point)
+   elif (binary != 0):
+      return Mca.read_binary_file(file)
+   else:
+      return Mca.read_ascii_file(file)
+
+#########################################################################
+def spectrum_files(file, nfiles=None):
+   """
+   Returns a list of spectrum file names.
+
+   Inputs:
+      file:
+         A directory, in which case all of the files in it are returned in
+         sorted order, or the name of the first file of a numbered series,
+         in which case the names are generated with Xrf.increment_filename()
+         until a file does not exist, or a list of file names, which is
+         returned unchanged.
+
+   Keywords:
+      nfiles:
+         The maximum number of files to return.  The default is no limit.
+
+   Example:
+      files = spectrum_files('scan_1.001')
+   """
+   if (not isinstance(file, str)):
+      files = list(file)
+   elif (os.path.isdir(file)):
+      files = []
+      for name in sorted(os.listdir(file)):
+         name = os.path.join(file, name)
+         if (os.path.isfile(name)): files.append(name)
+   else:
+      files = []
+      while (os.path.exists(file)):
+         if ((nfiles != None) and (len(files) >= nfiles)): break
+         files.append(file)
+         next = Xrf.increment_filename(file)
+         if (next == file): break
+         file = next
+   if (nfiles != None): files = files[0:nfiles]
+   return files
+
+#########################################################################
+def _extract_file(file, rois, energy, background_width, filekw):
+   # Returns the total and net counts for one file as 2-D arrays
+   med = Med(n_detectors=0)
+   med.set_file_dict(file, read_file_dict(file, **filekw))
+   # Copy the ROIs, since set_rois() changes them when energy=1
+   if (rois != None): med.set_rois(copy.deepcopy(rois), energy=energy)
+   total, net = med.get_roi_counts(background_width)
+   nrois = max([len(t) for t in total] + [0])
+   t = Numeric.zeros((med.n_detectors, nrois)) + Numeric.nan
+   n = t.copy()
+   for i in range(med.n_detectors):
+      t[i,0:len(total[i])] = total[i]
+      n[i,0:len(net[i])] = net[i]
+   return (t, n)
+
+def _extract_file_args(args):
+   return _extract_file(*args)
+
+#########################################################################
+def extract_rois(file, nfiles=None, rois=None, energy=0, background_width=1,
+                 processes=1, cache=None, netcdf=0, binary=0, point=0):
+   """
+   Extracts the total and net counts in the ROIs from a series of spectrum
+   files, for example the files of a scan.
+
+   Inputs:
+      file:
+         A directory, the first file of a numbered series, or a list of
+         files.  See spectrum_files().
+
+   Keywords:
+      nfiles:
+         The maximum number of files to read.
+
+      rois:
+         A list of McaROI objects, or a list of such lists, which replace the
+         ROIs stored in the files.  See set_rois().  The default is to use
+         the ROIs in each file.
+
+      energy:
+         Set this flag if the rois are in units of energy.
+
+      background_width:
+         See Mca.get_roi_counts().
+
+      processes:
+         The number of processes to read the files in.  If this is greater
+         than 1 the files are read in a multiprocessing.Pool.  The default is
+         1, which reads them in the calling process.
+
+      cache:
+         The name of a file in which to keep the counts of each file.  Files
+         whose modification time and size have not changed since they were
+         last extracted with the same rois and background_width are not read
+         again.  The default is no cache.
+
+      netcdf, binary, point:
+         See read_file().
+
+   Outputs:
+      Returns a tuple (total, net) of arrays dimensioned
+      [n_files, n_detectors, n_rois].  If the files do not all have the same
+      number of detectors and ROIs the missing entries are NaN.
+
+   Example:
+      total, net = extract_rois('scan_1.001', processes=4, cache='scan_1.roi')
+      plot(net[:,0,3])   # ROI 3 of the first detector versus file number
+   """
+   files = spectrum_files(file, nfiles=nfiles)
+   if (cache != None):
+      # The cache file may be in the directory being read
+      skip = (os.path.abspath(cache), os.path.abspath(cache + '.tmp'))
+      files = [f for f in files if (os.path.abspath(f) not in skip)]
+   filekw = {'netcdf': netcdf, 'binary': binary, 'point': point}
+   if (rois == None):
+      key = None
+   else:
+      key = []
+      for roi in rois:
+         if (isinstance(roi, Mca.McaROI)): key.append((roi.left, roi.right))
+         else: key.append(tuple([(r.left, r.right) for r in roi]))
+      key = tuple(key)
+   key = (key, energy, background_width, netcdf, binary, point)
+
+   cached = {}
+   if ((cache != None) and os.path.exists(cache)):
+      try:
+         fp = open(cache, 'rb')
+         cached = pickle.load(fp)
+         fp.close()
+      except:
+         cached = {}
+   results = [None] * len(files)
+   stamps = [None] * len(files)
+   todo = []
+   for i in range(len(files)):
+      name = os.path.abspath(files[i])
+      st = os.stat(name)
+      stamps[i] = (name, st.st_mtime, st.st_size, key)
+      entry = cached.get(name)
+      if ((entry != None) and (entry[0] == stamps[i])):
+         results[i] = entry[1]
+      else:
+         todo.append(i)
+
+   args = [(files[i], rois, energy, background_width, filekw) for i in todo]
+   if ((processes > 1) and (len(todo) > 1)):
+      pool = multiprocessing.Pool(min(processes, len(todo)))
+      try:
+         counts = pool.imap(_extract_file_args, args,
+                            chunksize=max(1, len(todo)//(4*processes)))
+         for i, c in zip(todo, counts): results[i] = c
+      finally:
+         pool.close()
+         pool.join()
+   else:
+      for i, a in zip(todo, args): results[i] = _extract_file(*a)
+
+   if ((cache != None) and (len(todo) > 0)):
+      for i in todo: cached[stamps[i][0]] = (stamps[i], results[i])
+      temp = cache + '.tmp'
+      fp = open(temp, 'wb')
+      pickle.dump(cached, fp, pickle.HIGHEST_PROTOCOL)
+      fp.close()
+      os.replace(temp, cache)
+
+   n_det = max([r[0].shape[0] for r in results] + [0])
+   nrois = max([r[0].shape[1] for r in results] + [0])
+   total = Numeric.zeros((len(files), n_det, nrois)) + Numeric.nan
+   net = total.copy()
+   for i in range(len(files)):
+      t, n = results[i]
+      total[i,0:t.shape[0],0:t.shape[1]] = t
+      net[i,0:n.shape[0],0:n.shape[1]] = n
+   return (total, net)
@@ -9,148 +9,212 @@
 # Instead of wrapping each caPython call, wrap the most generic calls.
 # Implement more specific calls in Python as needed.
 #
+# 10/18/26 - Ported to Python 3.  CaChannelException is now an exception
+# class.  getw() accepts a count, as epicsPV.getw() expects.  The ca
+# module can be replaced by mock_ca for testing without an IOC.
+#
+# 10/18/26 - Arrays can be returned as numpy arrays, if numpy is installed
+# and the ca module has captrbuffer() and set_array_buffers().  The data are
+# copied from the C buffer in one operation, rather than one Python object
+# per element.  This is off by default; call use_numpy_arrays() to turn it
+# on.  Then getw(), array_get() and array callbacks return numpy arrays
+# rather than lists, with the dtype of the C type: DBR_CHAR is int16 from
+# getw() and int8 in callbacks, which are signed as the lists were.
+# DBR_ENUM is int16 from both, as the lists were.
+#
+# 10/18/26 - Removed the debugging prints from __build_array().
+#
 
 # Get the wrapped raw channel access calls
 import ca
 import time
-
-# Exception string.  CaChannelException is thrown on errors along
-# with an extra parameter, the CA status of the offending action.
-CaChannelException = "CaChannelException"
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# numpy dtypes of the C data of each DBR type, in callbacks
+callback_dtypes = {ca.DBR_CHAR: 'int8',
+                   ca.DBR_SHORT: 'int16',
+                   ca.DBR_ENUM: 'int16',
+                   ca.DBR_LONG: 'int32',
+                   ca.DBR_FLOAT: 'float32',
+                   ca.DBR_DOUBLE: 'float64'}
+
+numpy_arrays = 0
+
+# Turns the conversion of arrays to numpy arrays on or off.  It is off
+# until this is called.  Returns 1 if the conversion is on, which requires
+# numpy and a ca module with captrbuffer() and set_array_buffers().
+def use_numpy_arrays(flag=1):
+    global numpy_arrays
+    numpy_arrays = flag and (numpy != None) and \
+                   hasattr(ca, 'captrbuffer') and hasattr(ca, 'set_array_buffers')
+    if hasattr(ca, 'set_array_buffers'):
+        ca.set_array_buffers(int(numpy_arrays))
+    return numpy_arrays
+
+# The callback of array_get_callback() and add_masked_array_event().  It
+# converts array values received as a bytearray to a numpy array, and calls
+# the user's callback.
+def arrayCallback(epicsArgs, userArgs):
+    value = epicsArgs.get('pv_value')
+    if isinstance(value, bytearray):
+        epicsArgs['pv_value'] = numpy.frombuffer(value,
+                                        callback_dtypes[epicsArgs['type']])
+    callback, user_args = userArgs
+    callback(epicsArgs, user_args)
+
+# CaChannelException is thrown on errors, with the CA status of the
+# offending action as its argument.
+class CaChannelException(Exception):
+    pass
 
 class CaChannel:
 # class timeout
-    ca_timeout = 1.0	# in seconds
+    ca_timeout = 1.0    # in seconds
 
 # Conversion dictionary.  A class variable. 
     dbr_d = {}
 
 # Initialize conversion dictionary.  This is done once on import.
-#	'c_type' = used with SWIG pointer library to allocate C space
-#	'convert' = used to convert Python values to match the DBR_XXXX type
+#       'c_type' = used with SWIG pointer library to allocate C space
+#       'convert' = used to convert Python values to match the DBR_XXXX type
+#       'dtype' = the numpy dtype of the C type, for arrays
 # Use the C type in the SWIG pointer library:
-#	CaChannel.dbr_d[dbrType]['c_type']
+#       CaChannel.dbr_d[dbrType]['c_type']
 # Use the converter to convert Python types
-#	newValue = CaChannel.dbr_d[dbrType]['convert'](value)
+#       newValue = CaChannel.dbr_d[dbrType]['convert'](value)
     dbr_d[ca.DBR_SHORT] = \
-		{'c_type' : "short",	# dbr_short_t
-		 'convert' : int}
+                {'c_type' : "short",    # dbr_short_t
+                 'convert' : int,
+                 'dtype' : 'int16'}
     dbr_d[ca.DBR_INT] = \
-		{'c_type' : "short",		# dbr_int_t = dbr_short_t
-		 'convert' : int}
+                {'c_type' : "short",            # dbr_int_t = dbr_short_t
+                 'convert' : int,
+                 'dtype' : 'int16'}
     dbr_d[ca.DBR_LONG] = \
-		{'c_type' : "int",		# dbr_long_t
-		 'convert' : int}
+                {'c_type' : "int",              # dbr_long_t
+                 'convert' : int,
+                 'dtype' : 'int32'}
     dbr_d[ca.DBR_FLOAT] = \
-		{'c_type': "float",		# dbr_float_t
-		 'convert' : float}
+                {'c_type': "float",             # dbr_float_t
+                 'convert' : float,
+                 'dtype' : 'float32'}
     dbr_d[ca.DBR_DOUBLE] = \
-		{'c_type': "double",		# dbr_double_t
-		 'convert' : float}
+                {'c_type': "double",            # dbr_double_t
+                 'convert' : float,
+                 'dtype' : 'float64'}
     dbr_d[ca.DBR_CHAR] = \
-		{'c_type': "short",             # treat as an 8-bit field
-		 'convert' : int}
+                {'c_type': "short",             # treat as an 8-bit field
+                 'convert' : int,
+                 'dtype' : 'int16'}
     dbr_d[ca.DBR_STRING] = \
-		{'c_type': "char",
-		 'convert' : str}
+                {'c_type': "char",
+                 'convert' : str}
     dbr_d[ca.DBR_ENUM] = \
-		{'c_type': "short",
-		 'convert' : int}
+                {'c_type': "short",
+                 'convert' : int,
+                 'dtype' : 'int16'}
     def __init__(self):
-	# Un-initialized channel id structure
-	self.__chid = ca.new_chid()
-	# Monitor event id
-	self.__evid = None
-	self.__timeout = None  # override g (class timeout)
-	
+        # Un-initialized channel id structure
+        self.__chid = ca.new_chid()
+        # Monitor event id
+        self.__evid = None
+        self.__timeout = None  # override g (class timeout)
+        
     def __del__(self):
-	# Clear the channel
-	if (ca.state(self.__chid) == ca.cs_conn):
-	    ca.clear_channel(self.__chid)
-	    self.pend_io()
-	# Release event id structure
-	if (None != self.__evid):
-	    ca.free_evid(self.__evid)
-	ca.free_chid(self.__chid)
+        # Clear the channel
+        if (ca.state(self.__chid) == ca.cs_conn):
+            ca.clear_channel(self.__chid)
+            self.pend_io()
+        # Release event id structure
+        if (None != self.__evid):
+            ca.free_evid(self.__evid)
+        ca.free_chid(self.__chid)
 
     def version(self):
-        print "CaChannel, version v00-02-02"
+        print("CaChannel, version v00-02-02")
 #
 # Class helper methods
 #
     # Set the default timeout value.
     # Used by default if no timeout is specified where needed.
     def setTimeout(self, timeout):
-	if ((timeout >= 0) or (timeout == None)):
-	    self.__timeout = timeout
-	else:
-	    raise ValueError
+        if ((timeout >= 0) or (timeout == None)):
+            self.__timeout = timeout
+        else:
+            raise ValueError
 
     # Retrieve the default timeout value
     def getTimeout(self):
-	return self.__timeout
+        return self.__timeout
 
     # Build and initialize a C array using the SWIG pointer library.
     # The Array length is keyed on the number of items in vals.
     # If EPICS array is longer than len(vals) the values at the
     # end will not be overwritten.
     def __build_array(self, vals, req_type):
-	nitems = len(vals)
-        print 'nitems =', nitems
-	pvals = ca.ptrcreate(CaChannel.dbr_d[req_type]['c_type'], 0, nitems)
-	i = 0
-	for item in vals:
-	    ca.ptrset(pvals, CaChannel.dbr_d[req_type]['convert'](item), i)
-	    i = i + 1
-        print 'i=', i
-	return pvals
-	
+        nitems = len(vals)
+        pvals = ca.ptrcreate(CaChannel.dbr_d[req_type]['c_type'], 0, nitems)
+        i = 0
+        for item in vals:
+            ca.ptrset(pvals, CaChannel.dbr_d[req_type]['convert'](item), i)
+            i = i + 1
+        return pvals
+        
     # Build and initialize a Python list from a SWIG pointer to a C array.
-    def __build_list(self, pvals, nitems):
+    # If numpy_arrays is set a numpy array is returned, copied from the C
+    # array in one operation.
+    def __build_list(self, pvals, nitems, req_type):
+        if (numpy_arrays and ('dtype' in CaChannel.dbr_d[req_type])):
+            dtype = numpy.dtype(CaChannel.dbr_d[req_type]['dtype'])
+            return numpy.frombuffer(ca.captrbuffer(pvals, nitems*dtype.itemsize),
+                                    dtype)
         l = []
-	for i in range(0, nitems):
-	    l.append(ca.ptrvalue(pvals, i))
-	return l
+        for i in range(0, nitems):
+            l.append(ca.ptrvalue(pvals, i))
+        return l
 
     # Use the swig pointer library to allocate and initialize
     # C variables to hold the value to be written.
     def __setup_put(self, value, req_type):
-	if(ca.DBR_STRING == req_type):
-	    count = 1
-	    length = len(str(value)) + 1  # space for string terminator
- 	    pval = ca.captrcreate(CaChannel.dbr_d[req_type]['c_type'],
-				CaChannel.dbr_d[req_type]['convert'](value),
-				length)
-#	elif(ca.DBR_CHAR == req_type):
-#	    count = 1
-# 	    pval = ca.ptrcreate(CaChannel.dbr_d[req_type]['c_type'],
-#				CaChannel.dbr_d[req_type]['convert'](value),
-#				1)
-	else:
-	    count = self.element_count()
-	    if (1 == count):
-		pval = ca.ptrcreate(CaChannel.dbr_d[req_type]['c_type'],
-				    CaChannel.dbr_d[req_type]['convert'](value),
-				    count)
-	    else:
-	        count = len(value)
-		pval = self.__build_array(value, req_type)
-	return count, pval
+        if(ca.DBR_STRING == req_type):
+            count = 1
+            length = len(str(value)) + 1  # space for string terminator
+            pval = ca.captrcreate(CaChannel.dbr_d[req_type]['c_type'],
+                                CaChannel.dbr_d[req_type]['convert'](value),
+                                length)
+#       elif(ca.DBR_CHAR == req_type):
+#           count = 1
+#           pval = ca.ptrcreate(CaChannel.dbr_d[req_type]['c_type'],
+#                               CaChannel.dbr_d[req_type]['convert'](value),
+#                               1)
+        else:
+            count = self.element_count()
+            if (1 == count):
+                pval = ca.ptrcreate(CaChannel.dbr_d[req_type]['c_type'],
+                                    CaChannel.dbr_d[req_type]['convert'](value),
+                                    count)
+            else:
+                count = len(value)
+                pval = self.__build_array(value, req_type)
+        return count, pval
 
     # Use the swig pointer library to allocate C variables
     # to hold the data read.
     def __setup_get(self, req_type):
-	if(ca.DBR_STRING == req_type):
-	    count = 1	# each string is one element, never an array of strings
-	    pval = ca.ptrcreate(CaChannel.dbr_d[req_type]['c_type'], ' ', 1024)
-#	elif(ca.DBR_CHAR == req_type):
-#	    count = 1
-#	    pval = ca.ptrcreate('int', 0, 1)
-#	    pval = ca.ptrcreate('char', ' ', 2)
-	else:
-	    count = self.element_count()
-	    pval = ca.ptrcreate(CaChannel.dbr_d[req_type]['c_type'], 0, count)
-	return count, pval
+        if(ca.DBR_STRING == req_type):
+            count = 1   # each string is one element, never an array of strings
+            pval = ca.ptrcreate(CaChannel.dbr_d[req_type]['c_type'], ' ', 1024)
+#       elif(ca.DBR_CHAR == req_type):
+#           count = 1
+#           pval = ca.ptrcreate('int', 0, 1)
+#           pval = ca.ptrcreate('char', ' ', 2)
+        else:
+            count = self.element_count()
+            pval = ca.ptrcreate(CaChannel.dbr_d[req_type]['c_type'], 0, count)
+        return count, pval
 
 
 #
@@ -159,78 +223,80 @@ class CaChannel:
 
 #
 # Connection methods
-#	search_and_connect
-#	search
-#	clear_channel
+#       search_and_connect
+#       search
+#       clear_channel
 #
 
     def search_and_connect(self, pvName, callback, *user_args):
         args = (callback, user_args)   # user_args is a tuple
-    	status = ca.search_and_connect(pvName, self.__chid, 0, args)
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
+        status = ca.search_and_connect(pvName, self.__chid, 0, args)
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
 
     def search(self, pvName):
-    	status = ca.search(pvName, self.__chid)
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
+        status = ca.search(pvName, self.__chid)
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
 
     def clear_channel(self):
-	status = ca.clear_channel(self.__chid)
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
+        status = ca.clear_channel(self.__chid)
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
 
 #
 # Write methods
-#	array_put
-#	array_put_callback
+#       array_put
+#       array_put_callback
 #
 
     def array_put(self, value, req_type=None, count=None):
-	if(None == req_type):
-	    req_type = self.field_type()
-	if(None == count):
-	    count, pval = self.__setup_put(value, req_type) # determine count
-	else:
-	    dummy, pval = self.__setup_put(value, req_type) # user count
-	status = ca.array_put(req_type, count, self.__chid, pval)
-	ca.ptrfree(pval)
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
+        if(None == req_type):
+            req_type = self.field_type()
+        if(None == count):
+            count, pval = self.__setup_put(value, req_type) # determine count
+        else:
+            dummy, pval = self.__setup_put(value, req_type) # user count
+        status = ca.array_put(req_type, count, self.__chid, pval)
+        ca.ptrfree(pval)
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
 
     def array_put_callback(self, value, req_type, count, callback, *user_args):
-	if(None == req_type):
-	    req_type = self.field_type()
-	if(None == count):
-	    count, pval = self.__setup_put(value, req_type) # determine count
-	else:
-	    dummy, pval = self.__setup_put(value, req_type) # user count
+        if(None == req_type):
+            req_type = self.field_type()
+        if(None == count):
+            count, pval = self.__setup_put(value, req_type) # determine count
+        else:
+            dummy, pval = self.__setup_put(value, req_type) # user count
         args = (callback, user_args)
-	status = ca.array_put_callback(req_type, count, self.__chid, pval, 0, args)
-	ca.ptrfree(pval)
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
+        status = ca.array_put_callback(req_type, count, self.__chid, pval, 0, args)
+        ca.ptrfree(pval)
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
 
 #
 # Read methods
-#	getValue
-#	array_get
-#	array_get_callback
+#       getValue
+#       array_get
+#       array_get_callback
 #
 
     # Obtain read value after ECA_NORMAL is returned on an array_get().
     def getValue(self):
-	try:
-	    if(1 == self.getCount):
-		retVal = ca.ptrvalue(self.getVal)
-	    else:
-		retVal = self.__build_list(self.getVal, self.getCount)
-	    ca.ptrfree(self.getVal)
-	    del self.getVal
-	    del self.getCount
-	    return retVal
-	except NameError:
-	    return None	
+        try:
+            if(1 == self.getCount):
+                retVal = ca.ptrvalue(self.getVal)
+            else:
+                retVal = self.__build_list(self.getVal, self.getCount,
+                                           self.getType)
+            ca.ptrfree(self.getVal)
+            del self.getVal
+            del self.getCount
+            del self.getType
+            return retVal
+        except AttributeError:
+            return None 
 
     # Value(s) read are placed in C variables and should not be accessed until
     # ECA_NORMAL is recived from pend_event().  Once this occurs use getValue()
@@ -238,108 +304,109 @@ class CaChannel:
     # SWIG pointers to the C variables are created here and used to retrieve
     # the value(s) in getValue().
     def array_get(self, req_type=None, count=None):
-	if(None == req_type):
-	    req_type = self.field_type()
-	if(None == count):
-	    self.getCount, self.getVal = self.__setup_get(req_type) # determine count
-	else:
-	    dummy, self.getVal = self.__setup_get(value, req_type) # user count
-	    self.getCount = count
-	status = ca.array_get(req_type, self.getCount, self.__chid, self.getVal)
-	if (ca.ECA_NORMAL != status):
-	    ca.ptrfree(self.getVal)
-	    raise CaChannelException, status
+        if(None == req_type):
+            req_type = self.field_type()
+        if(None == count):
+            self.getCount, self.getVal = self.__setup_get(req_type) # determine count
+        else:
+            dummy, self.getVal = self.__setup_get(req_type) # user count
+            self.getCount = count
+        self.getType = req_type
+        status = ca.array_get(req_type, self.getCount, self.__chid, self.getVal)
+        if (ca.ECA_NORMAL != status):
+            ca.ptrfree(self.getVal)
+            raise CaChannelException(status)
 
     def array_get_callback(self, req_type, count, callback, *user_args):
-	if(None == req_type):
-	    req_type = self.field_type()
-	if(None == count):
-	    count = self.element_count()
-        args = (callback, user_args)
-	status = ca.array_get_callback(req_type, count, self.__chid, 0, args)
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
+        if(None == req_type):
+            req_type = self.field_type()
+        if(None == count):
+            count = self.element_count()
+        args = (arrayCallback, (callback, user_args))
+        status = ca.array_get_callback(req_type, count, self.__chid, 0, args)
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
 
 #
 # Event methods
-#	add_masked_array_event
-#	clear_event
+#       add_masked_array_event
+#       clear_event
 #
 
     # Creates a new event id and stores it on self.__evid.  Only one event registered
     # per CaChannel object.  If an event is already registered the event is cleared
     # before registering a new event.
     def add_masked_array_event(self, req_type, count, mask, callback, *user_args):
-	if(None == req_type):
-	    req_type = self.field_type()
-	if(None == count):
-	    count = self.element_count()
-	if(None != self.__evid):
-	    self.clear_event()
-	    self.pend_io()
- 	self.__evid = ca.new_evid()
-        self.__args = (callback, user_args)
-	status = ca.add_masked_array_event(req_type, count, self.__chid,
-				0, self.__args, 0,0,0, self.__evid, mask)
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
+        if(None == req_type):
+            req_type = self.field_type()
+        if(None == count):
+            count = self.element_count()
+        if(None != self.__evid):
+            self.clear_event()
+            self.pend_io()
+        self.__evid = ca.new_evid()
+        self.__args = (arrayCallback, (callback, user_args))
+        status = ca.add_masked_array_event(req_type, count, self.__chid,
+                                0, self.__args, 0,0,0, self.__evid, mask)
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
 
     def clear_event(self):
-	status = ca.clear_event(self.__evid)
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
-	ca.del_evid(self.__evid)
-	self.__evid = None
+        status = ca.clear_event(self.__evid)
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
+        ca.del_evid(self.__evid)
+        self.__evid = None
 
 #
 # Execute methods
-#	pend_io
-#	test_io
-#	pend_event
-#	poll
-#	flush_io
+#       pend_io
+#       test_io
+#       pend_event
+#       poll
+#       flush_io
 #
 
     def pend_io(self, timeout=None):
-	if timeout is None:
-	    if self.__timeout is None:
-		timeout = CaChannel.ca_timeout
-	    else:
-		timeout = self.__timeout
-	status = ca.pend_io(timeout)
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
+        if timeout is None:
+            if self.__timeout is None:
+                timeout = CaChannel.ca_timeout
+            else:
+                timeout = self.__timeout
+        status = ca.pend_io(timeout)
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
 
 
     def pend_event(self, timeout=None):
-	if timeout is None:
-	    timeout = 0.1
-	status = ca.pend_event(timeout)
-	return status
+        if timeout is None:
+            timeout = 0.1
+        status = ca.pend_event(timeout)
+        return status
 
     def poll(self):
-	status = ca.poll()
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
+        status = ca.poll()
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
 
     def flush_io(self):
-	status = ca.flush_io()
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
+        status = ca.flush_io()
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
 
 #
 # Channel Access Macros
 # Only macros that require the channel id as an argument.
-#	field_type
-#	element_count
-#	name
-#	state
-#	host_name
-#	read_access
-#	write_access
+#       field_type
+#       element_count
+#       name
+#       state
+#       host_name
+#       read_access
+#       write_access
 #
     def field_type(self):
-	return ca.field_type(self.__chid)
+        return ca.field_type(self.__chid)
 
     def element_count(self):
         return ca.element_count(self.__chid)
@@ -348,16 +415,16 @@ class CaChannel:
         return ca.name(self.__chid)
 
     def state(self):
-	return ca.state(self.__chid)
+        return ca.state(self.__chid)
 
     def host_name(self):
-	return ca.host_name(self.__chid)
+        return ca.host_name(self.__chid)
 
     def read_access(self):
-	return ca.read_access(self.__chid)
+        return ca.read_access(self.__chid)
 
     def write_access(self):
-	return ca.write_access(self.__chid)
+        return ca.write_access(self.__chid)
 
 #
 # Wait functions
@@ -365,60 +432,63 @@ class CaChannel:
 # These functions wait for completion of the requested action.
 #
     def searchw(self, pvName):
-    	status = ca.search(pvName, self.__chid)
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
-	if self.__timeout is None:
-	    timeout = CaChannel.ca_timeout
-	else:
-	    timeout = self.__timeout
-	status = ca.pend_io(timeout)
-	if (ca.ECA_NORMAL != status):
-	    raise CaChannelException, status
+        status = ca.search(pvName, self.__chid)
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
+        if self.__timeout is None:
+            timeout = CaChannel.ca_timeout
+        else:
+            timeout = self.__timeout
+        status = ca.pend_io(timeout)
+        if (ca.ECA_NORMAL != status):
+            raise CaChannelException(status)
 
     def putw(self, value, req_type=None):
-	if(None == req_type):
-	    req_type = self.field_type()
-	# strings - null terminated array of char
-	# chars - null terminated char
-	# values - one of a type or an array of types
+        if(None == req_type):
+            req_type = self.field_type()
+        # strings - null terminated array of char
+        # chars - null terminated char
+        # values - one of a type or an array of types
         count, pval = self.__setup_put(value, req_type)
-	status = ca.array_put(req_type, count, self.__chid, pval)
-	if (ca.ECA_NORMAL != status):
-	    ca.ptrfree(pval)
-	    raise CaChannelException, status
-	if self.__timeout is None:
-	    timeout = CaChannel.ca_timeout
-	else:
-	    timeout = self.__timeout
-	status = ca.pend_io(timeout)
-	if (ca.ECA_NORMAL != status):
-	    ca.ptrfree(pval)
-	    raise CaChannelException, status
-	ca.ptrfree(pval)
-
-    def getw(self, req_type=None):
-	if(None == req_type):
-	    req_type = ca.field_type(self.__chid)
-	count, pval = self.__setup_get(req_type)
-	status = ca.array_get(req_type, count, self.__chid, pval)
-	if (ca.ECA_NORMAL != status):
-	    ca.ptrfree(pval)
-	    raise CaChannelException, status
-	if self.__timeout is None:
-	    timeout = CaChannel.ca_timeout
-	else:
-	    timeout = self.__timeout
-	status = ca.pend_io(timeout)
-	if (ca.ECA_NORMAL != status):
-	    ca.ptrfree(pval)
-	    raise CaChannelException, status
-	if(1 == count):
-	    value = ca.ptrvalue(pval)
-	else:
-	    value = self.__build_list(pval, count)
-	ca.ptrfree(pval)
-	return value
+        status = ca.array_put(req_type, count, self.__chid, pval)
+        if (ca.ECA_NORMAL != status):
+            ca.ptrfree(pval)
+            raise CaChannelException(status)
+        if self.__timeout is None:
+            timeout = CaChannel.ca_timeout
+        else:
+            timeout = self.__timeout
+        status = ca.pend_io(timeout)
+        if (ca.ECA_NORMAL != status):
+            ca.ptrfree(pval)
+            raise CaChannelException(status)
+        ca.ptrfree(pval)
+
+    def getw(self, req_type=None, count=None):
+        if(None == req_type):
+            req_type = ca.field_type(self.__chid)
+        if(None == count):
+            count, pval = self.__setup_get(req_type) # determine count
+        else:
+            dummy, pval = self.__setup_get(req_type) # user count
+        status = ca.array_get(req_type, count, self.__chid, pval)
+        if (ca.ECA_NORMAL != status):
+            ca.ptrfree(pval)
+            raise CaChannelException(status)
+        if self.__timeout is None:
+            timeout = CaChannel.ca_timeout
+        else:
+            timeout = self.__timeout
+        status = ca.pend_io(timeout)
+        if (ca.ECA_NORMAL != status):
+            ca.ptrfree(pval)
+            raise CaChannelException(status)
+        if(1 == count):
+            value = ca.ptrvalue(pval)
+        else:
+            value = self.__build_list(pval, count, req_type)
+        ca.ptrfree(pval)
+        return value
 
 
 
@@ -0,0 +1,527 @@
+#
+# filename: mock_ca.py
+# created : 10/18/26
+#
+# A stand-in for the SWIG wrapped ca module used by CaChannel, with a
+# simulated IOC in the same process.  It is used to test and benchmark
+# CaChannel, epicsPV, epicsMca and epicsMed without EPICS or hardware.
+#
+# Usage:
+#     import sys
+#     from caChannel import mock_ca
+#     sys.modules['ca'] = mock_ca    # Before CaChannel is imported
+#     mock_ca.latency = .001         # Network round trip time in seconds
+#     mock_ca.add_mca('13IDC:mca1')  # Simulated mca record
+#     import epicsMca
+#     mca = epicsMca.epicsMca('13IDC:mca1')
+#
+# Only the calls used by CaChannel are implemented.  As with the real ca
+# module, requests are queued and sent in one round trip by pend_io(),
+# pend_event() or poll(), and callbacks (monitors, array_get_callback() and
+# array_put_callback()) are only called from pend_event() and poll().
+# Every round trip sleeps for "latency" seconds and is counted in
+# stats['round_trips'].
+#
+
+import threading
+import time
+import numpy
+
+# Status codes
+ECA_NORMAL = 1
+ECA_TIMEOUT = 80
+
+# Channel states
+cs_never_conn = 0
+cs_prev_conn = 1
+cs_conn = 2
+cs_closed = 3
+
+# Database request types
+DBR_STRING = 0
+DBR_INT = 1
+DBR_SHORT = 1
+DBR_FLOAT = 2
+DBR_ENUM = 3
+DBR_CHAR = 4
+DBR_LONG = 5
+DBR_DOUBLE = 6
+DBR_CTRL_STRING = 28
+
+# Event masks
+DBE_VALUE = 1
+DBE_LOG = 2
+DBE_ALARM = 4
+
+# numpy dtypes of the C types of ptrcreate(), and of the DBR types
+_c_types = {'short': 'int16', 'int': 'int32', 'long': 'int64',
+            'float': 'float32', 'double': 'float64'}
+_dbr_types = {DBR_CHAR: 'int8', DBR_SHORT: 'int16', DBR_ENUM: 'int16',
+              DBR_LONG: 'int32', DBR_FLOAT: 'float32', DBR_DOUBLE: 'float64'}
+
+# Set by set_array_buffers()
+_array_buffers = 0
+
+# Simulated network round trip time in seconds
+latency = .0005
+
+# Counters of simulated network activity
+stats = {'round_trips': 0, 'requests': 0, 'events': 0}
+
+# The process variables of the simulated IOC, indexed by name
+pvs = {}
+
+_lock = threading.RLock()
+_pending = []   # Requests waiting to be sent
+_events = []    # Callbacks waiting to be called, (time, callback, args, user)
+
+def reset():
+    """ Deletes all process variables and clears the counters """
+    with _lock:
+        pvs.clear()
+        del _pending[:]
+        del _events[:]
+        for key in stats.keys(): stats[key] = 0
+
+class PV:
+    """
+    A process variable of the simulated IOC.  on_put, if not None, is
+    called as on_put(pv, value) when a client writes the PV, after the value
+    has been stored.
+    """
+    def __init__(self, name, value, dbf_type=None, count=1, on_put=None):
+        if (dbf_type is None):
+            if (isinstance(value, str)): dbf_type = DBR_STRING
+            elif (isinstance(value, float)): dbf_type = DBR_DOUBLE
+            else: dbf_type = DBR_LONG
+        self.name = name
+        self.value = value
+        self.dbf_type = dbf_type
+        self.count = count
+        self.on_put = on_put
+        self.monitors = []
+
+    def post(self, value=None):
+        """
+        Sets the value (if not None) and sends it to the monitors, as when
+        the record is processed.
+        """
+        with _lock:
+            if (value is not None): self.value = value
+            for evid in self.monitors:
+                _post_event(evid.callback, self._args(evid.count), evid.user)
+
+    def _args(self, count):
+        value = self.value
+        if (self.count > 1):
+            value = numpy.asarray(value[0:count], _dbr_types[self.dbf_type])
+            if (_array_buffers):
+                value = bytearray(value)
+            else:
+                value = tuple(value.tolist())
+        return {'pv_value': value, 'type': self.dbf_type, 'count': count,
+                'status': ECA_NORMAL}
+
+def add_pv(name, value, dbf_type=None, count=1, on_put=None):
+    """ Adds a process variable to the simulated IOC and returns it """
+    pv = PV(name, value, dbf_type, count, on_put)
+    with _lock:
+        pvs[name] = pv
+    return pv
+
+#
+# Simulated mca and Med records
+#
+class MCA:
+    """
+    A simulated EPICS mca record.  Acquisition started with .STRT or .ERST
+    lasts for the preset real time (.PRTM).  The hardware status is only
+    copied to the .ACQG field when the record is processed.  This happens
+    when .PROC is written, and, if done_callback is set, when acquisition
+    completes, as with drivers which process the record on completion.
+    """
+    def __init__(self, record, nchans=2048, max_rois=32, done_callback=1):
+        self.record = record
+        self.nchans = nchans
+        self.done_callback = done_callback
+        self.busy = 0
+        self.start_time = 0.
+        self.done_time = 0.
+        self.timer = None
+        self.on_acquire = []
+        self.fields = {}
+        fields = {'CALO': 0., 'CALS': .01, 'CALQ': 0., 'TTH': 10.,
+                  'EGU': 'keV', 'PRTM': .1, 'PLTM': 0., 'PCT': 0.,
+                  'PCTL': 0, 'PCTH': 0, 'CHAS': 0, 'DWEL': 0., 'PSCL': 1,
+                  'ERTM': 0., 'ELTM': 0., 'ACT': 0., 'RTIM': 0.,
+                  'STIM': 'Oct 18, 2026 00:00:00.000', 'STOP': 0, 'ERAS': 0,
+                  'ACQG': 0, 'NUSE': nchans, 'NMAX': nchans}
+        for i in range(max_rois):
+            n = 'R' + str(i)
+            fields.update({n+'LO': -1, n+'HI': -1, n+'BG': 1, n+'NM': '',
+                           n: 0., n+'N': 0.})
+        for field in fields.keys():
+            self.fields[field] = add_pv(record + '.' + field, fields[field])
+        self.fields['VAL'] = add_pv(record + '.VAL',
+                                    numpy.zeros(nchans, 'int32'), DBR_LONG,
+                                    nchans)
+        for field in ('STRT', 'ERST'):
+            self.fields[field] = add_pv(record + '.' + field, 0,
+                                        on_put=self._start)
+        self.fields['STOP'].on_put = self._stop
+        self.fields['PROC'] = add_pv(record + '.PROC', 0,
+                                     on_put=self._process)
+
+    def _start(self, pv, value):
+        if (value == 0): return
+        with _lock:
+            self.busy = 1
+            self.start_time = time.time()
+            if (self.timer is not None): self.timer.cancel()
+            self.timer = threading.Timer(self.fields['PRTM'].value,
+                                         self._done)
+            self.timer.daemon = True
+            self.timer.start()
+        self.process()
+
+    def _stop(self, pv, value):
+        if (value == 0): return
+        with _lock:
+            if (self.timer is not None): self.timer.cancel()
+        self._done()
+
+    def _done(self):
+        with _lock:
+            self.busy = 0
+            self.done_time = time.time()
+            self.timer = None
+        if (self.done_callback): self.process()
+
+    def _process(self, pv, value):
+        self.process()
+
+    def process(self):
+        """ Processes the record, updating ACQG, ERTM and VAL """
+        with _lock:
+            if (self.busy):
+                elapsed = time.time() - self.start_time
+            else:
+                elapsed = self.fields['PRTM'].value
+            self.fields['ERTM'].post(elapsed)
+            self.fields['ELTM'].post(elapsed)
+            if (self.fields['ACQG'].value != self.busy):
+                self.fields['ACQG'].post(self.busy)
+                for function in self.on_acquire: function(self)
+            self.fields['VAL'].post()
+
+def add_mca(record, nchans=2048, done_callback=1):
+    """ Adds a simulated mca record to the IOC and returns it """
+    return MCA(record, nchans=nchans, done_callback=done_callback)
+
+def add_med(prefix, n_detectors=16, nchans=2048, done_callback=1):
+    """
+    Adds the records of a simulated multi-element detector (the mca records
+    prefix+'mca1' ... and the PVs used by epicsMed) to the IOC.  Returns the
+    list of MCA objects.
+    """
+    mcas = []
+    for i in range(n_detectors):
+        mcas.append(add_mca(prefix + 'mca' + str(i+1), nchans=nchans,
+                            done_callback=done_callback))
+    acquiring = add_pv(prefix + 'Acquiring', 0)
+    def update_acquiring(mca):
+        busy = max([m.busy for m in mcas])
+        if (acquiring.value != busy): acquiring.post(busy)
+    for mca in mcas:
+        mca.on_acquire.append(update_acquiring)
+    def fan_out(field):
+        def on_put(pv, value):
+            for mca in mcas: mca.fields[field].on_put(mca.fields[field], value)
+        return on_put
+    def read_all(pv, value):
+        for mca in mcas: mca.process()
+    add_pv(prefix + 'StartAll', 0, on_put=fan_out('STRT'))
+    add_pv(prefix + 'EraseStart', 0, on_put=fan_out('ERST'))
+    add_pv(prefix + 'StopAll', 0, on_put=fan_out('STOP'))
+    add_pv(prefix + 'EraseAll', 0)
+    add_pv(prefix + 'ReadAll', 0, on_put=read_all)
+    for name in ('ElapsedLive', 'ElapsedReal', 'PresetLive', 'PresetReal',
+                 'Dwell'):
+        add_pv(prefix + name, 0.)
+    for name in ('ChannelAdvance', 'Prescale', 'ClientWait',
+                 'EnableClientWait'):
+        add_pv(prefix + name, 0)
+    return mcas
+
+#
+# Channel and event ids
+#
+class _Chid:
+    def __init__(self):
+        self.name = None
+        self.pv = None
+        self.state = cs_never_conn
+
+class _Evid:
+    def __init__(self):
+        self.chid = None
+        self.count = 1
+        self.callback = None
+        self.user = None
+
+def new_chid():
+    return _Chid()
+
+def free_chid(chid):
+    pass
+
+def new_evid():
+    return _Evid()
+
+def free_evid(evid):
+    pass
+
+def del_evid(evid):
+    pass
+
+#
+# Pointers to C variables
+#
+class _Pointer:
+    """
+    A C variable or array created by ptrcreate().  Numeric types are stored
+    in a numpy array, so that captrbuffer() can return their bytes.
+    """
+    def __init__(self, value, n, c_type=None):
+        if (c_type in _c_types):
+            self.values = numpy.zeros(max(n, 1), _c_types[c_type])
+            self.values[:] = value
+        else:
+            self.values = [value] * max(n, 1)
+
+    def copy(self):
+        copy = _Pointer(None, 0)
+        copy.values = self.values[:]
+        if (isinstance(self.values, numpy.ndarray)):
+            copy.values = self.values.copy()
+        return copy
+
+def ptrcreate(c_type, value, n=1):
+    return _Pointer(value, n, c_type)
+
+def captrcreate(c_type, value, length):
+    return _Pointer(value, 1)
+
+def ptrset(pointer, value, index=0):
+    pointer.values[index] = value
+
+def ptrvalue(pointer, index=0):
+    value = pointer.values[index]
+    if (isinstance(value, numpy.generic)): value = value.item()
+    return value
+
+def captrbuffer(pointer, nbytes):
+    return bytearray(memoryview(pointer.values).cast('B')[0:nbytes])
+
+def set_array_buffers(flag):
+    global _array_buffers
+    _array_buffers = flag
+
+def ptrfree(pointer):
+    pass
+
+#
+# Requests
+#
+def _post_event(callback, args, user):
+    _events.append((time.time() + latency/2., callback, args, user))
+    stats['events'] = stats['events'] + 1
+
+def _request(function, *args):
+    with _lock:
+        _pending.append((function, args))
+        stats['requests'] = stats['requests'] + 1
+    return ECA_NORMAL
+
+def _flush(wait=1):
+    """
+    Sends the pending requests, in one round trip.  If wait is 0 the
+    replies are not waited for, as with ca_flush_io().
+    """
+    with _lock:
+        requests = _pending[:]
+        del _pending[:]
+    if (len(requests) == 0): return ECA_NORMAL
+    if (wait): time.sleep(latency)
+    stats['round_trips'] = stats['round_trips'] + 1
+    status = ECA_NORMAL
+    for (function, args) in requests:
+        if (function(*args) != ECA_NORMAL): status = ECA_TIMEOUT
+    return status
+
+def _connect(chid):
+    with _lock:
+        pv = pvs.get(chid.name)
+        if (pv is None): return ECA_TIMEOUT
+        chid.pv = pv
+        chid.state = cs_conn
+    return ECA_NORMAL
+
+def _get(chid, count, pointer):
+    if (chid.pv is None): return ECA_TIMEOUT
+    value = chid.pv.value
+    if (chid.pv.count > 1):
+        n = min(count, len(pointer.values))
+        pointer.values[0:n] = numpy.asarray(value[0:n])
+    else:
+        pointer.values[0] = value
+    return ECA_NORMAL
+
+def _put(chid, count, pointer):
+    if (chid.pv is None): return ECA_TIMEOUT
+    pv = chid.pv
+    if (pv.count > 1):
+        value = numpy.array(pv.value)
+        value[0:count] = pointer.values[0:count]
+    else:
+        value = pointer.values[0]
+    pv.post(value)
+    if (pv.on_put is not None): pv.on_put(pv, value)
+    return ECA_NORMAL
+
+def _put_callback(chid, count, pointer, callback, user):
+    status = _put(chid, count, pointer)
+    _post_event(callback, {'status': status}, user)
+    return status
+
+def _get_callback(chid, count, callback, user):
+    if (chid.pv is None): return ECA_TIMEOUT
+    _post_event(callback, chid.pv._args(count), user)
+    return ECA_NORMAL
+
+def _subscribe(evid):
+    with _lock:
+        evid.chid.pv.monitors.append(evid)
+        # The server sends the current value when the monitor is added
+        _post_event(evid.callback, evid.chid.pv._args(evid.count), evid.user)
+    return ECA_NORMAL
+
+def search(name, chid):
+    chid.name = name
+    return _request(_connect, chid)
+
+def search_and_connect(name, chid, callback, args):
+    return search(name, chid)
+
+def clear_channel(chid):
+    chid.state = cs_closed
+    return ECA_NORMAL
+
+def array_get(req_type, count, chid, pointer):
+    return _request(_get, chid, count, pointer)
+
+def array_put(req_type, count, chid, pointer):
+    return _request(_put, chid, count, pointer)
+
+def array_put_callback(req_type, count, chid, pointer, function, args):
+    (callback, user) = args
+    # The value is copied, since CaChannel frees the pointer
+    return _request(_put_callback, chid, count, pointer.copy(), callback,
+                    user)
+
+def array_get_callback(req_type, count, chid, function, args):
+    (callback, user) = args
+    return _request(_get_callback, chid, count, callback, user)
+
+def add_masked_array_event(req_type, count, chid, function, args, r1, r2, r3,
+                           evid, mask):
+    (callback, user) = args
+    evid.chid = chid
+    evid.count = count
+    evid.callback = callback
+    evid.user = user
+    return _request(_subscribe, evid)
+
+def clear_event(evid):
+    with _lock:
+        if (evid.chid is not None) and (evid.chid.pv is not None):
+            if (evid in evid.chid.pv.monitors):
+                evid.chid.pv.monitors.remove(evid)
+    return ECA_NORMAL
+
+#
+# Execution
+#
+def _deliver():
+    """ Calls the callbacks which have arrived """
+    now = time.time()
+    with _lock:
+        ready = [e for e in _events if e[0] <= now]
+        for e in ready: _events.remove(e)
+    for (t, callback, args, user) in ready:
+        callback(args, user)
+    return len(ready)
+
+def pend_io(timeout):
+    status = _flush()
+    if (status != ECA_NORMAL): time.sleep(timeout)
+    return status
+
+def pend_event(timeout):
+    """
+    Sends the pending requests and calls callbacks for "timeout" seconds.
+    Like the real ca_pend_event() this always waits for the full timeout.
+    """
+    deadline = time.time() + timeout
+    _flush()
+    while (1):
+        _deliver()
+        remaining = deadline - time.time()
+        if (remaining <= 0): break
+        time.sleep(min(remaining, .0002))
+    return ECA_TIMEOUT
+
+def poll():
+    _flush()
+    _deliver()
+    return ECA_NORMAL
+
+def flush_io():
+    return _flush(wait=0)
+
+def test_io():
+    return ECA_NORMAL
+
+#
+# Channel information
+#
+def field_type(chid):
+    if (chid.pv is None): return DBR_LONG
+    return chid.pv.dbf_type
+
+def element_count(chid):
+    if (chid.pv is None): return 1
+    return chid.pv.count
+
+def name(chid):
+    return chid.name
+
+def state(chid):
+    return chid.state
+
+def host_name(chid):
+    return 'localhost'
+
+def read_access(chid):
+    return 1
+
+def write_access(chid):
+    return 1
+
+def dbf_type_to_DBR_CTRL(dbf_type):
+    return dbf_type + 28
+
+def message(status):
+    return {ECA_NORMAL: 'Normal successful completion',
+            ECA_TIMEOUT: 'User specified timeout on IO operation expired'
+            }.get(status, 'Unknown status ' + str(status))
@@ -42,6 +42,15 @@ void free_evid(evid *pevid)
 } %}
 /* Free pointer to event data. */
 
+%name(set_array_buffers) %inline %{
+void set_array_buffers(int flag)
+{
+    arrays_as_buffers = flag;
+} %}
+/* If flag is 1 the values of arrays of plain DBR types in callbacks are
+   returned as a bytearray with the raw data, which can be converted with
+   numpy.frombuffer(), instead of a tuple. */
+
 /* Macros wrapped in functions */
 
 %name(field_type) %inline %{
@@ -4,6 +4,8 @@
  * author  : Geoff Savage
  *
  * modified: 02/17/00 V.Sirotenko, add DBR_GR, _CTRL and _TIME data types
+ * modified: 10/18/26 arrays of plain DBR types can be returned as a
+ *           bytearray, see set_array_buffers()
  *
  * Functions needed to implement EPICS channel access in python.
  * These functions are only used internally to the wrapped functions.
@@ -59,6 +61,11 @@ Each function must:
 
 #define STR_LEN		128
 
+/* If this flag is set by set_array_buffers() then the values of arrays
+   in callbacks are returned as a bytearray containing the raw DBR data,
+   rather than as a tuple with one Python object per element. */
+static int arrays_as_buffers = 0;
+
 /*
 struct	connection_handler_args{
 	struct channel_in_use	*chid;	Channel id
@@ -267,6 +274,13 @@ PyObject *unpackPlainGet(union db_access_val *pBuf, chtype dbrType, int count)
 		printf("unpackPlainGet: Unknown DBR type\n");
 	} /* end switch (requestType) */
     } /* end if */
+    else if (arrays_as_buffers) {
+	/* The data of plain DBR types start at the beginning of the buffer */
+	t = PyByteArray_FromStringAndSize((char *)pBuf,
+	                                  count * dbr_value_size[dbrType]);
+	d = Py_BuildValue("{s:O}", PV_VALUE, t);
+	Py_XDECREF(t);  /* dictionary now references the bytearray */
+    } /* end else if */
     else {
 	t = PyTuple_New(count);
         for(i = 0; i < count; ++i) {
@@ -520,6 +520,34 @@ PyObject *captrfree(PyObject *_PTRVALUE) {
   return Py_None;
 }
 
+/*------------------------------------------------------------------
+  ptrbuffer(ptr,nbytes)
+
+  Returns a copy of the first nbytes bytes pointed to by ptr as a
+  bytearray.  This is used to convert arrays to NumPy arrays with
+  one memcpy, rather than one ptrvalue() call per element.
+  ------------------------------------------------------------------ */
+
+PyObject *captrbuffer(PyObject *_PTRVALUE, int nbytes) {
+  void *ptr;
+  char *s;
+
+  if (!PyString_Check(_PTRVALUE)) {
+    PyErr_SetString(PyExc_TypeError,"Type error in ptrbuffer. Argument is not a valid pointer value.");
+    return NULL;
+  }
+  s = PyString_AsString(_PTRVALUE);
+  if (SWIG_GetPtr(s,&ptr,0)) {
+    PyErr_SetString(PyExc_TypeError,"Type error in ptrbuffer. Argument is not a valid pointer value.");
+    return NULL;
+  }
+  if (!ptr) {
+    PyErr_SetString(PyExc_TypeError,"Unable to dereference NULL pointer.");
+    return NULL;
+  }
+  return PyByteArray_FromStringAndSize((char *) ptr, nbytes);
+}
+
 %}
 %typemap(python,in) PyObject *ptr, PyObject *value {
   $target = $source;
@@ -530,7 +558,8 @@ PyObject *captrfree(PyObject *_PTRVALUE) {
                      PyObject *captrcreate,
                      PyObject *captrset,
                      PyObject *captradd,
-                     PyObject *captrfree  
+                     PyObject *captrfree,
+                     PyObject *captrbuffer
 {
   $target = $source;
 }
@@ -615,6 +644,15 @@ PyObject *captrfree(PyObject *ptr);
 // is generally discouraged unless you absolutely know what you're
 // doing.
 
+PyObject *captrbuffer(PyObject *ptr, int nbytes);
+// Returns a copy of the first nbytes bytes of the memory pointed to by
+// ptr, as a bytearray.  Arrays can be converted to NumPy arrays with
+// numpy.frombuffer() without creating a Python object per element :
+//
+//   a = ptrcreate("int",0,2048)
+//   ...
+//   data = numpy.frombuffer(ptrbuffer(a,2048*4),"int32")
+
 PyObject *captradd(PyObject *ptr, int offset);
 // Adds a value to the current pointer value.  For the C datatypes of
 // int, short, long, float, double, and char, the offset value is the
@@ -12,19 +12,36 @@ Revision history: Original version was written in IDL
       - Fixed bug reading environment PVs
    Sept. 25, 2002  MLR.
       - Fixed bug reading environment file
+   Oct. 18, 2026
+      - Added netcdf keyword to spectra_scan(), which saves all of the spectra
+        of a scan in one file with Mca.McaScanWriter.
+      - wait() waits for the monitor on the ACQG field rather than polling,
+        and has a timeout keyword.
+      - The PVs are connected in one batch with epicsPV.epicsPVGroup, and
+        the ROI and environment PVs are only connected when first used.
+        Added the group keyword to __init__() and initialize().
+      - Added the cache keyword and set_cache(), which serve the calibration,
+        presets, elapsed and ROIs from monitor callbacks.
+      - Fixed get_roi_counts(), which used the wrong PV names.
+      - The environment_file keyword is no longer ignored.
+      - Added get_monitor_counts().
+      - initialize() reads the calibration, presets, elapsed time and data
+        with one epicsPV.getwAll() call.  Added initial_pvs() and the values
+        keyword of initialize(), so epicsMed can read all of its detectors
+        together.
 """
 import os
-import string
 import time
 # import Numeric
 import numpy as Numeric
 import epicsPV
+import caChannel.CaChannel as CaChannel
 import Mca
 import Xrf
 
 #######################################################################
 class epicsMca(Mca.Mca):
-   def __init__(self, record_name, environment_file=None):
+   def __init__(self, record_name, environment_file=None, group=None, cache=0):
       """
       Creates a new epicsMca.
       
@@ -48,6 +65,23 @@ class epicsMca(Mca.Mca):
             This is an ASCII file with each line containing a process variable
             name, followed by a space and a description field.
 
+         group:
+            An epicsPV.epicsPVGroup to which the PVs are added.  By default
+            the epicsMca creates its own group and connects to the record.
+            If a group is given the caller must call group.connect() and then
+            initialize().  This is used by epicsMed to connect the PVs of
+            all of the detectors in one batch.
+
+         cache:
+            Set this flag to put monitors on the calibration, preset, elapsed
+            and ROI fields.  get_calibration(), get_presets(), get_elapsed()
+            and get_rois() then return the values from the monitor callbacks,
+            without network reads.  See set_cache().
+
+      The ROI and environment PVs are not connected until they are first
+      used, by get_rois(), set_rois(), get_roi_counts() or
+      get_environment().
+
       Example:
         >>> from epicsMca import *
         >>> mca = epicsMca('13IDC:mca1')
@@ -90,70 +124,224 @@ class epicsMca(Mca.Mca):
                     {'nuse': None,
                      'nmax': None,
                      'val':  None}}
+      connect = (group == None)
+      if (connect): group = epicsPV.epicsPVGroup()
+      self.group = group
       for group in self.pvs.keys():
          for pv in self.pvs[group].keys():
-            name = self.record_name + '.' + string.upper(pv)
-            self.pvs[group][pv] = epicsPV.epicsPV(name, wait=0)
-      # Construct the names of the PVs for the ROIs
-      self.roi_def_pvs=[]
-      self.roi_data_pvs=[]
-      for i in range(self.max_rois):
-         n = 'R'+str(i)
-         r = {n+'lo'  : None,
-              n+'hi'  : None,
-              n+'bg'  : None,
-              n+'nm'  : None}
-         self.roi_def_pvs.append(r)
-         r = {n       : None,
-              n+'n'   : None}
-         self.roi_data_pvs.append(r)
-      for roi in range(self.max_rois):
-         for pv in self.roi_def_pvs[roi].keys():
-            name = self.record_name + '.' + string.upper(pv)
-            self.roi_def_pvs[roi][pv] = epicsPV.epicsPV(name, wait=0)
-         for pv in self.roi_data_pvs[roi].keys():
-            name = self.record_name + '.' + string.upper(pv)
-            self.roi_data_pvs[roi][pv] = epicsPV.epicsPV(name, wait=0)
-
-      # Construct the names of the PVs for the environment
-      environment_file = os.getenv('MCA_ENVIRONMENT')
+            name = self.record_name + '.' + pv.upper()
+            self.pvs[group][pv] = self.group.add(name)
+
+      # ClientWait does not exist in simple_mca.db, which is used
+      # for multi-element detectors, so it is not required to connect.
+      self.pvs['acquire']['client_wait'] = \
+                  self.group.add(self.record_name + 'ClientWait', required=0)
+      self.pvs['acquire']['enable_wait'] = \
+                  self.group.add(self.record_name + 'EnableWait', required=0)
+
+      # The ROI and environment PVs are connected on first use, together
+      # with those of the other epicsMcas in self.connect_together
+      self.roi_def_pvs = None
+      self.roi_data_pvs = None
+      self.rois_read = 0
+      self.env_pvs = None
+      self.connect_together = [self]
+      self.cache = cache
+      self.cache_valid = {}
+      self.cache_stats = {'hits': 0, 'updates': 0, 'reads': 0}
+      self.initial_values = {}  # Values read by initialize()
+      if (environment_file == None):
+         environment_file = os.getenv('MCA_ENVIRONMENT')
       if (environment_file == None):
          environment_file = 'catch1d.env'
       self.read_environment_file(environment_file)
-      self.env_pvs = []
-      for env in self.environment:
-         self.env_pvs.append(epicsPV.epicsPV(env.name, wait=0))
 
-      # Wait for all PVs to connect.  30 second timeout is for WAN, but
-      # even this does not seem to be long enough on DSL connection
-      self.pvs['calibration']['calo'].pend_io(30.)
+      if (connect):
+         # Wait for all PVs to connect.  30 second timeout is for WAN, but
+         # even this does not seem to be long enough on DSL connection
+         missing = self.group.connect(30.)
+         if (len(missing) > 0):
+            raise CaChannel.CaChannelException(CaChannel.ca.ECA_TIMEOUT,
+                                               missing)
+         self.initialize()
 
-      # ClientWait does not exist in simple_mca.db, which is used
-      # for multi-element detectors.  We see if it exists by trying to connect
-      # with a short timeout.
-      client_wait = epicsPV.epicsPV(self.record_name + 'ClientWait', wait=0)
-      enable_wait = epicsPV.epicsPV(self.record_name + 'EnableWait', wait=0)
-      try:
-         client_wait.pend_io(.01)
-         self.pvs['acquire']['client_wait'] = client_wait
-         self.pvs['acquire']['enable_wait'] = enable_wait
-      except:
-         self.pvs['acquire']['client_wait'] = None
-         self.pvs['acquire']['enable_wait'] = None
+   #######################################################################
+   def initialize(self, values=None):
+      """
+      Puts monitors on the PVs and reads all of the information from the
+      record, once the PVs have connected.  This is called by __init__()
+      unless a group was given.
+
+      Keywords:
+         values:
+            A list with the values of the PVs returned by initial_pvs().
+            epicsMed reads these for all of its detectors with one
+            epicsPV.getwAll() call.  By default they are read here, also
+            with one getwAll() call.
+      """
+      for pv in ('client_wait', 'enable_wait'):
+         if (not self.group.connected(self.pvs['acquire'][pv])):
+            self.pvs['acquire'][pv] = None
 
       # Put monitors on the ERTM, VAL, NUSE and ACQG fields
       self.pvs['data']['nuse'].setMonitor()
       self.pvs['data']['val'].setMonitor()
       self.pvs['acquire']['acqg'].setMonitor()
       self.pvs['elapsed']['ertm'].setMonitor()
-
-      # Read all of the information from the record
+      if (self.cache): self.set_cache(1)
+
+      # Read all of the information from the record, except the ROIs
+      if (values == None): values = epicsPV.getwAll(self.initial_pvs())
+      i = 0
+      for name in ('calibration', 'presets', 'elapsed'):
+         keys = list(self.pvs[name].keys())
+         self.initial_values[name] = dict(zip(keys, values[i:i+len(keys)]))
+         i = i + len(keys)
       self.get_calibration()
       self.get_presets()
       self.get_elapsed()
-      self.get_rois()
-      self.get_data()
- 
+      nchans = max(values[i], 1)
+      Mca.Mca.set_data(self, Numeric.asarray(values[i+1][0:nchans]))
+
+   #######################################################################
+   def initial_pvs(self):
+      """
+      Returns the list of epicsPVs which initialize() reads: the calibration,
+      preset and elapsed fields, then .NUSE and .VAL.
+      """
+      pvs = []
+      for name in ('calibration', 'presets', 'elapsed'):
+         pvs.extend(self.pvs[name].values())
+      pvs.append(self.pvs['data']['nuse'])
+      pvs.append(self.pvs['data']['val'])
+      return pvs
+
+   #######################################################################
+   def add_lazy_pvs(self, group):
+      """
+      Creates the ROI and environment PVs and adds them to an
+      epicsPV.epicsPVGroup.  The caller must call group.connect().
+      """
+      # Construct the names of the PVs for the ROIs
+      self.roi_def_pvs=[]
+      self.roi_data_pvs=[]
+      for i in range(self.max_rois):
+         n = 'R'+str(i)
+         r = {}
+         for pv in (n+'lo', n+'hi', n+'bg', n+'nm'):
+            r[pv] = group.add(self.record_name + '.' + pv.upper())
+         self.roi_def_pvs.append(r)
+         r = {}
+         for pv in (n, n+'n'):
+            r[pv] = group.add(self.record_name + '.' + pv.upper())
+         self.roi_data_pvs.append(r)
+      # The PVs for the environment
+      self.env_pvs = []
+      for env in self.environment:
+         self.env_pvs.append(group.add(env.name))
+
+   #######################################################################
+   def __connect_lazy(self):
+      """
+      Private function.
+      Connects the ROI and environment PVs of this epicsMca, and of the
+      others in self.connect_together, in one batch, if they have not
+      already been connected.
+      """
+      if (self.roi_def_pvs != None): return
+      group = epicsPV.epicsPVGroup()
+      for mca in self.connect_together:
+         if (mca.roi_def_pvs == None): mca.add_lazy_pvs(group)
+      missing = group.connect(30.)
+      if (len(missing) > 0):
+         raise CaChannel.CaChannelException(CaChannel.ca.ECA_TIMEOUT, missing)
+      for mca in self.connect_together:
+         if (mca.cache): mca.set_cache(1)
+
+   #######################################################################
+   def set_cache(self, cache=1):
+      """
+      Turns the cached mode on or off.
+
+      In cached mode there are monitors on the calibration, preset, elapsed
+      and ROI definition fields.  get_calibration(), get_presets(),
+      get_elapsed() and get_rois() build their result from the values sent in
+      the monitor callbacks, and if no callback has arrived since the last
+      call they return the previous result.  Neither case generates any
+      network traffic.  This is intended for displays and scans which call
+      these functions repeatedly.
+
+      self.cache_stats counts the calls which returned the previous result
+      ('hits'), which were rebuilt from new monitor values ('updates') and
+      which read the record ('reads').  Reads still happen in cached mode
+      until the first callback of each monitor has arrived.
+
+      Keywords:
+         cache:
+            1 to turn the cached mode on, 0 to turn it off.
+      """
+      self.cache = cache
+      self.cache_valid = {}
+      pvs = []
+      for group in ('calibration', 'presets', 'elapsed'):
+         pvs.extend(self.pvs[group].values())
+      if (self.roi_def_pvs != None):
+         for r in self.roi_def_pvs: pvs.extend(r.values())
+      for pv in pvs:
+         # ERTM is always monitored, for new_elapsed()
+         if (pv is self.pvs['elapsed']['ertm']): continue
+         if (cache) and (pv.callBack.monitorState == 0): pv.setMonitor()
+         if (not cache) and (pv.callBack.monitorState != 0): pv.clearMonitor()
+
+   #######################################################################
+   def __read_values(self, name, pvs):
+      """
+      Private function.
+      Returns a dictionary with the values of the dictionary of epicsPVs
+      "pvs".  In cached mode the values come from the monitor callbacks, and
+      None is returned if no callback has arrived since the values for "name"
+      were last returned.  Otherwise the values are read from the record,
+      unless initialize() has just read them.
+      """
+      if (name in self.initial_values):
+         self.cache_valid[name] = None
+         self.cache_stats['reads'] = self.cache_stats['reads'] + 1
+         return self.initial_values.pop(name)
+      if (self.cache):
+         pv_list = list(pvs.values())
+         # Deliver any pending callbacks
+         pv_list[0].pend_event(.0001)
+         counts = []
+         for pv in pv_list:
+            if (pv.callBack.monitorState != 2): break
+            counts.append(pv.callBack.monitorCount)
+         else:
+            if (self.cache_valid.get(name) == counts):
+               self.cache_stats['hits'] = self.cache_stats['hits'] + 1
+               return None
+            self.cache_valid[name] = counts
+            self.cache_stats['updates'] = self.cache_stats['updates'] + 1
+            values = {}
+            for key in pvs.keys(): values[key] = pvs[key].callBack.pv_value
+            return values
+      self.cache_valid[name] = None
+      self.cache_stats['reads'] = self.cache_stats['reads'] + 1
+      for pv in pvs.values():
+         pv.array_get()
+      pv.pend_io()
+      values = {}
+      for key in pvs.keys(): values[key] = pvs[key].getValue()
+      return values
+
+   #######################################################################
+   def __check_rois(self):
+      """
+      Private function.
+      Reads the ROIs from the record if they have not been read or written
+      since the epicsMca was created, since the ROIs are not read by
+      __init__().
+      """
+      if (not self.rois_read): self.get_rois()
 
    #######################################################################
    def read_environment_file(self, file):
@@ -191,16 +379,14 @@ class epicsMca(Mca.Mca):
       Reads the calibration information from the EPICS mca record.  Stores this information
       in the epicsMca object, and returns an McaCalibration object with this information.
       """
+      values = self.__read_values('calibration', self.pvs['calibration'])
+      if (values == None): return Mca.Mca.get_calibration(self)
       calibration = Mca.McaCalibration()
-      pvs = self.pvs['calibration']
-      for pv in pvs.keys():
-         pvs[pv].array_get()
-      pvs[pv].pend_io()
-      calibration.offset    = pvs['calo'].getValue()
-      calibration.slope     = pvs['cals'].getValue()
-      calibration.quad      = pvs['calq'].getValue()
-      calibration.two_theta = pvs['tth'].getValue()
-      calibration.units     = pvs['egu'].getValue()
+      calibration.offset    = values['calo']
+      calibration.slope     = values['cals']
+      calibration.quad      = values['calq']
+      calibration.two_theta = values['tth']
+      calibration.units     = values['egu']
       Mca.Mca.set_calibration(self, calibration)
       return calibration
 
@@ -229,19 +415,17 @@ class epicsMca(Mca.Mca):
       Reads the preset information from the EPICS mca record.  Stores this information
       in the epicsMca object, and returns an McaPresets object with this information.
       """
+      values = self.__read_values('presets', self.pvs['presets'])
+      if (values == None): return Mca.Mca.get_presets(self)
       presets = Mca.McaPresets()
-      pvs = self.pvs['presets']
-      for pv in pvs.keys():
-         pvs[pv].array_get()
-      pvs[pv].pend_io()
-      presets.real_time       = pvs['prtm'].getValue()
-      presets.live_time       = pvs['pltm'].getValue()
-      presets.total_counts    = pvs['pct'].getValue()
-      presets.start_channel   = pvs['pctl'].getValue()
-      presets.end_channel     = pvs['pcth'].getValue()
-      presets.dwell           = pvs['dwel'].getValue()
-      presets.channel_advance = pvs['chas'].getValue()
-      presets.prescale        = pvs['pscl'].getValue()
+      presets.real_time       = values['prtm']
+      presets.live_time       = values['pltm']
+      presets.total_counts    = values['pct']
+      presets.start_channel   = values['pctl']
+      presets.end_channel     = values['pcth']
+      presets.dwell           = values['dwel']
+      presets.channel_advance = values['chas']
+      presets.prescale        = values['pscl']
       Mca.Mca.set_presets(self, presets)
       return presets
 
@@ -281,16 +465,14 @@ class epicsMca(Mca.Mca):
       Reads the elapsed information from the EPICS mca record.  Stores this information
       in the epicsMca object, and returns an McaElapsed object with this information.
       """
+      values = self.__read_values('elapsed', self.pvs['elapsed'])
+      if (values == None): return Mca.Mca.get_elapsed(self)
       elapsed = Mca.McaElapsed()
-      pvs = self.pvs['elapsed']
-      for pv in pvs.keys():
-         pvs[pv].array_get()
-      pvs[pv].pend_io()
-      elapsed.real_time    = pvs['ertm'].getValue()
-      elapsed.live_time    = pvs['eltm'].getValue()
-      elapsed.total_counts = pvs['act'].getValue()
-      elapsed.read_time    = pvs['rtim'].getValue()
-      elapsed.start_time   = string.strip(pvs['stim'].getValue())
+      elapsed.real_time    = values['ertm']
+      elapsed.live_time    = values['eltm']
+      elapsed.total_counts = values['act']
+      elapsed.read_time    = values['rtim']
+      elapsed.start_time   = values['stim'].strip()
       Mca.Mca.set_elapsed(self, elapsed)
       return elapsed
 
@@ -339,23 +521,23 @@ class epicsMca(Mca.Mca):
       Reads the ROI information from the EPICS mca record.  Stores this information
       in the epicsMca object, and returns a list of McaROI objects with this information.
       """
-      for i in range(self.max_rois):
-         pvs = self.roi_def_pvs[i]
-         for pv in pvs.keys():
-            pvs[pv].array_get()
-      pvs[pv].pend_io()
+      self.__connect_lazy()
+      pvs = {}
+      for r in self.roi_def_pvs: pvs.update(r)
+      values = self.__read_values('rois', pvs)
+      if (values == None): return Mca.Mca.get_rois(self, energy=energy)
       rois = []
       for i in range(self.max_rois):
          roi = Mca.McaROI()
-         pvs = self.roi_def_pvs[i]
          r = 'R'+str(i)
-         roi.left      = pvs[r+'lo'].getValue()
-         roi.right     = pvs[r+'hi'].getValue()
-         roi.label     = pvs[r+'nm'].getValue()
-         roi.bgd_width = pvs[r+'bg'].getValue()
+         roi.left      = values[r+'lo']
+         roi.right     = values[r+'hi']
+         roi.label     = values[r+'nm']
+         roi.bgd_width = values[r+'bg']
          roi.use = 1
          if (roi.left > 0) and (roi.right > 0): rois.append(roi)
       Mca.Mca.set_rois(self, rois)
+      self.rois_read = 1
       return Mca.Mca.get_rois(self, energy=energy)
 
    #######################################################################
@@ -373,7 +555,9 @@ class epicsMca(Mca.Mca):
             Set this flag if the .left and .right fields of the ROIs are in energy units.
             By default these fields are assumed to be in channels.
       """
+      self.__connect_lazy()
       Mca.Mca.set_rois(self, rois, energy=energy)
+      self.rois_read = 1
       nrois = len(self.rois)
       for i in range(nrois):
          roi = rois[i]
@@ -398,17 +582,20 @@ class epicsMca(Mca.Mca):
       Reads the ROI counts from the EPICS mca record. Returns a tuple containing two lists,
       (total, net), containing the total and net counts in each ROI.
       """
+      self.__check_rois()
       nrois = len(self.rois)
       for roi in range(nrois):
-         for pv in self.roi_data_pvs[roi].keys():
-            pv.array_get()
-      pvs[pv].pend_io()
+         pvs = self.roi_data_pvs[roi]
+         for pv in pvs.keys():
+            pvs[pv].array_get()
+      if (nrois > 0): pvs[pv].pend_io()
       total = []
       net = []
       for i in range(nrois):
          pvs = self.roi_data_pvs[i]
-         total.append(pvs['n'].getValue())
-         net.append(pvs['nn'].getValue())
+         n = 'R'+str(i)
+         total.append(pvs[n].getValue())
+         net.append(pvs[n+'n'].getValue())
       return total, net
 
    #######################################################################
@@ -425,6 +612,7 @@ class epicsMca(Mca.Mca):
             Set this flag if the .left and .right fields in the mcaROI are in energy units.
             By default these fields are assumed to be in channels.
       """
+      self.__check_rois()
       Mca.Mca.add_roi(self, roi, energy=energy)
       self.set_rois(self.rois)
 
@@ -437,6 +625,7 @@ class epicsMca(Mca.Mca):
          index:
             The index number of the ROI to be deleted (0-31).
       """
+      self.__check_rois()
       Mca.Mca.delete_roi(self, index)
       self.set_rois(self.rois)
 
@@ -447,6 +636,7 @@ class epicsMca(Mca.Mca):
       Reads the current values of the environment PVs.  Returns a list of
       McaEnvironment objects with Mca.get_environment().
       """
+      self.__connect_lazy()
       if (len(self.env_pvs) > 0):
          for pv in self.env_pvs:
             pv.array_get()
@@ -500,6 +690,22 @@ class epicsMca(Mca.Mca):
       """
       return self.pvs['acquire']['acqg'].checkMonitor()
 
+   #######################################################################
+   def get_monitor_counts(self):
+      """
+      Returns a tuple with the number of monitor callbacks received so far for
+      the acquisition status, the elapsed time and the data.  Comparing this
+      with an earlier value is a quick way to tell whether anything has changed
+      and how many data updates arrived in the meantime.
+      Channel Access events are processed first, so that callbacks which
+      have arrived since the last call are counted.
+      """
+      # This should be self.poll(), but that is generating errors
+      self.pvs['acquire']['acqg'].pend_event(.0001)
+      return (self.pvs['acquire']['acqg'].callBack.monitorCount,
+              self.pvs['elapsed']['ertm'].callBack.monitorCount,
+              self.pvs['data']['val'].callBack.monitorCount)
+
    #######################################################################
    def get_acquire_status(self, update=0):
       """
@@ -519,12 +725,15 @@ class epicsMca(Mca.Mca):
       return busy
 
    #######################################################################
-   def wait(self, delay=.1, start=0, stop=1):
+   def wait(self, delay=.1, start=0, stop=1, timeout=None, monitor=1):
       """
       Waits for acquisition of the MCA to start and/or complete.
 
       Keywords:
-         delay:  The time between polling.  Default=0.1 seconds.
+         delay:
+            The time between polling.  Default=0.1 seconds.  If monitor=1
+            this is the longest time to wait for a change of the ACQG field
+            before the record is processed to read the hardware.
          
          start:
             Set this flag to wait for acquisition to start.
@@ -532,23 +741,56 @@ class epicsMca(Mca.Mca):
          stop:
             Set this flag to wait for acquisition to stop.  This is the default.
 
+         timeout:
+            The maximum time to wait in seconds.  The default (None) is to
+            wait forever.
+
+         monitor:
+            Set this flag to wait for the channel access monitor on the ACQG
+            field, which returns as soon as the status changes.  This is the
+            default.  Set monitor=0 to poll by processing the record every
+            "delay" seconds.
+
          If both the "start" and "stop" keywords are given then the routine 
          will wait first for acquisition to start and then for acquistion to 
          stop.  If only start=1 is given then it will not wait for acquisition
          to stop.
+
+      Outputs:
+         Returns 1 if the acquisition started and/or stopped, and 0 if the
+         timeout expired first.
       """
       if (start == 0) and (stop == 0): stop=1
+      if (timeout != None): end = time.time() + timeout
       if (start != 0):
-         while (1):
-            busy = self.get_acquire_status(update=1)
-            if (busy != 0): break
-            time.sleep(delay)
+         busy = self.get_acquire_status(update=1)
+         while (busy == 0):
+            if (timeout != None) and (time.time() >= end): return 0
+            busy = self.__wait_status(delay, monitor)
 
       if (stop != 0):
-         while (1):
-            busy = self.get_acquire_status(update=1)
-            if (busy == 0): break
-            time.sleep(delay)
+         busy = self.get_acquire_status(update=1)
+         while (busy != 0):
+            if (timeout != None) and (time.time() >= end): return 0
+            busy = self.__wait_status(delay, monitor)
+      return 1
+
+   #######################################################################
+   def __wait_status(self, delay, monitor):
+      """
+      Private function.
+      Waits up to "delay" seconds for the acquire status to change, and
+      returns the status.  The monitor on ACQG is used if monitor=1.  If no
+      monitor arrives the record is processed to read the hardware, since
+      not all drivers process the record when acquisition completes.
+      """
+      acqg = self.pvs['acquire']['acqg']
+      if (monitor != 0):
+         if (acqg.waitMonitor(delay, poll=min(delay, .001))):
+            return acqg.getw()
+      else:
+         time.sleep(delay)
+      return self.get_acquire_status(update=1)
 
    #######################################################################
    def erase(self):
@@ -593,7 +835,7 @@ class epicsMca(Mca.Mca):
          self.pvs['acquire']['client_wait'].putw(0)
 
    ############################################################################
-   def spectra_scan(self, first_file, scan_record):
+   def spectra_scan(self, first_file, scan_record, netcdf=0):
       """
       Collects Mca spectra and saves them to disk in conjunction with an EPICS scan record.
 
@@ -607,6 +849,11 @@ class epicsMca(Mca.Mca):
             The name of the EPICS scan record which is controlling the scan.
             This scan record must be configure to start epicsMca data collection
             by writing "1" into the ERST field if the EPICS MCA.
+         netcdf:
+            Set this flag to save all of the spectra in one file, first_file,
+            with Mca.McaScanWriter rather than one file per point.  Space for
+            the number of points in the scan record (.NPTS) is allocated when
+            the scan starts.  The file can be read with Mca.McaScanReader.
             
       Procedure:
          1) Waits for scan.EXSC = 1, meaning scan has started
@@ -627,17 +874,31 @@ class epicsMca(Mca.Mca):
       while (scanPV.getw() == 0):
          time.sleep(.1)
 
-      while (1):
-         # If scan is complete, exit
-         if (scanPV.getw() == 0): return
+      writer = None
+      if (netcdf):
+         npoints = epicsPV.epicsPV(scan_record + '.NPTS').getw()
+         writer = Mca.McaScanWriter(first_file, npoints=npoints)
+      try:
+         while (1):
+            # If scan is complete, exit
+            if (scanPV.getw() == 0): return
 
-         # Wait for acquisition to start
-         self.wait(start=1, stop=0)
+            # Wait for acquisition to start
+            self.wait(start=1, stop=0)
 
-         # Wait for acquisition to complete
-         self.wait(start=0, stop=1)
+            # Wait for acquisition to complete
+            self.wait(start=0, stop=1)
  
-         # Write file.  This will reset the client wait flag.
-         self.write_file(file)
-         print('Saved file: ', file)
-         file = Xrf.increment_filename(file)
+            if (writer is None):
+               # Write file.  This will reset the client wait flag.
+               self.write_file(file)
+               print('Saved file: ', file)
+               file = Xrf.increment_filename(file)
+            else:
+               writer.write(self)
+               # Reset the client wait flag
+               if (self.pvs['acquire']['client_wait'] != None):
+                  self.pvs['acquire']['client_wait'].putw(0)
+               print('Saved point', writer.n_points, 'in', file)
+      finally:
+         if (writer is not None): writer.close()
@@ -1,9 +1,11 @@
 import time
+import numpy as Numeric
 import Med
 import Mca
 import epicsMca
 import Xrf
 import epicsPV
+import caChannel.CaChannel as CaChannel
 
 ############################################################################
 class epicsMed(Med.Med):
@@ -43,27 +45,35 @@ class epicsMed(Med.Med):
          The routine establishes channel access monitors on all of the fields
          in the records which the methods in this class will read.  This
          greatly improves the speed and efficiency.
+         The PVs of all of the detectors are connected in one batch with
+         epicsPV.epicsPVGroup, and the ROI and environment PVs are only
+         connected when they are first used.  self.group.status() returns
+         the connection status and time of each PV.  The calibration,
+         presets, elapsed time and data of all of the detectors are then
+         read with one epicsPV.getwAll() call.
       """
       class pvs:
          pass
       self.pvs = pvs()
       t = Med.Med.__init__(self, n_detectors)  # Invoke base class initialization
-      self.pvs.start = epicsPV.epicsPV(prefix + 'StartAll', wait=0)
-      self.pvs.erasestart = epicsPV.epicsPV(prefix + 'EraseStart', wait=0)
-      self.pvs.stop  = epicsPV.epicsPV(prefix + 'StopAll', wait=0)
-      self.pvs.erase = epicsPV.epicsPV(prefix + 'EraseAll', wait=0)
-      self.pvs.read  = epicsPV.epicsPV(prefix + 'ReadAll', wait=0)
-      self.pvs.elive  = epicsPV.epicsPV(prefix + 'ElapsedLive', wait=0)
-      self.pvs.ereal  = epicsPV.epicsPV(prefix + 'ElapsedReal', wait=0)
-      self.pvs.plive  = epicsPV.epicsPV(prefix + 'PresetLive', wait=0)
-      self.pvs.preal  = epicsPV.epicsPV(prefix + 'PresetReal', wait=0)
-      self.pvs.dwell  = epicsPV.epicsPV(prefix + 'Dwell', wait=0)
-      self.pvs.channel_advance  = epicsPV.epicsPV(prefix + 'ChannelAdvance', wait=0)
-      self.pvs.prescale  = epicsPV.epicsPV(prefix + 'Prescale', wait=0)
-      self.pvs.acquiring  = epicsPV.epicsPV(prefix + 'Acquiring', wait=0)
-      self.pvs.client_wait  = epicsPV.epicsPV(prefix + 'ClientWait', wait=0)
-      self.pvs.enable_client_wait  = epicsPV.epicsPV(prefix + 'EnableClientWait', wait=0)
-      good_detectors = range(1, self.n_detectors+1)
+      # All of the PVs are connected in one batch
+      group = epicsPV.epicsPVGroup()
+      self.pvs.start = group.add(prefix + 'StartAll')
+      self.pvs.erasestart = group.add(prefix + 'EraseStart')
+      self.pvs.stop  = group.add(prefix + 'StopAll')
+      self.pvs.erase = group.add(prefix + 'EraseAll')
+      self.pvs.read  = group.add(prefix + 'ReadAll')
+      self.pvs.elive  = group.add(prefix + 'ElapsedLive')
+      self.pvs.ereal  = group.add(prefix + 'ElapsedReal')
+      self.pvs.plive  = group.add(prefix + 'PresetLive')
+      self.pvs.preal  = group.add(prefix + 'PresetReal')
+      self.pvs.dwell  = group.add(prefix + 'Dwell')
+      self.pvs.channel_advance  = group.add(prefix + 'ChannelAdvance')
+      self.pvs.prescale  = group.add(prefix + 'Prescale')
+      self.pvs.acquiring  = group.add(prefix + 'Acquiring')
+      self.pvs.client_wait  = group.add(prefix + 'ClientWait')
+      self.pvs.enable_client_wait  = group.add(prefix + 'EnableClientWait')
+      good_detectors = list(range(1, self.n_detectors+1))
       if (bad != None):
          for b in bad:
             del good_detectors[b-1]
@@ -71,17 +81,27 @@ class epicsMed(Med.Med):
       self.good_detectors = good_detectors
       for i in range(self.n_detectors):
          pv = prefix + 'mca' + str(self.good_detectors[i])
-         self.mcas[i] = epicsMca.epicsMca(pv)
+         self.mcas[i] = epicsMca.epicsMca(pv, group=group)
+      # The ROI and environment PVs of all of the detectors are connected
+      # together, when they are first used
+      for mca in self.mcas:
+         mca.connect_together = self.mcas
+      # Wait for all PVs to connect
+      self.group = group
+      missing = group.connect(30.)
+      if (len(missing) > 0):
+         raise CaChannel.CaChannelException(CaChannel.ca.ECA_TIMEOUT, missing)
       self.pvs.elive.setMonitor()
       self.pvs.ereal.setMonitor()
       self.pvs.acquiring.setMonitor()
       self.pvs.client_wait.setMonitor()
-      # Wait for all PVs to connect
-      self.pvs.client_wait.pend_io(30.)
-      # Read the first MCA to get the number of channels
-      t = self.mcas[0].get_data()
-      # Read the environment from the first MCA
-      self.environment = self.mcas[0].get_environment()
+      # Read the information from all of the MCAs together
+      pvs = [mca.initial_pvs() for mca in self.mcas]
+      values = epicsPV.getwAll(sum(pvs, []))
+      i = 0
+      for (mca, p) in zip(self.mcas, pvs):
+         mca.initialize(values[i:i+len(p)])
+         i = i + len(p)
 
    ############################################################################
    def set_presets(self, presets):
@@ -113,6 +133,34 @@ class epicsMed(Med.Med):
       Med.Med.copy_rois(self, detector, energy=energy)
 
 
+   ############################################################################
+   def get_data(self, total=0, align=0):
+      """
+      Returns the data from each Mca in the Med as a 2-D Numeric array,
+      dimensioned [self.n_detectors, nchans].  See Med.get_data() for the
+      keywords.
+      PROCEDURE:
+         The .NUSE and .VAL fields of all of the MCA records are read
+         together with epicsPV.getwAll(), so the readout takes about one
+         network round trip, or none when the monitors on these fields have
+         delivered the current values.  The spectra are copied into one
+         array, and the data of each epicsMca is set to its row of that array.
+      """
+      nuse = []
+      val = []
+      for mca in self.mcas:
+         nuse.append(mca.pvs['data']['nuse'])
+         val.append(mca.pvs['data']['val'])
+      values = epicsPV.getwAll(nuse + val)
+      nchans = [max(n, 1) for n in values[0:self.n_detectors]]
+      data = Numeric.zeros((self.n_detectors, max(nchans)), int)
+      for i in range(self.n_detectors):
+         spectrum = values[self.n_detectors + i]
+         n = min(nchans[i], len(spectrum))
+         data[i,0:n] = spectrum[0:n]
+         Mca.Mca.set_data(self.mcas[i], data[i,0:nchans[i]])
+      return self.process_data(data, total=total, align=align)
+
    ############################################################################
    def get_acquire_status(self, update=0):
       """
@@ -135,36 +183,64 @@ class epicsMed(Med.Med):
       return self.mcas[0].get_environment()
     
    ############################################################################
-   def wait(self, delay=.1, start=0, stop=1):
+   def wait(self, delay=.1, start=0, stop=1, timeout=None, monitor=1):
       """
       PURPOSE:
          This procedures waits for acquisition of the Med to complete.
       KEYWORD INPUTS:
-         delay:  The time between polling.  Default=0.1 seconds
+         delay:  The time between polling.  Default=0.1 seconds.  If
+                 monitor=1 this is the longest time to wait for a change of
+                 the Acquiring PV before all of the MCAs are read.
          start:
             Set this flag to wait for acquisition to start.
          stop:
             Set this flag to wait for acquisition to stop.  This is the default.
+         timeout:
+            The maximum time to wait in seconds.  The default (None) is to
+            wait forever.
+         monitor:
+            Set this flag to wait for the channel access monitor on the
+            Acquiring PV, which returns as soon as the status changes.  This is
+            the default.  Set monitor=0 to poll every "delay" seconds.
 
          If both the "start" and "stop" keywords are given then the routine 
          will wait first for acquisition to start and then for acquistion to 
          stop.  If only start=1 is given then it will not wait for acquisition
          to stop.
+      OUTPUTS:
+         Returns 1 if the acquisition started and/or stopped, and 0 if the
+         timeout expired first.
       """
       if (start == 0) and (stop == 0): stop=1
+      if (timeout != None): end = time.time() + timeout
       if (start != 0):
-         while (1):
-            busy = self.get_acquire_status(update=1)
-            if (busy != 0): break
-            time.sleep(delay)
+         busy = self.get_acquire_status(update=1)
+         while (busy == 0):
+            if (timeout != None) and (time.time() >= end): return 0
+            busy = self.__wait_status(delay, monitor)
 
       if (stop != 0):
-         while (1):
-            busy = self.get_acquire_status(update=1)
-            if (busy == 0): break
-            time.sleep(delay)
+         busy = self.get_acquire_status(update=1)
+         while (busy != 0):
+            if (timeout != None) and (time.time() >= end): return 0
+            busy = self.__wait_status(delay, monitor)
+      return 1
+
+   ############################################################################
+   def __wait_status(self, delay, monitor):
+      """
+      Private function.
+      Waits up to "delay" seconds for the acquire status to change, and
+      returns the status.  The monitor on the Acquiring PV is used if
+      monitor=1.  If no monitor arrives all of the MCAs are read.
+      """
+      if (monitor != 0):
+         if (self.pvs.acquiring.waitMonitor(delay, poll=min(delay, .001))):
+            return self.pvs.acquiring.getw()
+      else:
+         time.sleep(delay)
+      return self.get_acquire_status(update=1)
 
-
    ############################################################################
    def erase(self):
       """
@@ -213,7 +289,7 @@ class epicsMed(Med.Med):
       self.pvs.client_wait.putw(0)
 
    ############################################################################
-   def spectra_scan(self, first_file, scan_record):
+   def spectra_scan(self, first_file, scan_record, netcdf=0):
       """
       PURPOSE:
          This procedures collects Med spectra and saves them to disk in
@@ -228,6 +304,11 @@ class epicsMed(Med.Med):
             The name of the EPICS scan record which is controlling the scan.
             This scan record must be configure to start epicsMed data collection
             by writing "1" into the EraseStart record of the EPICS MED database.
+         netcdf:
+            Set this flag to save all of the spectra in one file, first_file,
+            with Mca.McaScanWriter rather than one file per point.  Space for
+            the number of points in the scan record (.NPTS) is allocated when
+            the scan starts.  The file can be read with Mca.McaScanReader.
       PROCEDURE:
          1) Wait for scan.EXSC = 1, meaning scan has started
          2) Wait for ClientWait=1, meaning acquisition has started
@@ -247,17 +328,30 @@ class epicsMed(Med.Med):
       while (scanPV.getw() == 0):
          time.sleep(.1)
 
-      while (1):
-         # If scan is complete, exit
-         if (scanPV.getw() == 0): return
+      writer = None
+      if (netcdf):
+         npoints = epicsPV.epicsPV(scan_record + '.NPTS').getw()
+         writer = Mca.McaScanWriter(first_file, npoints=npoints)
+      try:
+         while (1):
+            # If scan is complete, exit
+            if (scanPV.getw() == 0): return
 
-         # Wait for acquisition to start
-         self.wait(start=1, stop=0)
+            # Wait for acquisition to start
+            self.wait(start=1, stop=0)
 
-         # Wait for acquisition to complete
-         self.wait(start=0, stop=1)
+            # Wait for acquisition to complete
+            self.wait(start=0, stop=1)
 
-         # Write file.  This resets the client wait flag
-         self.write_file(file)
-         print('Saved file: ', file)
-         file = Xrf.increment_filename(file)
+            if (writer is None):
+               # Write file.  This resets the client wait flag
+               self.write_file(file)
+               print('Saved file: ', file)
+               file = Xrf.increment_filename(file)
+            else:
+               writer.write(self)
+               # Reset the client wait flag
+               self.pvs.client_wait.putw(0)
+               print('Saved point', writer.n_points, 'in', file)
+      finally:
+         if (writer is not None): writer.close()
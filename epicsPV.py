@@ -5,7 +5,15 @@ Geoff Savage's CaChannel class.
 Author:         Mark Rivers
 Created:        Sept. 16, 2002.
 Modifications:
+   Oct. 18, 2026  MLR
+      - Added waitMonitor(), which waits for a value callback instead of
+        polling
+      - Added the asyncio methods get(), put() and monitor()
+      - Added epicsPVGroup, which connects many PVs in one batch
+      - Added getwAll(), which reads many PVs in one batch
 """
+import time
+import asyncio
 import caChannel.CaChannel as CaChannel
 
 class epicsPV(CaChannel.CaChannel):
@@ -34,6 +42,14 @@ class epicsPV(CaChannel.CaChannel):
       - putWait() calls array_put_callback() and waits for the callback to
         occur before it returns.  This allows programs to use array_put_callback()
         synchronously and without user-written callbacks.
+
+      - waitMonitor() waits for the next value callback, so programs can wait
+        for a PV to change without polling it.
+
+      - get(), put() and monitor() are asyncio coroutines, so that one
+        program can wait for many PVs at once.  The callbacks are delivered
+        by a single task which calls ca.poll() while any coroutine is
+        waiting.
         
    Created:  Mark Rivers, Sept. 16, 2002.
    Modifications:
@@ -101,6 +117,38 @@ class epicsPV(CaChannel.CaChannel):
       self.callBack.newMonitor = 0
       return m
 
+   def waitMonitor(self, timeout=None, poll=.001):
+      """
+      Waits for a value callback, calling pend_event() until one arrives or
+      until the timeout expires.  setMonitor() must have been called first.
+      Returns 1 if a callback has occured since the last call to
+      checkMonitor(), waitMonitor(), getw(), getValue() or array_get(), and 0
+      if the timeout expired first.
+      Unlike a loop which calls getw() and time.sleep(), this returns as soon
+      as the server sends a new value, and does no network reads.
+
+      Keywords:
+         timeout:
+            The maximum time to wait in seconds.  The default (None) is to
+            wait forever.
+
+         poll:
+            The timeout for each pend_event() call.  Shorter times reduce the
+            latency at the price of CPU cycles.
+
+      Example:
+      >>> pv = epicsPV('13IDC:mca1.ACQG')
+      >>> pv.setMonitor()
+      >>> while (pv.getw() != 0): pv.waitMonitor(1.)
+      """
+      if (timeout != None): end = time.time() + timeout
+      while (self.callBack.newMonitor == 0):
+         if (timeout != None) and (time.time() >= end): break
+         self.pend_event(poll)
+      m = self.callBack.newMonitor
+      self.callBack.newMonitor = 0
+      return m
+
    def getControl(self, req_type=None, count=None, wait=1, poll=.01):
       """
       Provides a method to read the "control" and other information from an
@@ -234,6 +282,261 @@ class epicsPV(CaChannel.CaChannel):
       while(self.callBack.putComplete == 0):
          self.pend_event(poll)
 
+   async def get(self, req_type=None, count=None):
+      """
+      Reads the PV value without blocking the asyncio event loop.
+      If setMonitor() has been called and a callback has arrived this returns
+      the value from the most recent callback, like getw().  Otherwise it
+      calls CaChannel.array_get_callback() and waits for the callback.
+      Many get() calls can be waiting at once, and their requests are sent
+      to the server together.
+
+      Example:
+      >>> async def read(names):
+      >>>    pvs = [epicsPV(name) for name in names]
+      >>>    return await asyncio.gather(*[pv.get() for pv in pvs])
+      >>> values = asyncio.run(read(['13IDC:m1', '13IDC:m2']))
+      """
+      if (self.callBack.monitorState == 2):
+         self.callBack.newMonitor = 0
+         if (count == None):
+            return self.callBack.pv_value
+         else:
+            return self.callBack.pv_value[0:count]
+      future = asyncio.get_running_loop().create_future()
+      self.array_get_callback(req_type, count, futureCallback, future)
+      args = await _pump.wait(future)
+      return args['pv_value']
+
+   async def put(self, value, req_type=None, count=None, wait=False):
+      """
+      Writes a value to the PV without blocking the asyncio event loop.
+
+      Keywords:
+         req_type:
+            See CaChannel.array_put()
+
+         count:
+            See CaChannel.array_put()
+
+         wait:
+            If wait is True this calls CaChannel.array_put_callback() and
+            returns when the callback occurs, i.e. when the record has finished
+            processing, like putWait().  If wait is False (the default) the
+            value is sent with CaChannel.array_put() and this returns at once.
+      """
+      if (wait):
+         future = asyncio.get_running_loop().create_future()
+         self.array_put_callback(value, req_type, count, futureCallback,
+                                 future)
+         await _pump.wait(future)
+      else:
+         self.array_put(value, req_type, count)
+         self.flush_io()
+
+   async def monitor(self):
+      """
+      An asynchronous iterator over the values of the PV.  It yields the
+      current value, and then each new value sent by the server.
+      setMonitor() is called if it has not already been called.  Values are
+      queued, so none are lost if the loop body is slow.
+
+      Example:
+      >>> async def wait_done(mca):
+      >>>    async for busy in epicsPV(mca + '.ACQG').monitor():
+      >>>       if (busy == 0): break
+      """
+      queue = asyncio.Queue()
+      if (self.callBack.monitorState == 0):
+         self.setMonitor()
+      elif (self.callBack.monitorState == 2):
+         queue.put_nowait(self.callBack.pv_value)
+      self.callBack.queues.append(queue)
+      try:
+         _pump.start()
+         while (1):
+            value = await queue.get()
+            self.callBack.newMonitor = 0
+            yield value
+      finally:
+         self.callBack.queues.remove(queue)
+         _pump.stop()
+
+class epicsPVGroup:
+   """
+   This class connects many PVs at once.  add() creates an epicsPV and issues
+   the search without waiting for it, and connect() waits until all of the
+   PVs have connected, or the timeout expires.  The searches are all sent
+   together, so the time to connect hundreds of PVs is about the same as the
+   time to connect one.  status() returns the connection status and the
+   time each PV took to connect.
+
+   Example:
+   >>> group = epicsPVGroup()
+   >>> pvs = [group.add('13IDC:mca1.R' + str(i) + 'LO') for i in range(32)]
+   >>> group.add('13IDC:mca1ClientWait', required=0)
+   >>> group.connect()
+   >>> for (name, connected, connect_time) in group.status():
+   >>>    print(name, connected, connect_time)
+   """
+   def __init__(self):
+      self.pvs = []
+      self.required = []
+      self.start_time = []
+      self.connect_time = []
+
+   def add(self, pvName, required=1):
+      """
+      Creates an epicsPV for pvName, issues the search and returns the
+      epicsPV.
+
+      Keywords:
+         required:
+            Set required=0 for PVs which might not exist.  connect() does not
+            wait the full timeout for them, and it is not an error if they do
+            not connect.
+      """
+      pv = epicsPV(pvName, wait=0)
+      self.pvs.append(pv)
+      self.required.append(required)
+      self.start_time.append(time.time())
+      self.connect_time.append(None)
+      return pv
+
+   def connect(self, timeout=30., optional_timeout=.01, poll=.001):
+      """
+      Sends the searches and waits until all of the PVs have connected.
+      Returns the names of the required PVs which did not connect in
+      "timeout" seconds.
+
+      Keywords:
+         timeout:
+            The maximum time to wait for the required PVs.
+
+         optional_timeout:
+            The time to wait for PVs added with required=0 after the
+            required PVs have connected.
+
+         poll:
+            The timeout for each pend_event() call.
+      """
+      start = time.time()
+      optional_end = None
+      while (1):
+         CaChannel.ca.pend_event(poll)
+         now = time.time()
+         waiting = 0
+         for i in range(len(self.pvs)):
+            if (self.connect_time[i] != None): continue
+            if (self.pvs[i].state() == CaChannel.ca.cs_conn):
+               self.connect_time[i] = now - self.start_time[i]
+            elif (self.required[i]):
+               waiting = 1
+         if (not waiting) and (optional_end == None):
+            optional_end = now + optional_timeout
+         if (optional_end != None) and (now >= optional_end): break
+         if (now - start >= timeout): break
+         if (None not in self.connect_time): break
+      return [pv.name() for (pv, required, t) in
+              zip(self.pvs, self.required, self.connect_time)
+              if (required and (t == None))]
+
+   def connected(self, pv):
+      """ Returns 1 if the epicsPV pv in this group has connected, else 0 """
+      return self.connect_time[self.pvs.index(pv)] != None
+
+   def status(self):
+      """
+      Returns a list with a tuple (name, connected, connect_time) for each
+      PV, where connected is 1 if the PV has connected and connect_time is
+      the time in seconds from add() until the connection was seen, or None.
+      """
+      return [(pv.name(), int(t != None), t)
+              for (pv, t) in zip(self.pvs, self.connect_time)]
+
+class pump:
+   """
+   This class is used by the asyncio methods of epicsPV.  While any coroutine
+   is waiting it runs a task which calls ca.poll() every "period" seconds, so
+   that channel access callbacks are delivered in the event loop thread.
+   """
+   def __init__(self, period=.001):
+      self.period = period
+      self.users = 0
+      self.task = None
+
+   def start(self):
+      self.users = self.users + 1
+      if (self.task == None) or (self.task.done()):
+         self.task = asyncio.get_running_loop().create_task(self.run())
+
+   def stop(self):
+      self.users = self.users - 1
+
+   async def run(self):
+      while (self.users > 0):
+         CaChannel.ca.poll()
+         await asyncio.sleep(self.period)
+      self.task = None
+
+   async def wait(self, future):
+      """ Waits for a future which is set by a callback """
+      self.start()
+      try:
+         return await future
+      finally:
+         self.stop()
+
+_pump = pump()
+
+def getwAll(pvs, counts=None, timeout=None):
+   """
+   Reads the values of a list of epicsPVs.  The requests for all of the PVs
+   are sent together and one pend_io() waits for all of the replies, so the
+   time is about one network round trip rather than one per PV.  As with
+   getw(), PVs on which setMonitor() has been called return the value from
+   the most recent callback, with no network traffic.
+
+   Inputs:
+      pvs:
+         A list of epicsPV objects.
+
+   Keywords:
+      counts:
+         A list with the number of elements to read from each PV, or None for
+         the element count of the PV.  The default is None for every PV.
+
+      timeout:
+         The timeout for pend_io().
+
+   Outputs:
+      Returns a list with the value of each PV.
+
+   Example:
+   >>> pvs = [epicsPV('13IDC:m'+str(i)+'.RBV') for i in range(1,9)]
+   >>> positions = getwAll(pvs)
+   """
+   if (len(pvs) == 0): return []
+   if (counts == None): counts = [None]*len(pvs)
+   # Deliver any monitor callbacks
+   pvs[0].pend_event(.0001)
+   monitored = []
+   for (pv, count) in zip(pvs, counts):
+      monitored.append(pv.callBack.monitorState == 2)
+      if (not monitored[-1]):
+         CaChannel.CaChannel.array_get(pv, None, count)
+   if (0 in monitored): pvs[0].pend_io(timeout)
+   values = []
+   for (pv, count, m) in zip(pvs, counts, monitored):
+      if (m):
+         pv.callBack.newMonitor = 0
+         value = pv.callBack.pv_value
+         if (count != None): value = value[0:count]
+      else:
+         value = CaChannel.CaChannel.getValue(pv)
+      values.append(value)
+   return values
+
 class callBack:
    """
    This class is used by the epicsPV class to handle callbacks.  It is required
@@ -246,6 +549,8 @@ class callBack:
       self.newMonitor = 0
       self.putComplete = 0
       self.monitorState = 0
+      self.monitorCount = 0   # The number of value callbacks
+      self.queues = []
       # monitorState:  
       #   0=not monitored 
       #   1=monitor requested, but no callback yet
@@ -268,6 +573,17 @@ def getCallback(epicsArgs, userArgs):
    """
    if (userArgs[0].monitorState == 1): userArgs[0].monitorState = 2
    userArgs[0].newMonitor = 1
+   userArgs[0].monitorCount = userArgs[0].monitorCount + 1
    for key in epicsArgs.keys():
       setattr(userArgs[0], key, epicsArgs[key])
+   for queue in userArgs[0].queues:
+      queue.put_nowait(userArgs[0].pv_value)
+
+def futureCallback(epicsArgs, userArgs):
+   """
+   This is the callback function used by the epicsPV.get() and epicsPV.put()
+   coroutines.  It sets the result of the asyncio future in userArgs[0] to
+   the epicsArgs dictionary.
+   """
+   if (not userArgs[0].done()): userArgs[0].set_result(epicsArgs)
 
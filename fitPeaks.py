@@ -30,7 +30,17 @@ Modification history:
       - Previously several fields in the peaks could be clobbered if a
         peak was outside the energy range of the spectrum.  Added new .ignore
         field to McaPeak to work around this problem and use that field here.
+
+   Oct. 18, 2026
+      - Added predict_gaussian_derivatives(), mpfit_peaks() now returns
+        analytic derivatives unless fit.autoderivative is 1.
+      - predict_gaussian_spectrum() evaluates all of the peaks as one array.
+        The previous version is kept as predict_gaussian_spectrum_loops().
+      - Added fit_many() to fit the same peaks to many spectra.
 """
+import copy
+import time
+import multiprocessing
 import numpy as Numeric
 """ try:
    import Numeric
@@ -38,13 +48,17 @@ except:
    from numpy import oldnumeric as Numeric """
 import mpfit
 
-def mpfit_peaks(parameters, fjac, observed=None, weights=None,
+def mpfit_peaks(parameters, fjac=None, observed=None, weights=None,
                 fit=None, peaks=None):
    """ Private function """
    [fit, peak] = copy_fit_params(parameters, fit, peaks)
    predicted = predict_gaussian_spectrum(fit, peaks)
    status = 0
-   return[status, predicted-observed]
+   if (fjac is None): return[status, predicted-observed]
+   # mpfit expects the derivatives of the model for residuals of the form
+   # observed-predicted, ours are predicted-observed
+   pderiv = -predict_gaussian_derivatives(fit, peaks)
+   return[status, predicted-observed, pderiv]
 
 
 def copy_fit_params(parameters, fit, peaks):
@@ -81,10 +95,93 @@ def copy_fit_params(parameters, fit, peaks):
    return([fit, peaks])
 
 
+def peak_channels(fit, peaks):
+   """
+   Computes the channels where each peak makes a "significant" contribution,
+   i.e. within 5 sigma of the peak energy.
+
+   Inputs:
+      fit:
+         An McaFit object, which contains the global fit parameters.
+
+      peaks:
+         A list of McaPeak objects, containing the fit parameters for each peak.
+
+   Output:
+      Returns a tuple (chans, valid, sigma).
+      chans:
+         An integer array dimensioned [len(peaks), max_width] containing the
+         channel numbers of each peak's window.  Entries past the end of a
+         peak's window are set to its first channel.
+      valid:
+         A boolean array with the same dimensions as chans, which is true for
+         the channels in each peak's window.
+      sigma:
+         An array with the Gaussian sigma of each peak.
+   """
+   MAX_SIGMA=5.
+   SIGMA_TO_FWHM = 2.35482
+   energy = Numeric.asarray([peak.energy for peak in peaks], float)
+   sigma = Numeric.asarray([peak.fwhm for peak in peaks], float)/SIGMA_TO_FWHM
+   # Compute first channel where each peak makes a "significant" contribution
+   first_chan = ((energy - sigma*MAX_SIGMA - fit.energy_offset) / 
+                  fit.energy_slope).astype(int)
+   first_chan = Numeric.clip(first_chan, 0, fit.nchans-1)
+   # Number of channels where each peak makes a "significant" contribution
+   nchans = Numeric.maximum((2.*sigma*MAX_SIGMA/fit.energy_slope), 1)
+   last_chan = Numeric.clip(first_chan + nchans, 0, fit.nchans-1).astype(int)
+   width = Numeric.maximum(last_chan - first_chan, 0)
+   offsets = Numeric.arange(max(Numeric.max(width, initial=0), 1))
+   valid = offsets < width[:,Numeric.newaxis]
+   chans = first_chan[:,Numeric.newaxis] + offsets*valid
+   return (chans, valid, sigma)
+
+
 def predict_gaussian_spectrum(fit, peaks):
    """
    Predicts a Gaussian spectrum given the values in the "fit" and "peaks"
-   objects.
+   objects.  The .area field of each peak is set to the area of the peak.
+
+   Inputs:
+      fit:
+         An McaFit object, which contains the global fit parameters.
+
+      peaks:
+         A list of McaPeak objects, containing the fit parameters for each peak.
+
+   Output:
+      Returns a Numeric array containing the predicted counts.
+
+   Procedure:
+      All of the peaks are evaluated at once as a [len(peaks), max_width]
+      array over the channels returned by peak_channels(), and the
+      contributions are then summed into the spectrum with
+      Numeric.bincount().  The result is the same as
+      predict_gaussian_spectrum_loops() to within rounding.
+   """
+   energy_range = fit.energy_offset + Numeric.arange(fit.nchans)*fit.energy_slope
+   if (len(peaks) == 0): return(Numeric.zeros(fit.nchans, float))
+   chans, valid, sigma = peak_channels(fit, peaks)
+   ampl = Numeric.asarray([peak.ampl for peak in peaks], float)
+   peak_energy = Numeric.asarray([peak.energy for peak in peaks], float)
+   energy = Numeric.take(energy_range, chans)
+   counts = ampl[:,Numeric.newaxis] * Numeric.exp(
+                -((energy - peak_energy[:,Numeric.newaxis])**2 / 
+                  (2. * sigma[:,Numeric.newaxis]**2)))
+   counts = counts * valid
+   area = Numeric.sum(counts, 1)
+   for i in range(len(peaks)):
+      peaks[i].area = area[i]
+   predicted = Numeric.bincount(chans.ravel(), weights=counts.ravel(),
+                                minlength=fit.nchans)
+   return(predicted)
+
+
+def predict_gaussian_spectrum_loops(fit, peaks):
+   """
+   Predicts a Gaussian spectrum given the values in the "fit" and "peaks"
+   objects, one peak at a time.  This is the original implementation of
+   predict_gaussian_spectrum(), which is kept as a reference.
 
    Inputs:
       fit:
@@ -98,7 +195,7 @@ def predict_gaussian_spectrum(fit, peaks):
    """
    MAX_SIGMA=5.
    SIGMA_TO_FWHM = 2.35482
-   predicted = Numeric.zeros(fit.nchans, Numeric.Float)
+   predicted = Numeric.zeros(fit.nchans, float)
    energy_range = fit.energy_offset + Numeric.arange(fit.nchans)*fit.energy_slope
    for peak in peaks:
       sigma = peak.fwhm/SIGMA_TO_FWHM
@@ -109,7 +206,7 @@ def predict_gaussian_spectrum(fit, peaks):
       # Number of channels where each peak makes a "significant" contribution
       nchans = max((2.*sigma*MAX_SIGMA/fit.energy_slope), 1)
       last_chan = min(max((first_chan + nchans), 0), (fit.nchans-1))
-      chans = range(first_chan, last_chan)
+      chans = range(first_chan, int(last_chan))
       #print 'first_chan, last_chan=', first_chan, last_chan
       #print 'chans=', chans
       energy = Numeric.take(energy_range, chans)
@@ -120,6 +217,86 @@ def predict_gaussian_spectrum(fit, peaks):
    return(predicted)
 
 
+def predict_gaussian_derivatives(fit, peaks):
+   """
+   Computes the partial derivatives of the spectrum predicted by
+   predict_gaussian_spectrum() with respect to each of the fit parameters.
+
+   Inputs:
+      fit:
+         An McaFit object, which contains the global fit parameters.
+
+      peaks:
+         A list of McaPeak objects, containing the fit parameters for each peak.
+
+   Output:
+      Returns a Numeric array dimensioned [fit.nchans, 4 + 3*len(peaks)].
+      The parameters are in the order used by copy_fit_params(): energy
+      offset, energy slope, FWHM offset, FWHM slope, and then the energy,
+      FWHM and amplitude of each peak.  The derivatives take into account
+      peaks whose FWHM follows the global FWHM curve, peaks whose amplitude
+      is tied to a previous peak with .ampl_factor, and peaks which are
+      ignored.
+   """
+   SIGMA_TO_FWHM = 2.35482
+   deriv = Numeric.zeros((fit.nchans, 4 + 3*len(peaks)), float)
+   if (len(peaks) == 0): return(deriv)
+   windows, valid, sigmas = peak_channels(fit, peaks)
+   np = 4
+   for k in range(len(peaks)):
+      peak = peaks[k]
+      # The derivatives of this peak's FWHM and amplitude with respect to
+      # the fit parameters, as lists of (parameter, derivative)
+      if (peak.fwhm_flag == 0):
+         root = Numeric.sqrt(peak.energy)
+         fwhm_deriv = [(2, 1.), (3, root), (np, fit.fwhm_slope/(2.*root))]
+      else:
+         fwhm_deriv = [(np+1, 1.)]
+      if (peak.ampl_factor > 0.):
+         # ampl = ref.ampl * ampl_factor * ref.fwhm / max(fwhm, .001)
+         fwhm = max(peak.fwhm, .001)
+         ampl_deriv = []
+         for (i, d) in last_ampl_deriv:
+            ampl_deriv.append((i, d * peak.ampl_factor * 
+                                  last_opt_peak.fwhm / fwhm))
+         for (i, d) in last_fwhm_deriv:
+            ampl_deriv.append((i, d * last_opt_peak.ampl * 
+                                  peak.ampl_factor / fwhm))
+         if (peak.fwhm > .001):
+            for (i, d) in fwhm_deriv:
+               ampl_deriv.append((i, -d * peak.ampl / peak.fwhm))
+      else:
+         ampl_deriv = [(np+2, 1.)]
+      if (peak.ignore == 1):
+         ampl_deriv = []
+      if (peak.ampl_factor == 0.):
+         last_opt_peak = peak
+         last_ampl_deriv = ampl_deriv
+         last_fwhm_deriv = fwhm_deriv
+
+      if (peak.ignore != 1):
+         # Same channels as predict_gaussian_spectrum
+         sigma = sigmas[k]
+         chans = windows[k][valid[k]]
+         energy = fit.energy_offset + chans*fit.energy_slope
+         de = energy - peak.energy
+         shape = Numeric.exp(-(de**2 / (2. * sigma**2)))
+         counts = peak.ampl * shape
+         # Derivative with respect to the channel energy, the peak energy,
+         # the FWHM and the amplitude
+         d_energy = -counts * de / sigma**2
+         d_fwhm = counts * de**2 / sigma**3 / SIGMA_TO_FWHM
+         deriv[chans, 0] += d_energy
+         deriv[chans, 1] += d_energy * chans
+         deriv[chans, np] -= d_energy
+         for (i, d) in fwhm_deriv:
+            deriv[chans, i] += d_fwhm * d
+         for (i, d) in ampl_deriv:
+            deriv[chans, i] += shape * d
+      np = np + 3
+   return(deriv)
+
+
 def fitPeaks(fit, peaks, observed):
    """
    Fits spectra with a set of Gaussian peaks.
@@ -165,6 +342,12 @@ def fitPeaks(fit, peaks, observed):
                                     # less than tolerance on two successive 
                                     # iterations. 
                                     # FIT_INITIALIZE sets this to 1.e-4
+             .autoderivative        # Derivative flag
+                                    # 0 = Analytic derivatives from
+                                    #     predict_gaussian_derivatives()
+                                    # 1 = Finite difference derivatives
+                                    #     computed by mpfit
+                                    # FIT_INITIALIZE sets this to 0
 
       peaks:  
          An array of structures of type {MCA_PEAKS} which contains the
@@ -363,10 +546,10 @@ def fitPeaks(fit, peaks, observed):
    energy_flag = Numeric.asarray(energy_flag)
    # Do some sanity checks
    # Don't fit global FWHM parameters if no peaks use these
-   wh = Numeric.nonzero(fwhm_flag == 0)
+   wh = Numeric.nonzero(fwhm_flag == 0)[0]
    if (len(wh) < 2): fit.fwhm_flag = 0
    # Don't fit global energy parameters if no peaks use these
-   wh = Numeric.nonzero(energy_flag == 0)
+   wh = Numeric.nonzero(energy_flag == 0)[0]
    if (len(wh) < 2): fit.energy_flag = 0
    # Make max channels check
    fit.nchans = min(fit.nchans, len(observed))
@@ -454,16 +637,123 @@ def fitPeaks(fit, peaks, observed):
    functkw = {'observed': observed, 'weights': weights,
               'fit': fit, 'peaks': peaks}
    m = mpfit.mpfit(mpfit_peaks, parinfo=parinfo, functkw=functkw, 
-                   quiet=1, xtol=fit.tolerance, maxiter=fit.max_iter)
+                   quiet=1, xtol=fit.tolerance, maxiter=fit.max_iter,
+                   autoderivative=fit.autoderivative)
    if (m.status <= 0): print(m.errmsg)
    # Copy optimized results back
    [fit, peaks] = copy_fit_params(m.params, fit, peaks)
    predicted = predict_gaussian_spectrum(fit, peaks)
    # Convert fitted spectrum to integer
-   predicted = Numeric.around(predicted).astype(Numeric.Int)
+   predicted = Numeric.around(predicted).astype(int)
    fit.n_iter = m.niter
    fit.n_eval = m.nfev
    fit.chisqr = m.fnorm
    fit.status = m.status
    fit.err_string = m.errmsg
    return([fit, peaks, predicted])
+
+
+def fit_many(fit, peaks, spectra, workers=1, warm_start=1):
+   """
+   Fits the same set of peaks to many spectra, for example each detector of
+   a Med or each point of a scan.  Each spectrum is fitted with fitPeaks().
+
+   Inputs:
+      fit:
+         An McaFit object, or a list of McaFit objects, one for each
+         spectrum.  A list is needed if the spectra have different energy
+         calibrations, for example the detectors of a Med.  The objects are
+         not modified.
+
+      peaks:
+         A list of McaPeak objects.  This list is not modified, each spectrum
+         is fitted with a copy.
+
+      spectra:
+         A 2-D Numeric array [n_spectra, nchans], or a list of 1-D arrays,
+         containing the background-subtracted counts to be fitted.
+
+   Keywords:
+      workers:
+         The number of processes to fit the spectra in.  The spectra are
+         divided into this many groups of consecutive spectra, which are
+         fitted in parallel in a multiprocessing.Pool.  The default is 1,
+         which fits in the calling process.
+
+      warm_start:
+         Set this flag to 0 to start every fit from the initial values in
+         fit and peaks.  By default each fit starts from the results of the
+         previous spectrum in its group: the optimized calibration and FWHM
+         coefficients (if a single fit object is used) and the energies and
+         FWHM of the peaks that are optimized.
+
+   Outputs:
+      Returns a list with one entry for each spectrum.  Each entry is a list
+      (fit, peaks, predicted, time) where fit, peaks and predicted are the
+      outputs of fitPeaks() and time is the time for that fit in seconds.
+
+   Example:
+      med = Med.Med(file='basalt_xrf.002')
+      r = Mca.read_peaks('basalt_xrf.pks')
+      bgd = med.fit_background()
+      fits = [Mca.McaFit(mca) for mca in med.get_mcas()]
+      results = fit_many(fits, r['peaks'], med.get_data()-bgd.get_data(),
+                         workers=4)
+   """
+   nspectra = len(spectra)
+   if (isinstance(fit, (list, tuple))): fits = list(fit)
+   else: fits = [fit] * nspectra
+   same_calibration = not isinstance(fit, (list, tuple))
+
+   workers = max(min(workers, nspectra), 1)
+   groups = Numeric.array_split(Numeric.arange(nspectra), workers)
+   if (workers > 1):
+      pool = multiprocessing.Pool(workers)
+      try:
+         results = []
+         for group in groups:
+            results.append(pool.apply_async(fit_sequence, 
+                              ([fits[i] for i in group], peaks,
+                               [spectra[i] for i in group], 
+                               warm_start and same_calibration, warm_start)))
+         output = []
+         for r in results:
+            output.extend(r.get())
+      finally:
+         pool.close()
+         pool.join()
+   else:
+      output = fit_sequence(fits, peaks, spectra, warm_start and 
+                            same_calibration, warm_start)
+   return(output)
+
+
+def fit_sequence(fits, peaks, spectra, warm_calibration=1, warm_peaks=1):
+   """
+   Private function.  Fits peaks to each spectrum in turn for fit_many(),
+   starting each fit from the results of the previous one.
+   """
+   output = []
+   previous = None
+   for i in range(len(spectra)):
+      fit = copy.deepcopy(fits[i])
+      spectrum_peaks = copy.deepcopy(peaks)
+      if (previous is not None) and (previous[0].status > 0):
+         [last_fit, last_peaks] = previous
+         if (warm_calibration):
+            fit.initial_energy_offset = last_fit.energy_offset
+            fit.initial_energy_slope = last_fit.energy_slope
+            fit.initial_fwhm_offset = last_fit.fwhm_offset
+            fit.initial_fwhm_slope = last_fit.fwhm_slope
+         if (warm_peaks):
+            for peak, last in zip(spectrum_peaks, last_peaks):
+               if (peak.energy_flag == 1): peak.initial_energy = last.energy
+               if (peak.fwhm_flag == 1): peak.initial_fwhm = last.fwhm
+      fit.npeaks = len(spectrum_peaks)
+      t0 = time.time()
+      [fit, spectrum_peaks, predicted] = fitPeaks(fit, spectrum_peaks, 
+                                                  spectra[i])
+      t1 = time.time()
+      output.append([fit, spectrum_peaks, predicted, t1-t0])
+      previous = [fit, spectrum_peaks]
+   return(output)
@@ -14,6 +14,7 @@ class hardwareMca(epicsMca.epicsMca):
     new_acquire_status()
     new_elapsed()
     new_data()
+    get_monitor_counts()
     ...
     """
     def __init__(self, *args, **kw):
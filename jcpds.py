@@ -12,11 +12,22 @@ Created:
 Modifications:
    Sept. 26, 2002 MLR
       - Implemented Birch-Murnaghan solver using CARSMath.newton root finder
+   Oct. 18, 2026
+      - compute_d() computes the D spacings of all of the reflections at once
+        with the new function d_spacings(), from the H, K, L indices stored
+        as an integer array.
+      - Added compute_d_grid(), which computes the D spacings on a grid of
+        pressures and temperatures.
+      - read_file() failed under Python 3 when parsing the reflections.
+      - Added compute_volumes() and the function bm3_v0_v(), which solve the
+        Birch-Murnaghan equation for arrays of pressures and temperatures
+        with a Newton iteration on all of the values at once.
+        compute_volume() and compute_d_grid() use them.
 """
 import string 
 import math
 import os
-import CARSMath
+import numpy as Numeric
 
 class jcpds_reflection:
    """
@@ -68,6 +79,8 @@ class jcpds:
       self.gamma =    0.
       self.v =        0.
       self.reflections = []
+      self.hkl = Numeric.zeros((0,3), int) # H, K, L of each reflection
+      self.hkl_values = []                 # (h, k, l) self.hkl is for
 
    def read_file(self, file):
       """
@@ -187,7 +200,7 @@ class jcpds:
             elif (tag == 'DALPHADT:'): self.dalphadt = float(value)
             elif (tag == 'DIHKL:'):
                dtemp = value.split()
-               dtemp = map(float, dtemp)
+               dtemp = list(map(float, dtemp))
                reflection = jcpds_reflection()
                reflection.d0 = dtemp[0]
                reflection.inten = dtemp[1]
@@ -202,8 +215,8 @@ class jcpds:
          self.comments.append(line) # Read above
          line = fp.readline()
          # Replace any commas with blanks, split at blanks
-         temp = string.split(line.replace(',',' '))
-         temp = map(float, temp[0:5])
+         temp = line.replace(',',' ').split()
+         temp = list(map(float, temp[0:5]))
          # The symmetry codes are as follows:
          #   1 -- cubic
          #   2 -- hexagonal
@@ -220,7 +233,7 @@ class jcpds:
             line = fp.readline()
             if (line == ''): break
             dtemp = line.split()
-            dtemp = map(float, dtemp)
+            dtemp = list(map(float, dtemp))
             reflection = jcpds_reflection()
             reflection.d0 = dtemp[0]
             reflection.inten = dtemp[1]
@@ -376,7 +389,7 @@ class jcpds:
             2) Computes volume at zero-pressure and the specified temperature
                if ALPHAT0 is non-zero.
             3) Computes the volume at the specified pressure if K0 is non-zero.
-               The routine uses the IDL function FX_ROOT to solve the third
+               The routine uses the function bm3_v0_v() to solve the third
                order Birch-Murnaghan equation of state.
                
       Example:
@@ -393,17 +406,64 @@ class jcpds:
       self.alphat = self.alphat0 + self.dalphadt*(temperature-298.)
       self.k0p = self.k0p0 + self.dk0pdt*(temperature-298.)
 
-      if (pressure == 0.):
-         self.v = self.v0 * (1 + self.alphat*(temperature-298.))
-      else:
-         if (self.k0 <= 0.):
-            print('K0 is zero, computing zero pressure volume')
-            self.v = self.v0
-         else:
-            self.mod_pressure = pressure - \
-                                    self.alphat*self.k0*(temperature-298.)
-            v0_v = CARSMath.newton(self.bm3_inverse, 1.)
-            self.v = self.v0/v0_v
+      self.mod_pressure = pressure - self.alphat*self.k0*(temperature-298.)
+      self.v = float(self.compute_volumes(pressure, temperature))
+
+   def compute_volumes(self, pressure=0., temperature=0.):
+      """
+      Computes the unit cell volume of the material for many pressures and
+      temperatures at once.  Unlike compute_volume() the jcpds object is not
+      changed.
+
+      Keywords:
+         pressure:
+            The pressures in GPa, a number or an array.  If not present then
+            the pressure is assumed to be 0.
+
+         temperature:
+            The temperatures in K, a number or an array.  Zero means 298K.
+            The pressure and temperature arrays are combined with the numpy
+            broadcasting rules.
+
+      Outputs:
+         Returns an array of volumes, with the broadcast dimensions of
+         pressure and temperature.
+
+      Procedure:
+         The volumes are computed as in compute_volume(), except that the
+         Birch-Murnaghan equation is solved for all of the pressures with a
+         single Newton iteration in bm3_v0_v().
+
+      Example:
+         Compute the volume of alumina from 0 to 100 GPa at 300 and 2500 K.
+         j = jcpds()
+         j.read_file('alumina.jcpds')
+         v = j.compute_volumes(Numeric.arange(101.)[:,Numeric.newaxis],
+                               [300., 2500.])
+      """
+      pressure = Numeric.asarray(pressure, float)
+      temperature = Numeric.asarray(temperature, float)
+      # Assume 0 K really means room T
+      temperature = Numeric.where(temperature == 0, 298., temperature)
+      # Compute values of K0P and alphat at these temperatures
+      alphat = self.alphat0 + self.dalphadt*(temperature-298.)
+      k0p = self.k0p0 + self.dk0pdt*(temperature-298.)
+
+      shape = Numeric.broadcast(pressure, temperature).shape
+      v = Numeric.array(Numeric.broadcast_to(
+                        self.v0 * (1 + alphat*(temperature-298.)), shape))
+      compressed = Numeric.broadcast_to(pressure != 0., shape)
+      if (not Numeric.any(compressed)): return v
+      if (self.k0 <= 0.):
+         print('K0 is zero, computing zero pressure volume')
+         v[compressed] = self.v0
+         return v
+      # Only solve the equation of state where the pressure is not 0
+      mod_pressure = pressure - alphat*self.k0*(temperature-298.)
+      mod_pressure = Numeric.broadcast_to(mod_pressure, shape)[compressed]
+      k0p = Numeric.broadcast_to(k0p, shape)[compressed]
+      v[compressed] = self.v0 / bm3_v0_v(mod_pressure, self.k0, k0p)
+      return v
 
    def bm3_inverse(self, v0_v):
       """
@@ -434,9 +494,7 @@ class jcpds:
          diff = jcpds_bm3_inverse(1.3)
       """
 
-      return  (1.5*self.k0*(v0_v**(7./3.) - v0_v**(5./3.)) * 
-              (1 + 0.75*(self.k0p - 4.) * (v0_v**(2./3.) - 1.0)) - 
-              self.mod_pressure)
+      return bm3_pressure(v0_v, self.k0, self.k0p) - self.mod_pressure
 
 
    def compute_d(self, pressure=0., temperature=0.):
@@ -484,53 +542,55 @@ class jcpds:
       self.b = self.b0 * ratio
       self.c = self.c0 * ratio
 
-      a = self.a
-      b = self.b
-      c = self.c
-      dtor = math.pi/180.
-      alpha = self.alpha * dtor
-      beta = self.beta * dtor
-      gamma = self.gamma * dtor
-      refl = self.get_reflections()
-      for r in refl:
-         h = float(r.h)
-         k = float(r.k)
-         l = float(r.l)
-         if (self.symmetry == 'CUBIC'): 
-            d2inv = (h**2 + k**2 + l**2) / a**2
-         elif (self.symmetry == 'TETRAGONAL'): 
-            d2inv = (h**2 + k**2) / a**2 + l**2 / c**2
-         elif (self.symmetry == 'ORTHORHOMBIC'):
-            d2inv = h**2 / a**2 + k**2 / b**2 + l**2 / c**2
-         elif (self.symmetry == 'HEXAGONAL'): 
-            d2inv = (h**2 + h*k + k**2)*4./3./a**2 + l**2/c**2
-         elif (self.symmetry == 'RHOMBOHEDRAL'): 
-            d2inv = (((1. + math.cos(alpha)) * ((h**2 + k**2 + l**2) - 
-                     (1 - math.tan(0.5*alpha)**2)*(h*k + k*l + l*h))) / 
-                     (a**2 * (1 + math.cos(alpha) - 2*math.cos(alpha)**2)))
-         elif (self.symmetry == 'MONOCLINIC'):
-            d2inv = (h**2 / math.sin(beta)**2 / a**2 + 
-                     k**2 / b**2 + 
-                     l**2 / math.sin(beta)**2 / c**2 + 
-                     2 * h * l * math.cos(beta) / (a * c * math.sin(beta)**2))
-         elif (self.symmetry == 'TRICLINIC'):
-            V = (a**2 * b**2 * c**2 * 
-                (1. - math.cos(alpha)**2 - math.cos(beta)**2 - 
-                                                           math.cos(gamma)**2 + 
-                 2 * math.cos(alpha) * math.cos(beta) * math.cos(gamma)))
-            s11 = b**2 * c**2 * math.sin(alpha)**2
-            s22 = a**2 * c**2 * math.sin(beta)**2
-            s33 = a**2 * b**2 * math.sin(gamma)**2
-            s12 = a * b * c**2 * (math.cos(alpha) * math.cos(beta) - 
-                                                           math.cos(gamma))
-            s23 = a**2 * b * c * (math.cos(beta) * math.cos(gamma) - 
-                                                           math.cos(alpha))
-            s31 = a * b**2 * c * (math.cos(gamma) * math.cos(alpha) - 
-                                                           math.cos(beta))
-            d2inv = (s11 * h**2 + s22 * k**2 + s33 * l**2 + 
-                    2.*s12*h*k + 2.*s23*k*l + 2.*s31*l*h) / V**2
-         else:   print('Unknown crystal symmetry = ' + self.symmetry)
-         r.d = math.sqrt(1./d2inv)
+      d = d_spacings(self.symmetry, self.a, self.b, self.c, self.alpha,
+                     self.beta, self.gamma, self.get_hkl())
+      for r, dspacing in zip(self.get_reflections(), d.tolist()):
+         r.d = dspacing
+
+   def compute_d_grid(self, pressures, temperatures):
+      """
+      Computes the D spacings of the material on a grid of pressures and
+      temperatures.  The jcpds object is not changed.
+
+      Inputs:
+         pressures:
+            A sequence of pressures in GPa.
+
+         temperatures:
+            A sequence of temperatures in K.  As for compute_d(), 0 means
+            298K.
+
+      Outputs:
+         Returns an array of D spacings dimensioned [n_pressures,
+         n_temperatures, n_reflections].
+
+      Example:
+         Compute the D spacings of gold from 0 to 50 GPa at 300 and 1000 K.
+         j=jcpds()
+         j.read_file('gold.jcpds')
+         d = j.compute_d_grid(Numeric.arange(51.), [300., 1000.])
+      """
+      pressures = Numeric.ravel(Numeric.asarray(pressures, float))
+      temperatures = Numeric.ravel(Numeric.asarray(temperatures, float))
+      v = self.compute_volumes(pressures[:,Numeric.newaxis],
+                               temperatures[Numeric.newaxis,:])
+      ratio = (v / self.v0)**(1.0/3.0)
+      return d_spacings(self.symmetry, self.a0*ratio, self.b0*ratio,
+                        self.c0*ratio, self.alpha, self.beta, self.gamma,
+                        self.get_hkl())
+
+   def get_hkl(self):
+      """
+      Returns the H, K, L indices of the reflections as an integer array
+      dimensioned [n_reflections, 3].  The H, K, L of the reflections are
+      read on every call, and the array is rebuilt when they have changed,
+      including when a reflection is edited in place.
+      """
+      hkl = [(r.h, r.k, r.l) for r in self.get_reflections()]
+      if (hkl != self.hkl_values):
+         self.hkl = Numeric.array(hkl, int).reshape(-1, 3)
+         self.hkl_values = hkl
+      return self.hkl
 
    def get_reflections(self):
       """
@@ -539,6 +599,144 @@ class jcpds:
       """
       return self.reflections
 
+def bm3_pressure(v0_v, k0, k0p):
+   """
+   Returns the pressure from the third order Birch-Murnaghan equation of
+   state.
+
+   Inputs:
+      v0_v:
+         The ratio of the zero pressure volume to the high pressure volume,
+         a number or an array.
+
+      k0, k0p:
+         The bulk modulus and its pressure derivative, numbers or arrays.
+   """
+   return (1.5*k0*(v0_v**(7./3.) - v0_v**(5./3.)) * 
+           (1 + 0.75*(k0p - 4.) * (v0_v**(2./3.) - 1.0)))
+
+def bm3_v0_v(pressure, k0, k0p, tol=1.48e-8, maxiter=50):
+   """
+   Solves the third order Birch-Murnaghan equation of state for V0/V.
+
+   Inputs:
+      pressure:
+         The pressure, a number or an array.
+
+      k0, k0p:
+         The bulk modulus and its pressure derivative, numbers or arrays.
+
+   Keywords:
+      tol:
+         The convergence tolerance on V0/V.
+
+      maxiter:
+         The maximum number of iterations.
+
+   Outputs:
+      An array of V0/V with the broadcast dimensions of the inputs.
+
+   Procedure:
+      This does Newton iterations starting from V0/V=1, as CARSMath.newton()
+      did for one pressure at a time, but with the analytic derivative and
+      for all of the pressures at once.  The iterations stop when every
+      value has changed by less than tol.  As for CARSMath.newton(), a
+      RuntimeError is raised if this has not happened after maxiter
+      iterations.
+   """
+   pressure = Numeric.asarray(pressure, float)
+   k0 = Numeric.asarray(k0, float)
+   k0p = Numeric.asarray(k0p, float)
+   x = Numeric.ones(Numeric.broadcast(pressure, k0, k0p).shape)
+   for iter in range(maxiter):
+      x13 = x**(1./3.)
+      x23 = x13**2
+      x53 = x*x23
+      x73 = x53*x23
+      xi = 0.75*(k0p - 4.)
+      f = 1.5*k0*(x73 - x53)*(1 + xi*(x23 - 1.0)) - pressure
+      fprime = 1.5*k0*((7./3.*x*x13 - 5./3.*x23)*(1 + xi*(x23 - 1.0)) + 
+                       (x73 - x53)*xi*2./3./x13)
+      dx = f/fprime
+      x = x - dx
+      if (Numeric.all(Numeric.abs(dx) < tol)): return x
+   unconverged = Numeric.logical_not(Numeric.abs(dx) < tol)
+   raise RuntimeError('Failed to converge after %d iterations for %d of %d '
+                      'pressures' % (maxiter, Numeric.count_nonzero(unconverged),
+                                     unconverged.size))
+
+def d_spacings(symmetry, a, b, c, alpha, beta, gamma, hkl):
+   """
+   Returns the D spacings of reflections for a crystal symmetry and unit cell.
+
+   Inputs:
+      symmetry:
+         One of CUBIC, TETRAGONAL, HEXAGONAL, RHOMBOHEDRAL, ORTHORHOMBIC,
+         MONOCLINIC or TRICLINIC.
+
+      a, b, c:
+         The unit cell dimensions.  These can be numbers or arrays with the
+         same dimensions, for example for a range of pressures.
+
+      alpha, beta, gamma:
+         The unit cell angles in degrees.
+
+      hkl:
+         An integer array of H, K, L indices dimensioned [n_reflections, 3].
+
+   Outputs:
+      An array of D spacings with the dimensions of a followed by
+      n_reflections.
+   """
+   a = Numeric.asarray(a, float)[..., Numeric.newaxis]
+   b = Numeric.asarray(b, float)[..., Numeric.newaxis]
+   c = Numeric.asarray(c, float)[..., Numeric.newaxis]
+   hkl = Numeric.asarray(hkl).reshape(-1, 3)
+   h = hkl[:,0].astype(float)
+   k = hkl[:,1].astype(float)
+   l = hkl[:,2].astype(float)
+   dtor = math.pi/180.
+   alpha = alpha * dtor
+   beta = beta * dtor
+   gamma = gamma * dtor
+   if (symmetry == 'CUBIC'): 
+      d2inv = (h**2 + k**2 + l**2) / a**2
+   elif (symmetry == 'TETRAGONAL'): 
+      d2inv = (h**2 + k**2) / a**2 + l**2 / c**2
+   elif (symmetry == 'ORTHORHOMBIC'):
+      d2inv = h**2 / a**2 + k**2 / b**2 + l**2 / c**2
+   elif (symmetry == 'HEXAGONAL'): 
+      d2inv = (h**2 + h*k + k**2)*4./3./a**2 + l**2/c**2
+   elif (symmetry == 'RHOMBOHEDRAL'): 
+      d2inv = (((1. + math.cos(alpha)) * ((h**2 + k**2 + l**2) - 
+               (1 - math.tan(0.5*alpha)**2)*(h*k + k*l + l*h))) / 
+               (a**2 * (1 + math.cos(alpha) - 2*math.cos(alpha)**2)))
+   elif (symmetry == 'MONOCLINIC'):
+      d2inv = (h**2 / math.sin(beta)**2 / a**2 + 
+               k**2 / b**2 + 
+               l**2 / math.sin(beta)**2 / c**2 + 
+               2 * h * l * math.cos(beta) / (a * c * math.sin(beta)**2))
+   elif (symmetry == 'TRICLINIC'):
+      V = (a**2 * b**2 * c**2 * 
+          (1. - math.cos(alpha)**2 - math.cos(beta)**2 - 
+                                                     math.cos(gamma)**2 + 
+           2 * math.cos(alpha) * math.cos(beta) * math.cos(gamma)))
+      s11 = b**2 * c**2 * math.sin(alpha)**2
+      s22 = a**2 * c**2 * math.sin(beta)**2
+      s33 = a**2 * b**2 * math.sin(gamma)**2
+      s12 = a * b * c**2 * (math.cos(alpha) * math.cos(beta) - 
+                                                     math.cos(gamma))
+      s23 = a**2 * b * c * (math.cos(beta) * math.cos(gamma) - 
+                                                     math.cos(alpha))
+      s31 = a * b**2 * c * (math.cos(gamma) * math.cos(alpha) - 
+                                                     math.cos(beta))
+      d2inv = (s11 * h**2 + s22 * k**2 + s33 * l**2 + 
+              2.*s12*h*k + 2.*s23*k*l + 2.*s31*l*h) / V**2
+   else:
+      print('Unknown crystal symmetry = ' + symmetry)
+      d2inv = a * h * Numeric.nan
+   return Numeric.sqrt(1./d2inv)
+
 def lookup_jcpds_line(in_string, 
                       pressure=0., 
                       temperature=0., 
@@ -0,0 +1,1144 @@
+"""
+Timing benchmarks for the array implementations of the Mca routines.
+Each benchmark compares the array implementation with the original code
+and checks that the results agree.
+
+Usage:
+   python mcaBenchmark.py [benchmark ...]
+
+   With no arguments all of the benchmarks are run.
+"""
+import os
+import math
+import sys
+import copy
+import time
+import tempfile
+import numpy as Numeric
+import Mca
+import Med
+import Xrf
+import fitPeaks
+import CARSMath
+import jcpds
+
+########################################################################
+def synthetic_spectrum(nchans, npeaks=12, seed=0):
+   """
+   Returns a Poisson-noise spectrum with an exponential background and
+   npeaks Gaussian peaks, and an energy slope for a 0-20 keV range.
+   """
+   random = Numeric.random.default_rng(seed)
+   chans = Numeric.arange(nchans)
+   counts = 200.*Numeric.exp(-3.*chans/nchans) + 50.
+   width = nchans/400. + 2.
+   for center in random.integers(0, nchans, npeaks):
+      counts = counts + random.uniform(100., 5000.) * \
+                        Numeric.exp(-0.5*((chans-center)/width)**2)
+   return random.poisson(counts).astype(int), 20./nchans
+
+########################################################################
+def timeit(function, *args, **kw):
+   """
+   Calls function(*args, **kw) and returns (time, result) where time
+   is the best of 3 calls, in seconds.
+   """
+   best = None
+   for i in range(3):
+      t0 = time.time()
+      result = function(*args, **kw)
+      t = time.time() - t0
+      if (best == None) or (t < best): best = t
+   return best, result
+
+########################################################################
+def benchmark_fit_background():
+   """ Mca.fit_background(), loops versus array implementation """
+   print('Mca.fit_background()')
+   print('%8s %8s %10s %10s %8s %s' % 
+         ('nchans', 'compress', 'loops', 'array', 'speedup', 'identical'))
+   for nchans in (2048, 4096, 8192):
+      for compress in (1, 4):
+         mca = Mca.Mca()
+         data, slope = synthetic_spectrum(nchans)
+         mca.set_data(data)
+         mca.calibration.slope = slope
+         t_loops, loops = timeit(mca.fit_background, compress=compress,
+                                 vectorize=0)
+         t_array, array = timeit(mca.fit_background, compress=compress)
+         same = Numeric.array_equal(loops.get_data(), array.get_data())
+         print('%8d %8d %10.4f %10.4f %8.1f %s' % 
+               (nchans, compress, t_loops, t_array, t_loops/t_array, same))
+
+########################################################################
+def synthetic_med(n_detectors, nchans):
+   """
+   Returns a Med with a synthetic_spectrum() in each detector, with slightly
+   different calibrations.
+   """
+   med = Med.Med(n_detectors=n_detectors)
+   for i in range(n_detectors):
+      data, slope = synthetic_spectrum(nchans, seed=i)
+      med.mcas[i].set_data(data)
+      med.mcas[i].set_calibration(Mca.McaCalibration(slope=slope*(1.+.01*i)))
+   return med
+
+########################################################################
+def benchmark_med_fit_background():
+   """ Med.fit_background() versus Mca.fit_background() on each Mca """
+   def fit_each(med, **kw):
+      return [mca.fit_background(**kw) for mca in med.get_mcas()]
+   print('Med.fit_background()')
+   print('%8s %8s %8s %10s %10s %10s %s' % ('n_det', 'nchans', 'compress',
+         'each Mca', 'Med', 'Med pool', 'identical'))
+   for n_detectors in (16, 100):
+      for compress in (1, 4):
+         med = synthetic_med(n_detectors, 2048)
+         t_each, each = timeit(fit_each, med, compress=compress)
+         t_med, bgd = timeit(med.fit_background, compress=compress)
+         t_pool, pool = timeit(med.fit_background, compress=compress,
+                               processes=4)
+         same = 1
+         for i in range(n_detectors):
+            same = same and \
+               Numeric.array_equal(each[i].get_data(), bgd.mcas[i].get_data()) and \
+               Numeric.array_equal(each[i].get_data(), pool.mcas[i].get_data())
+         print('%8d %8d %8d %10.4f %10.4f %10.4f %s' % (n_detectors, 2048,
+               compress, t_each, t_med, t_pool, bool(same)))
+
+########################################################################
+def benchmark_fit_peaks(file='basalt_xrf.002', peaks_file='basalt_xrf.pks'):
+   """ fitPeaks.fitPeaks(), finite difference versus analytic derivatives """
+   print('fitPeaks.fitPeaks() on ' + file + ' with ' + peaks_file)
+   print('%8s %10s %10s %10s %10s %s' % ('detector', 'evals', 'time',
+         'evals', 'time', 'chisqr ratio'))
+   print('%8s %21s %21s' % ('', 'finite difference', 'analytic'))
+   r = Mca.read_peaks(peaks_file)
+   b = r['background']
+   med = Med.Med(file=file)
+   for det in range(med.n_detectors):
+      mca = med.get_mcas()[det]
+      if (Numeric.sum(mca.get_data()) == 0): continue
+      bgd = mca.fit_background(bottom_width=b.bottom_width, 
+                               top_width=b.top_width, exponent=b.exponent,
+                               tangent=b.tangent, compress=b.compress)
+      observed = mca.get_data() - bgd.get_data()
+      results = []
+      for autoderivative in (1, 0):
+         fit = Mca.McaFit(mca)
+         fit.autoderivative = autoderivative
+         peaks = copy.deepcopy(r['peaks'])
+         fit.npeaks = len(peaks)
+         t, result = timeit(fitPeaks.fitPeaks, fit, peaks, observed)
+         results.append((result[0].n_eval, t, result[0].chisqr))
+      print('%8d %10d %10.4f %10d %10.4f %.6f' % ((det,) + results[0][0:2] +
+            results[1][0:2] + (results[1][2]/results[0][2],)))
+
+########################################################################
+def benchmark_predict_gaussian_spectrum(nchans=2048):
+   """ fitPeaks.predict_gaussian_spectrum(), loops versus array """
+   print('fitPeaks.predict_gaussian_spectrum(), %d channels' % nchans)
+   print('%8s %10s %10s %8s %s' % ('npeaks', 'loops', 'array', 'speedup',
+                                   'max difference'))
+   random = Numeric.random.default_rng(0)
+   fit = Mca.McaFit()
+   fit.nchans = nchans
+   fit.energy_offset = 0.
+   fit.energy_slope = 20./nchans
+   for npeaks in (10, 50, 200):
+      peaks = []
+      for i in range(npeaks):
+         peak = Mca.McaPeak()
+         peak.energy = random.uniform(1., 19.)
+         peak.fwhm = random.uniform(.1, .4)
+         peak.ampl = random.uniform(10., 1000.)
+         peaks.append(peak)
+      t_loops, loops = timeit(fitPeaks.predict_gaussian_spectrum_loops, 
+                              fit, peaks)
+      t_array, array = timeit(fitPeaks.predict_gaussian_spectrum, fit, peaks)
+      print('%8d %10.6f %10.6f %8.1f %g' % (npeaks, t_loops, t_array,
+            t_loops/t_array, Numeric.max(abs(loops-array))))
+
+########################################################################
+def benchmark_fit_many(file='basalt_xrf.002', peaks_file='basalt_xrf.pks',
+                       n_spectra=32):
+   """ fitPeaks.fit_many() on a simulated scan, cold versus warm start """
+   print('fitPeaks.fit_many() on %d scan points from %s' % (n_spectra, file))
+   print('%10s %8s %10s %10s %s' % ('warm_start', 'workers', 'evals', 'time',
+                                    'max energy change'))
+   r = Mca.read_peaks(peaks_file)
+   b = r['background']
+   mca = Med.Med(file=file).get_mcas()[1]
+   bgd = mca.fit_background(bottom_width=b.bottom_width, 
+                            top_width=b.top_width, exponent=b.exponent,
+                            tangent=b.tangent, compress=b.compress)
+   observed = Numeric.clip(mca.get_data() - bgd.get_data(), 0, None)
+   # Each scan point has a slightly different intensity and Poisson noise
+   random = Numeric.random.default_rng(0)
+   scale = Numeric.linspace(0.5, 1.5, n_spectra)
+   spectra = random.poisson(scale[:,Numeric.newaxis] * observed)
+   fit = Mca.McaFit(mca)
+   reference = None
+   for warm_start, workers in ((0, 1), (1, 1), (1, 2), (1, 4)):
+      t0 = time.time()
+      results = fitPeaks.fit_many(fit, r['peaks'], spectra, workers=workers,
+                                  warm_start=warm_start)
+      t = time.time() - t0
+      evals = sum([result[0].n_eval for result in results])
+      energies = Numeric.array([[peak.energy for peak in result[1]]
+                                 for result in results])
+      if (reference is None): reference = energies
+      print('%10d %8d %10d %10.4f %g' % (warm_start, workers, evals, t,
+            Numeric.max(abs(energies - reference))))
+
+########################################################################
+def benchmark_file_io(directory=None):
+   """ Mca.write_file()/Med.read_file(), ASCII versus binary """
+   if (directory is None): directory = tempfile.mkdtemp()
+   print('Med.write_file() and Med.read_file() in ' + directory)
+   print('%10s %8s %8s %10s %10s %10s' % ('detectors', 'channels', 'format',
+                                         'write', 'read', 'MB'))
+   for (n_detectors, nchans) in ((16, 2048), (100, 2048), (100, 8192)):
+      med = synthetic_med(n_detectors, nchans)
+      data = med.get_data()
+      for binary in (0, 1):
+         file = os.path.join(directory, 'med_%d_%d.%d' % (n_detectors, nchans,
+                                                          binary))
+         t_write, r = timeit(med.write_file, file, binary=binary)
+         t_read, new = timeit(Med.Med, file=file, binary=binary)
+         # Touch all of the data, since binary files are memory mapped
+         t_read += timeit(new.get_data)[0]
+         if (not Numeric.array_equal(new.get_data(), data)):
+            print('Data read from ' + file + ' are not the same as written')
+         print('%10d %8d %8s %10.4f %10.4f %10.2f' % (n_detectors, nchans,
+               ['ascii', 'binary'][binary], t_write, t_read,
+               os.path.getsize(file)/1.e6))
+         os.remove(file)
+
+########################################################################
+def benchmark_netcdf(n_points=200, n_detectors=16, nchans=2048):
+   """
+   Scan archive, one ASCII file per point versus one netCDF file, written
+   with append=1 or with McaScanWriter
+   """
+   if (Mca.h5py is None):
+      print('netcdf benchmark skipped, h5py is not installed')
+      return
+   directory = tempfile.mkdtemp()
+   print('%d scan points of %d detectors x %d channels in %s' % 
+         (n_points, n_detectors, nchans, directory))
+   print('%8s %10s %10s %10s %10s' % ('format', 'write', 'read', 
+                                      'read part', 'MB'))
+   med = synthetic_med(n_detectors, nchans)
+   ascii = [os.path.join(directory, 'scan.%03d' % i) for i in range(n_points)]
+   netcdf = os.path.join(directory, 'scan.h5')
+   part = (3, slice(500, 600))
+
+   t0 = time.time()
+   for file in ascii: med.write_file(file)
+   t1 = time.time()
+   data = [Med.Med(file=file).get_data() for file in ascii]
+   t2 = time.time()
+   ascii_part = Numeric.array([Mca.read_ascii_file(file)['data'][part[0]]
+                               [part[1]] for file in ascii])
+   t3 = time.time()
+   size = sum([os.path.getsize(file) for file in ascii])
+   print('%8s %10.4f %10.4f %10.4f %10.2f' % ('ascii', t1-t0, t2-t1, t3-t2,
+                                              size/1.e6))
+
+   t0 = time.time()
+   for i in range(n_points): med.write_file(netcdf, netcdf=1, append=(i > 0))
+   t1 = time.time()
+   data = Mca.read_netcdf_data(netcdf)
+   t2 = time.time()
+   netcdf_part = Mca.read_netcdf_data(netcdf, detectors=part[0], 
+                                      channels=part[1])
+   t3 = time.time()
+   print('%8s %10.4f %10.4f %10.4f %10.2f' % ('netcdf', t1-t0, t2-t1, t3-t2,
+                                              os.path.getsize(netcdf)/1.e6))
+   if (not Numeric.array_equal(ascii_part, netcdf_part)):
+      print('Data read from the netCDF file are not the same as written')
+
+   t0 = time.time()
+   writer = Mca.McaScanWriter(netcdf, npoints=n_points)
+   for i in range(n_points): writer.write(med)
+   writer.close()
+   t1 = time.time()
+   reader = Mca.McaScanReader(netcdf)
+   data = reader[:]
+   t2 = time.time()
+   netcdf_part = reader[:, part[0], part[1]]
+   t3 = time.time()
+   reader.close()
+   print('%8s %10.4f %10.4f %10.4f %10.2f' % ('scan', t1-t0, t2-t1, t3-t2,
+                                              os.path.getsize(netcdf)/1.e6))
+   if (not Numeric.array_equal(ascii_part, netcdf_part)):
+      print('Data read from the scan file are not the same as written')
+   for file in ascii + [netcdf]: os.remove(file)
+   os.rmdir(directory)
+
+########################################################################
+def benchmark_mapped_med(directory=None):
+   """ Med versus MappedMed for binary files """
+   if (directory is None): directory = tempfile.mkdtemp()
+   print('Med and MappedMed reading binary files in ' + directory)
+   print('%10s %8s %10s %10s %10s %10s' % ('detectors', 'channels', 'class',
+                                          'read', 'get_data', 'total'))
+   for (n_detectors, nchans) in ((16, 2048), (100, 8192)):
+      file = os.path.join(directory, 'med_%d_%d.bin' % (n_detectors, nchans))
+      synthetic_med(n_detectors, nchans).write_file(file, binary=1)
+      for med_class in (Med.Med, Med.MappedMed):
+         t_read, med = timeit(med_class, file=file, binary=1)
+         t_data, data = timeit(med.get_data)
+         print('%10d %8d %10s %10.6f %10.6f %10.6f' % (n_detectors, nchans,
+               med_class.__name__, t_read, t_data, t_read+t_data))
+      os.remove(file)
+
+########################################################################
+def mock_epics(latency=.001):
+   """
+   Replaces the channel access module with caChannel.mock_ca, a simulated
+   IOC, and returns mock_ca.  This must be called before epicsPV, epicsMca
+   or epicsMed are imported.
+   """
+   from caChannel import mock_ca
+   sys.modules['ca'] = mock_ca
+   mock_ca.reset()
+   mock_ca.latency = latency
+   return mock_ca
+
+########################################################################
+def benchmark_acquire_wait(real_time=.25, latency=.001):
+   """
+   epicsMca.wait() and epicsMed.wait() with the ACQG monitor versus polling,
+   using a simulated IOC.  "late" is how long after acquisition completed
+   wait() returned, "trips" the number of network round trips.
+   """
+   mock_ca = mock_epics(latency)
+   import epicsMca
+   import epicsMed
+   print('wait() for %.2f second acquisitions, %.4f second latency' %
+         (real_time, latency))
+   print('%6s %13s %6s %8s %10s %6s' % ('class', 'driver', 'delay', 'monitor',
+                                       'late', 'trips'))
+   for done_callback in (1, 0):
+      mock_ca.reset()
+      simulated = {'epicsMca': [mock_ca.add_mca('bench:mca1',
+                                    done_callback=done_callback)],
+                   'epicsMed': mock_ca.add_med('bench:med:', 4,
+                                    done_callback=done_callback)}
+      mca = epicsMca.epicsMca('bench:mca1')
+      med = epicsMed.epicsMed('bench:med:', 4)
+      med.pvs.preal.putw(real_time)
+      for detector in (mca,) + tuple(med.mcas):
+         detector.pvs['presets']['prtm'].putw(real_time)
+      for (detector, start) in ((mca, mca.start), (med, med.start)):
+         for (delay, monitor) in ((.1, 0), (.01, 0), (.1, 1)):
+            mock_ca.stats['round_trips'] = 0
+            start(erase=1)
+            detector.wait(delay=delay, monitor=monitor)
+            done = max([m.done_time for m in
+                        simulated[detector.__class__.__name__]])
+            late = time.time() - done
+            if (done_callback): driver = 'processes'
+            else: driver = 'no callback'
+            print('%6s %13s %6.2f %8d %10.4f %6d' % (
+                  detector.__class__.__name__, driver, delay, monitor,
+                  late, mock_ca.stats['round_trips']))
+
+########################################################################
+def benchmark_async_pv(n_mcas=32, real_time=.1, latency=.001):
+   """
+   Synchronous epicsPV calls versus the asyncio methods for n_mcas
+   simulated mca records: reading the preset times, writing them and waiting
+   for completion of the put, and waiting for all of the MCAs to acquire.
+   """
+   import asyncio
+   mock_ca = mock_epics(latency)
+   import epicsPV
+   records = ['bench:mca' + str(i+1) for i in range(n_mcas)]
+   for record in records: mock_ca.add_mca(record)
+   prtm = [epicsPV.epicsPV(record + '.PRTM') for record in records]
+   strt = [epicsPV.epicsPV(record + '.STRT') for record in records]
+   acqg = [epicsPV.epicsPV(record + '.ACQG') for record in records]
+   print('%d simulated MCAs, %.4f second latency' % (n_mcas, latency))
+   print('%16s %10s %6s %10s %6s' % ('operation', 'sync', 'trips', 'asyncio',
+                                     'trips'))
+
+   def sync_get():
+      return [pv.getw() for pv in prtm]
+   def sync_put():
+      for pv in prtm: pv.putWait(real_time)
+   def sync_acquire():
+      for pv in strt: pv.putw(1)
+      for pv in acqg:
+         pv.setMonitor()
+         while (pv.getw() != 0): time.sleep(.01)
+         pv.clearMonitor()
+   async def async_get():
+      return await asyncio.gather(*[pv.get() for pv in prtm])
+   async def async_put():
+      await asyncio.gather(*[pv.put(real_time, wait=True) for pv in prtm])
+   async def wait_done(pv):
+      async for busy in pv.monitor():
+         if (busy == 0): break
+   async def async_acquire():
+      await asyncio.gather(*[pv.put(1) for pv in strt])
+      # Wait for the monitors that the records are acquiring
+      await asyncio.sleep(latency*2)
+      await asyncio.gather(*[wait_done(pv) for pv in acqg])
+
+   for (name, sync, coroutine) in (('get', sync_get, async_get),
+                                   ('putWait', sync_put, async_put),
+                                   ('acquire', sync_acquire, async_acquire)):
+      mock_ca.stats['round_trips'] = 0
+      t0 = time.time()
+      sync()
+      t1 = time.time()
+      trips = mock_ca.stats['round_trips']
+      mock_ca.stats['round_trips'] = 0
+      asyncio.run(coroutine())
+      t2 = time.time()
+      print('%16s %10.4f %6d %10.4f %6d' % (name, t1-t0, trips, t2-t1,
+                                            mock_ca.stats['round_trips']))
+
+########################################################################
+def benchmark_connect(latency=.001):
+   """
+   Connecting to simulated multi-element detectors.  "separate" creates one
+   epicsMca per detector, each connecting its own PVs, and reads the ROIs
+   and environment, as epicsMed.__init__ used to.  "epicsMed" connects the
+   PVs of all detectors in one batch, and the ROI and environment PVs on
+   first use ("first get_rois").
+   """
+   mock_ca = mock_epics(latency)
+   import epicsMca
+   import epicsMed
+   print('Connecting simulated detectors, %.4f second latency' % latency)
+   print('%10s %10s %10s %6s %16s %6s' % ('detectors', 'method', 'time',
+                                         'trips', 'first get_rois', 'trips'))
+   for n_detectors in (16, 100):
+      mock_ca.reset()
+      mock_ca.add_med('bench:', n_detectors, nchans=256)
+      t0 = time.time()
+      mcas = []
+      for i in range(n_detectors):
+         mca = epicsMca.epicsMca('bench:mca' + str(i+1))
+         mca.get_rois()
+         mca.get_environment()
+         mcas.append(mca)
+      t1 = time.time()
+      print('%10d %10s %10.4f %6d' % (n_detectors, 'separate', t1-t0,
+                                      mock_ca.stats['round_trips']))
+      mock_ca.stats['round_trips'] = 0
+      t0 = time.time()
+      med = epicsMed.epicsMed('bench:', n_detectors)
+      t1 = time.time()
+      trips = mock_ca.stats['round_trips']
+      mock_ca.stats['round_trips'] = 0
+      med.get_rois()
+      t2 = time.time()
+      print('%10d %10s %10.4f %6d %16.4f %6d' % (n_detectors, 'epicsMed',
+            t1-t0, trips, t2-t1, mock_ca.stats['round_trips']))
+      status = med.group.status()
+      print('%10s %d PVs, slowest connected in %.4f seconds' % ('',
+            len(status), max([t for (name, connected, t) in status if connected])))
+
+########################################################################
+def benchmark_cache(n_calls=100, latency=.001):
+   """
+   epicsMca.get_calibration(), get_presets(), get_elapsed() and get_rois(),
+   as called by the mcaDisplay timer, with and without the cached mode.
+   The record is processed every 10 calls, which updates the elapsed time.
+   """
+   mock_ca = mock_epics(latency)
+   import epicsMca
+   simulated = mock_ca.add_mca('bench:mca1')
+   print('%d calls of the get functions, %.4f second latency' % (n_calls,
+                                                               latency))
+   print('%6s %10s %6s %6s %8s %6s' % ('cache', 'time', 'trips', 'hits',
+                                      'updates', 'reads'))
+   for cache in (0, 1):
+      mca = epicsMca.epicsMca('bench:mca1', cache=cache)
+      mca.get_rois()
+      mca.cache_stats = {'hits': 0, 'updates': 0, 'reads': 0}
+      mock_ca.stats['round_trips'] = 0
+      t0 = time.time()
+      for i in range(n_calls):
+         if ((i % 10) == 0): simulated.process()
+         mca.get_calibration()
+         mca.get_presets()
+         mca.get_elapsed()
+         mca.get_rois()
+      t1 = time.time()
+      print('%6d %10.4f %6d %6d %8d %6d' % (cache, t1-t0,
+            mock_ca.stats['round_trips'], mca.cache_stats['hits'],
+            mca.cache_stats['updates'], mca.cache_stats['reads']))
+
+########################################################################
+def benchmark_med_readout(latency=.001, nchans=2048):
+   """
+   Med.get_data(), which calls epicsMca.get_data() for each detector in turn,
+   versus epicsMed.get_data(), which reads all of the detectors at once, for
+   simulated detectors.  With "monitors" the .NUSE and .VAL fields have
+   monitors, as epicsMca sets up; without them each value is a network read.
+   """
+   mock_ca = mock_epics(latency)
+   import Med
+   import epicsMed
+   print('Reading %d channel spectra, %.4f second latency' % (nchans,
+                                                             latency))
+   print('%10s %9s %10s %6s %10s %6s %s' % ('detectors', 'monitors',
+         'Med', 'trips', 'epicsMed', 'trips', 'identical'))
+   for n_detectors in (16, 100):
+      mock_ca.reset()
+      for mca in mock_ca.add_med('bench:', n_detectors, nchans=nchans):
+         mca.fields['VAL'].value = list(range(mca.nchans))
+      med = epicsMed.epicsMed('bench:', n_detectors)
+      for monitors in (1, 0):
+         if (not monitors):
+            for mca in med.mcas:
+               mca.pvs['data']['nuse'].clearMonitor()
+               mca.pvs['data']['val'].clearMonitor()
+         mock_ca.stats['round_trips'] = 0
+         t_seq, seq = timeit(Med.Med.get_data, med)
+         trips_seq = mock_ca.stats['round_trips'] // 3
+         mock_ca.stats['round_trips'] = 0
+         t_all, all = timeit(med.get_data)
+         trips_all = mock_ca.stats['round_trips'] // 3
+         print('%10d %9d %10.4f %6d %10.4f %6d %s' % (n_detectors, monitors,
+               t_seq, trips_seq, t_all, trips_all,
+               Numeric.array_equal(seq, all)))
+
+########################################################################
+def benchmark_array_transfer(latency=0., nchans=8192):
+   """
+   Reading the .VAL arrays of simulated detectors as Python lists that are
+   then converted to arrays, versus having CaChannel return numpy arrays
+   directly from the channel access buffer.  Both the unmonitored (getw)
+   path and the monitored path are timed.  The latency is 0 so that only
+   the conversion cost is measured.
+   """
+   mock_ca = mock_epics(latency)
+   import epicsPV
+   from caChannel import CaChannel
+   print('Reading %d channel spectra' % nchans)
+   print('%10s %9s %10s %10s %s' % ('detectors', 'monitors', 'lists',
+         'numpy', 'identical'))
+   for n_detectors in (16, 100):
+      mock_ca.reset()
+      for mca in mock_ca.add_med('bench:', n_detectors, nchans=nchans):
+         mca.fields['VAL'].value = list(range(mca.nchans))
+      names = ['bench:mca%d.VAL' % (i+1) for i in range(n_detectors)]
+      pvs = [epicsPV.epicsPV(name) for name in names]
+      read = lambda: [Numeric.asarray(pv.getw()) for pv in pvs]
+      for monitors in (0, 1):
+         if (monitors):
+            for pv in pvs: pv.setMonitor()
+            mock_ca.pend_event(.01)
+         times = []
+         results = []
+         for flag in (0, 1):
+            CaChannel.use_numpy_arrays(flag)
+            if (monitors):
+               # Re-post the data so the monitors deliver the new type
+               for name in names: mock_ca.pvs[name].post()
+               mock_ca.pend_event(.01)
+            t, result = timeit(read)
+            times.append(t)
+            results.append(result)
+         identical = all([Numeric.array_equal(a, b)
+                          for a, b in zip(results[0], results[1])])
+         print('%10d %9d %10.4f %10.4f %s' % (n_detectors, monitors,
+               times[0], times[1], identical))
+   CaChannel.use_numpy_arrays(0)
+
+########################################################################
+class fake_graph:
+   """
+   Stands in for the Pmw.Blt.Graph of mcaDisplay so that the display can be
+   timed without a screen.  Element data is converted to Tcl list strings,
+   which is what Tkinter does with it, and the number of points is counted.
+   """
+   def __init__(self, width=800):
+      self.width = width
+      self.points = 0
+   def winfo_width(self):
+      return self.width
+   def element_configure(self, name, xdata=(), ydata=()):
+      ' '.join(map(str, xdata))
+      ' '.join(map(str, ydata))
+      self.points = self.points + len(xdata)
+   def xaxis_configure(self, **kw): pass
+   def yaxis_configure(self, **kw): pass
+   def element_show(self, elements): pass
+
+def original_update_spectrum(self):
+   # mcaDisplay.update_spectrum() before decimation, without the markers
+   graph = self.widgets.plot
+   hmax = min((self.display.hmax), (self.foreground.nchans-1))
+   hmin = max(self.display.hmin, 0)
+   xdata = tuple(range(hmin, hmax+1))
+   ydata = self.foreground.data[hmin:hmax+1]
+   graph.element_configure('foreground', xdata=xdata, ydata=tuple(ydata))
+   display = ['foreground']
+   for i in range(self.foreground.nrois):
+      roi = 'ROI'+str(i)
+      left = self.foreground.roi[i].left
+      right = self.foreground.roi[i].right+1
+      if (left > hmax) or (right < hmin): continue
+      left = max(left, hmin)
+      right = min(right, hmax)
+      graph.element_configure(roi, xdata=tuple(range(left, right)),
+                              ydata=tuple(self.foreground.data[left:right]))
+      display.append(roi)
+   graph.yaxis_configure(logscale=self.display.vlog)
+   graph.element_show(display)
+
+def benchmark_display(nchans=8192, nrois=16, nframes=20):
+   """
+   Frame time of mcaDisplay.update_spectrum() drawing a spectrum that is
+   acquiring, with the original code and with decimation, on an 800 pixel
+   wide fake graph.  "zoomed" shows 1/8 of the channels.
+   """
+   mock_epics(0.)
+   import mcaDisplay
+   print('%d channels, %d ROIs, %d frames' % (nchans, nrois, nframes))
+   print('%8s %10s %8s %10s %8s %8s' % ('range', 'original', 'points',
+         'decimated', 'points', 'speedup'))
+   counts, slope = synthetic_spectrum(nchans)
+   for zoom in (1, 8):
+      self = mcaDisplay.mcaDisplay.__new__(mcaDisplay.mcaDisplay)
+      class widgets: pass
+      self.widgets = widgets()
+      self.widgets.plot = graph = fake_graph()
+      self.plot = mcaDisplay.mcaDisplay_plot(graph)
+      self.display = mcaDisplay.mcaDisplay_display()
+      self.display.hmin = 0
+      self.display.hmax = nchans//zoom - 1
+      self.foreground = mcaDisplay.mcaDisplay_mca()
+      self.foreground.valid = 1
+      self.foreground.nchans = nchans
+      self.foreground.roi = []
+      for i in range(nrois):
+         roi = Mca.McaROI()
+         roi.left = i*nchans//nrois
+         roi.right = roi.left + nchans//(4*nrois)
+         self.foreground.roi.append(roi)
+      self.foreground.nrois = nrois
+      self.background = mcaDisplay.mcaDisplay_mca()
+      for name in ('lmarker', 'rmarker', 'cursor'):
+         setattr(self, name, lambda value: None)
+      self.rescale_jcpds = lambda: None
+      frames = [counts*(i+1)//nframes for i in range(nframes)]
+      def draw(update):
+         graph.points = 0
+         self.plot.invalidate()
+         for data in frames:
+            self.foreground.data = data
+            update(self)
+         return graph.points // nframes
+      t_orig, p_orig = timeit(draw, original_update_spectrum)
+      t_new, p_new = timeit(draw, mcaDisplay.mcaDisplay.update_spectrum)
+      print('%8s %10.4f %8d %10.4f %8d %8.1f' % ('1/%d' % zoom,
+            t_orig/nframes, p_orig, t_new/nframes, p_new, t_orig/t_new))
+
+########################################################################
+def benchmark_refresh(update_time=.1, data_rate=20., duration=2.):
+   """
+   The mcaDisplay timer with a fixed update interval versus
+   mcaDisplay_refresh, for different drawing times.  New spectra arrive at
+   data_rate per second; each update draws the latest one.  "load" is the
+   fraction of the time spent drawing, during which the GUI does not respond.
+   """
+   mock_epics(0.)
+   import mcaDisplay
+   print('update time %.2f s, %.0f spectra/s' % (update_time, data_rate))
+   print('%8s %14s %6s %6s %14s %6s %6s %9s' % ('draw', 'fixed fps',
+         'drop', 'load', 'adaptive fps', 'drop', 'load', 'interval'))
+   for draw_time in (.01, .1, .3):
+      results = []
+      for adaptive in (0, 1):
+         refresh = mcaDisplay.mcaDisplay_refresh(update_time)
+         t0 = time.time()
+         drawn = 0
+         busy = 0.
+         while (time.time() - t0 < duration):
+            available = int((time.time() - t0) * data_rate)
+            refresh.start()
+            t = time.time()
+            time.sleep(draw_time)
+            busy = busy + time.time() - t
+            refresh.stop(available - drawn)
+            drawn = available
+            if (adaptive): time.sleep(refresh.interval)
+            else: time.sleep(update_time)
+         elapsed = time.time() - t0
+         results.append((refresh.frames/elapsed, refresh.dropped,
+                         busy/elapsed, refresh.interval))
+      (fps0, drop0, load0, i0), (fps1, drop1, load1, i1) = results
+      print('%8.2f %14.1f %6d %6.2f %14.1f %6d %6.2f %9.2f' % (draw_time,
+            fps0, drop0, load0, fps1, drop1, load1, i1))
+
+class fake_widget:
+   """
+   Stands in for the Tk widgets used by mcaDisplay.timer().  after() records
+   the callback rather than scheduling it.
+   """
+   def __init__(self):
+      self.options = {}
+      self.scheduled = None
+   def configure(self, **kw):
+      self.options.update(kw)
+   def after(self, ms, function):
+      self.scheduled = (ms, function)
+      return 1
+
+def benchmark_timer(prtm=.5, nticks=20, start_tick=4, latency=.001):
+   """
+   Runs mcaDisplay.timer() itself against a simulated IOC, as Tk would,
+   sleeping for the interval each tick schedules.  Another client starts
+   the acquisition after start_tick idle ticks; the display must see it
+   start and complete, and draw the data.
+   """
+   mock_ca = mock_epics(latency)
+   import epicsMca
+   import epicsPV
+   import mcaDisplay
+   record = mock_ca.add_mca('bench:mca1')
+   record.fields['PRTM'].value = prtm
+   self = mcaDisplay.mcaDisplay.__new__(mcaDisplay.mcaDisplay)
+   class widgets: pass
+   self.widgets = widgets()
+   for name in ('top', 'start', 'stop', 'fps', 'dropped'):
+      setattr(self.widgets, name, fake_widget())
+   self.display = mcaDisplay.mcaDisplay_display()
+   self.display.update_time = .05
+   self.options = mcaDisplay.mcaDisplay_options()
+   self.refresh = mcaDisplay.mcaDisplay_refresh(self.display.update_time)
+   self.foreground = mcaDisplay.mcaDisplay_mca()
+   self.foreground.mca = epicsMca.epicsMca('bench:mca1')
+   self.foreground.is_detector = 1
+   self.background = mcaDisplay.mcaDisplay_mca()
+   draws = []
+   self.update_spectrum = lambda: draws.append(tick)
+   self.show_stats = lambda: None
+   # The other client
+   start = epicsPV.epicsPV('bench:mca1.STRT')
+   acqg = []
+   for tick in range(nticks):
+      if (tick == start_tick): start.putw(1)
+      mcaDisplay.mcaDisplay.timer(self)
+      acqg.append(self.display.current_acqg)
+      time.sleep(self.widgets.top.scheduled[0]/1000.)
+   print('%d ticks, acquisition of %.2f s started after tick %d' %
+         (nticks, prtm, start_tick))
+   print('acquiring: ' + ''.join(map(str, acqg)))
+   print('drawn at ticks: ' + str(draws))
+   started = 1 in acqg[start_tick:]
+   completed = started and (acqg[-1] == 0)
+   drawn = len([t for t in draws if t >= start_tick]) > 0
+   print('saw start %s, saw completion %s, drew data %s' % (started,
+         completed, drawn))
+   if (not (started and completed and drawn)):
+      raise RuntimeError('mcaDisplay.timer() did not follow the acquisition')
+
+########################################################################
+def original_roi_counts(mca, background_width=1):
+   # Mca.get_roi_counts() before it used the cumulative sum of the data,
+   # with the Numeric.arange(n, float) call fixed for numpy
+   total = []
+   net = []
+   nchans = len(mca.data)
+   for roi in mca.rois:
+      left = roi.left
+      ll = max((left-background_width+1), 0)
+      if (background_width > 0):
+          bgd_left = sum(mca.data[ll:(left+1)]) / (left-ll+1)
+      else: bgd_left = 0.
+      right = roi.right
+      rr = min((right+background_width-1), nchans-1)
+      if (background_width > 0):
+          bgd_right = sum(mca.data[right:rr+1]) / (rr-right+1)
+      else: bgd_right = 0.
+      total_counts = mca.data[left:right+1]
+      total.append(sum(total_counts))
+      n_sel        = right - left + 1
+      bgd_counts   = bgd_left + Numeric.arange(n_sel,dtype=float)/(n_sel-1) * \
+                               (bgd_right - bgd_left)
+      net_counts   = total_counts - bgd_counts
+      net.append(sum(net_counts))
+   return (total, net)
+
+def benchmark_roi_counts(nchans=4096, nrois=32, background_width=3):
+   """
+   Mca.get_roi_counts() and Med.get_roi_counts(), summing each ROI versus
+   the cumulative sum of the data.  "new data" calls set_data() before each
+   call, so the cumulative sum is recomputed each time.
+   """
+   print('%d channels, %d ROIs per detector' % (nchans, nrois))
+   print('%10s %9s %10s %10s %8s %s' % ('detectors', 'new data', 'original',
+         'cumulative', 'speedup', 'identical'))
+   for n_detectors in (1, 16, 100):
+      med = synthetic_med(n_detectors, nchans)
+      for mca in med.mcas:
+         rois = []
+         for i in range(nrois):
+            roi = Mca.McaROI()
+            roi.left = (i * nchans) // nrois
+            roi.right = roi.left + 2 + (i * (nchans//nrois - 4)) // nrois
+            rois.append(roi)
+         mca.set_rois(rois)
+      for new_data in (0, 1):
+         def original():
+            total = []
+            net = []
+            for mca in med.mcas:
+               t, n = original_roi_counts(mca, background_width)
+               total.append(t)
+               net.append(n)
+            return (total, net)
+         def cumulative():
+            if (new_data):
+               for mca in med.mcas: mca.set_data(mca.data)
+            if (n_detectors == 1):
+               t, n = med.mcas[0].get_roi_counts(background_width)
+               return ([t], [n])
+            return med.get_roi_counts(background_width)
+         t_orig, (total0, net0) = timeit(original)
+         t_new, (total1, net1) = timeit(cumulative)
+         identical = ((total0 == total1) and
+                      Numeric.allclose(net0, net1, rtol=1e-12, atol=1e-6))
+         print('%10d %9d %10.4f %10.4f %8.1f %s' % (n_detectors, new_data,
+               t_orig, t_new, t_orig/t_new, identical))
+
+########################################################################
+def benchmark_extract_rois(n_files=100, n_detectors=16, nchans=2048,
+                           nrois=8):
+   """
+   ROI counts of a series of ASCII files, reading each file with
+   Med.read_file() and calling get_roi_counts() in a loop, versus
+   Med.extract_rois(), in the calling process, in a pool of processes, and
+   again with the cache.
+   """
+   directory = tempfile.mkdtemp()
+   print('%d files of %d detectors x %d channels, %d ROIs, in %s' %
+         (n_files, n_detectors, nchans, nrois, directory))
+   med = synthetic_med(n_detectors, nchans)
+   rois = []
+   for i in range(nrois):
+      roi = Mca.McaROI()
+      roi.left = 100 + i*200
+      roi.right = roi.left + 50
+      rois.append(roi)
+   med.set_rois(rois)
+   first = os.path.join(directory, 'scan.001')
+   file = first
+   for i in range(n_files):
+      med.write_file(file)
+      file = Xrf.increment_filename(file)
+   def loop():
+      total = []
+      net = []
+      for file in Med.spectrum_files(first):
+         t, n = Med.Med(file=file).get_roi_counts()
+         total.append(t)
+         net.append(n)
+      return (Numeric.array(total), Numeric.array(net))
+   cache = os.path.join(directory, 'scan.roi')
+   t_loop, (total0, net0) = timeit(loop)
+   print('%24s %10.4f' % ('read_file loop', t_loop))
+   for (label, kw) in (('extract_rois', {}),
+                       ('extract_rois 2 processes', {'processes': 2}),
+                       ('extract_rois cached', {'cache': cache})):
+      if ('cache' in kw): Med.extract_rois(first, **kw)
+      t, (total, net) = timeit(Med.extract_rois, first, **kw)
+      print('%24s %10.4f %s' % (label, t, Numeric.array_equal(total, total0)
+            and Numeric.allclose(net, net0)))
+   for name in os.listdir(directory): os.remove(os.path.join(directory, name))
+   os.rmdir(directory)
+
+########################################################################
+def original_spline_interpolate(x, y, x2):
+   # spline.spline_interpolate() before SplineMap, with the range().reverse()
+   # call fixed for Python 3: a natural spline solved and evaluated with
+   # loops over the points
+   n = len(x)
+   y2 = Numeric.zeros(n, float)
+   u = Numeric.zeros(n-1, float)
+   for i in range(1, n-1):
+      sig = (x[i]-x[i-1]) / (x[i+1]-x[i-1])
+      p = sig*y2[i-1]+2.0
+      y2[i] = (sig-1.0)/p
+      u[i] = (y[i+1]-y[i])/(x[i+1]-x[i]) - (y[i]-y[i-1])/(x[i]-x[i-1])
+      u[i] = (6.0*u[i]/(x[i+1]-x[i-1]) - sig*u[i-1]) / p
+   for k in range(n-2, -1, -1):
+      y2[k] = y2[k]*y2[k+1]+u[k]
+   result = Numeric.zeros(len(x2))
+   for j in range(len(x2)):
+      if (x2[j] <= x[0]): result[j] = y[0]; continue
+      if (x2[j] >= x[-1]): result[j] = y[-1]; continue
+      pos = Numeric.searchsorted(x, x2[j])
+      h = x[pos]-x[pos-1]
+      a = (x[pos] - x2[j]) / h
+      b = (x2[j] - x[pos-1]) / h
+      result[j] = (a*y[pos-1] + b*y[pos] + ((a*a*a - a)*y2[pos-1] +
+                   (b*b*b - b)*y2[pos]) * h*h/6.0)
+   return result
+
+def benchmark_align(nchans=2048):
+   """
+   Med.get_data(align=1), interpolating each detector with the original
+   spline loops versus spline.SplineMap on all of the detectors at once.
+   "first" includes the spline setup, "repeat" uses the cached setup.
+   """
+   print('Med.get_data(align=1), %d channels' % nchans)
+   print('%10s %10s %10s %10s %8s %s' % ('detectors', 'original', 'first',
+         'repeat', 'speedup', 'identical'))
+   for n_detectors in (16, 100):
+      med = synthetic_med(n_detectors, nchans)
+      data = med.get_data()
+      def original():
+         ref_energy = med.mcas[0].get_energy()
+         aligned = Numeric.zeros(data.shape, int)
+         for i in range(n_detectors):
+            energy = med.mcas[i].get_energy()
+            temp = original_spline_interpolate(energy, data[i], ref_energy)
+            aligned[i] = (temp+.5).astype(int)
+         return aligned
+      def first():
+         med.alignment = None
+         return med.get_data(align=1)
+      t_orig, aligned0 = timeit(original)
+      t_first, aligned1 = timeit(first)
+      t_repeat, aligned2 = timeit(med.get_data, align=1)
+      print('%10d %10.4f %10.4f %10.4f %8.1f %s' % (n_detectors, t_orig,
+            t_first, t_repeat, t_orig/t_repeat,
+            Numeric.array_equal(aligned0, aligned1) and
+            Numeric.array_equal(aligned0, aligned2)))
+
+########################################################################
+def benchmark_rebin(nchans=2048, nframes=10):
+   """
+   Med.get_data(total=1) of aligned spectra, with the spline interpolation
+   of align=1 versus the rebin matrices of align=2, for nframes new frames
+   of data with unchanged calibrations.  The detectors have slopes that are
+   up to 1% smaller than the first, so all of their counts fall within its
+   energy range, and "counts" is the total of the summed spectrum divided by
+   the total of the original spectra.
+   """
+   print('Med.get_data(total=1, align=...), %d channels, %d frames' %
+         (nchans, nframes))
+   print('%10s %10s %10s %10s %10s %8s' % ('detectors', 'spline', 'counts',
+         'rebin', 'counts', 'speedup'))
+   for n_detectors in (16, 100):
+      med = synthetic_med(n_detectors, nchans)
+      slope = med.mcas[0].calibration.slope
+      for i in range(n_detectors):
+         med.mcas[i].calibration.slope = slope*(1.-.01*i/n_detectors)
+      frames = [med.get_data()*(i+1) for i in range(nframes)]
+      def sum_frames(align):
+         for frame in frames:
+            for i in range(n_detectors): med.mcas[i].set_data(frame[i])
+            result = med.get_data(total=1, align=align)
+         return result
+      t_spline, spline_sum = timeit(sum_frames, 1)
+      t_rebin, rebin_sum = timeit(sum_frames, 2)
+      total = float(Numeric.sum(frames[-1]))
+      print('%10d %10.4f %10.6f %10.4f %10.6f %8.1f' % (n_detectors,
+            t_spline/nframes, Numeric.sum(spline_sum)/total, t_rebin/nframes,
+            Numeric.sum(rebin_sum)/total, t_spline/t_rebin))
+
+########################################################################
+def benchmark_calibration(npositions=5000, nchans=8192):
+   """
+   Mca.energy_to_channel(), d_to_channel() and channel_to_energy() called for
+   each position in turn, as the display and calibration code did, versus
+   one call with an array of positions, and Mca.get_energy() and get_d()
+   computed versus cached.
+   """
+   mca = Mca.Mca()
+   mca.set_data(Numeric.zeros(nchans, int))
+   mca.set_calibration(Mca.McaCalibration(offset=-.05, slope=.0025,
+                                          quad=1.e-8, two_theta=12.))
+   energy = Numeric.linspace(1., 20., npositions)
+   d = 12.398 / (2. * energy * Numeric.sin(6.*Numeric.pi/180.))
+   chans = Numeric.linspace(0., nchans-1, npositions)
+   print('%d positions, %d channels' % (npositions, nchans))
+   print('%20s %10s %10s %8s %s' % ('conversion', 'each', 'array', 'speedup',
+         'identical'))
+   for (name, function, values) in (
+         ('energy_to_channel', mca.energy_to_channel, energy),
+         ('d_to_channel', mca.d_to_channel, d),
+         ('channel_to_energy', mca.channel_to_energy, chans)):
+      t_each, each = timeit(lambda: [function(v) for v in values.tolist()])
+      t_array, array = timeit(function, values)
+      print('%20s %10.6f %10.6f %8.1f %s' % (name, t_each, t_array,
+            t_each/t_array, Numeric.allclose(each, array, rtol=0, atol=0)))
+   def computed():
+      mca.set_calibration(mca.calibration)
+      return mca.get_energy(), mca.get_d()
+   t_computed = timeit(computed)[0]
+   t_cached = timeit(lambda: (mca.get_energy(), mca.get_d()))[0]
+   print('%20s %10.6f %10.6f %8.1f' % ('get_energy, get_d', t_computed,
+         t_cached, t_computed/t_cached))
+
+########################################################################
+def synthetic_jcpds(hmax=8):
+   """
+   Returns a triclinic jcpds object with a reflection for every H, K, L from
+   0 to hmax.
+   """
+   j = jcpds.jcpds()
+   j.symmetry = 'TRICLINIC'
+   j.k0 = 200.
+   j.k0p0 = 4.
+   j.alphat0 = 2.e-5
+   (j.a0, j.b0, j.c0) = (4.5, 5.2, 6.1)
+   (j.alpha0, j.beta0, j.gamma0) = (85., 95., 100.)
+   j.compute_v0()
+   (j.alpha, j.beta, j.gamma) = (j.alpha0, j.beta0, j.gamma0)
+   for h in range(hmax+1):
+      for k in range(hmax+1):
+         for l in range(hmax+1):
+            if (h == 0 and k == 0 and l == 0): continue
+            r = jcpds.jcpds_reflection()
+            (r.h, r.k, r.l) = (h, k, l)
+            j.reflections.append(r)
+   return j
+
+def original_compute_d(j, pressure, temperature):
+   """
+   The per-reflection loop of jcpds.compute_d() before the D spacings were
+   computed with arrays, for the triclinic case only.
+   """
+   j.compute_volume(pressure, temperature)
+   ratio = (j.v / j.v0)**(1.0/3.0)
+   a = j.a0 * ratio
+   b = j.b0 * ratio
+   c = j.c0 * ratio
+   dtor = math.pi/180.
+   alpha = j.alpha * dtor
+   beta = j.beta * dtor
+   gamma = j.gamma * dtor
+   for r in j.get_reflections():
+      h = float(r.h)
+      k = float(r.k)
+      l = float(r.l)
+      V = (a**2 * b**2 * c**2 * 
+          (1. - math.cos(alpha)**2 - math.cos(beta)**2 - 
+                                                     math.cos(gamma)**2 + 
+           2 * math.cos(alpha) * math.cos(beta) * math.cos(gamma)))
+      s11 = b**2 * c**2 * math.sin(alpha)**2
+      s22 = a**2 * c**2 * math.sin(beta)**2
+      s33 = a**2 * b**2 * math.sin(gamma)**2
+      s12 = a * b * c**2 * (math.cos(alpha) * math.cos(beta) - 
+                                                     math.cos(gamma))
+      s23 = a**2 * b * c * (math.cos(beta) * math.cos(gamma) - 
+                                                     math.cos(alpha))
+      s31 = a * b**2 * c * (math.cos(gamma) * math.cos(alpha) - 
+                                                     math.cos(beta))
+      d2inv = (s11 * h**2 + s22 * k**2 + s33 * l**2 + 
+              2.*s12*h*k + 2.*s23*k*l + 2.*s31*l*h) / V**2
+      r.d = math.sqrt(1./d2inv)
+
+def benchmark_jcpds(hmax=8, npressures=20, ntemperatures=5):
+   """
+   jcpds.compute_d() computing each reflection in a loop versus with arrays,
+   and a grid of pressures and temperatures computed one point at a time
+   versus with jcpds.compute_d_grid().
+   """
+   j = synthetic_jcpds(hmax)
+   pressures = Numeric.linspace(0., 100., npressures)
+   temperatures = Numeric.linspace(300., 2000., ntemperatures)
+   print('%d reflections, %d pressures, %d temperatures' %
+         (len(j.get_reflections()), npressures, ntemperatures))
+   def loop(function):
+      d = Numeric.zeros((npressures, ntemperatures, len(j.get_reflections())))
+      for i in range(npressures):
+         for k in range(ntemperatures):
+            function(pressures[i], temperatures[k])
+            d[i,k] = [r.d for r in j.get_reflections()]
+      return d
+   t_loop = timeit(original_compute_d, j, 50., 1000.)[0]
+   d_loop = [r.d for r in j.get_reflections()]
+   t_array = timeit(j.compute_d, 50., 1000.)[0]
+   d_array = [r.d for r in j.get_reflections()]
+   print('%20s %10s %10s %8s %s' % ('', 'loop', 'array', 'speedup',
+         'max difference'))
+   print('%20s %10.6f %10.6f %8.1f %g' % ('compute_d', t_loop, t_array,
+         t_loop/t_array, Numeric.abs(Numeric.subtract(d_loop, d_array)).max()))
+   t_loop, d_loop = timeit(loop, lambda p, t: original_compute_d(j, p, t))
+   t_grid, d_grid = timeit(j.compute_d_grid, pressures, temperatures)
+   print('%20s %10.6f %10.6f %8.1f %g' % ('compute_d_grid', t_loop, t_grid,
+         t_loop/t_grid, Numeric.abs(d_loop - d_grid).max()))
+
+########################################################################
+def original_compute_volume(j, pressure, temperature):
+   """
+   jcpds.compute_volume() before the Birch-Murnaghan equation was solved with
+   arrays: one CARSMath.newton() secant solve per pressure.
+   """
+   if (temperature == 0): temperature=298.
+   j.alphat = j.alphat0 + j.dalphadt*(temperature-298.)
+   j.k0p = j.k0p0 + j.dk0pdt*(temperature-298.)
+   if (pressure == 0.):
+      j.v = j.v0 * (1 + j.alphat*(temperature-298.))
+   else:
+      j.mod_pressure = pressure - j.alphat*j.k0*(temperature-298.)
+      j.v = j.v0/CARSMath.newton(j.bm3_inverse, 1.)
+
+def benchmark_bm3(npressures=5000):
+   """
+   The unit cell volume for many pressure and temperature pairs, as for the
+   pressure calibration of a series of diffraction patterns, solved one
+   pair at a time versus with jcpds.compute_volumes().
+   """
+   j = synthetic_jcpds(1)
+   pressures = Numeric.linspace(0., 150., npressures)
+   temperatures = Numeric.linspace(300., 2500., npressures)
+   def loop():
+      v = Numeric.zeros(npressures)
+      for i in range(npressures):
+         original_compute_volume(j, pressures[i], temperatures[i])
+         v[i] = j.v
+      return v
+   t_loop, v_loop = timeit(loop)
+   t_array, v_array = timeit(j.compute_volumes, pressures, temperatures)
+   print('%d pressures' % npressures)
+   print('%20s %10s %10s %8s %s' % ('', 'loop', 'array', 'speedup',
+         'max relative difference'))
+   print('%20s %10.6f %10.6f %8.1f %g' % ('compute_volumes', t_loop, t_array,
+         t_loop/t_array, Numeric.abs(v_array/v_loop - 1.).max()))
+
+benchmarks = {'timer': benchmark_timer,
+              'bm3': benchmark_bm3,
+              'jcpds': benchmark_jcpds,
+              'calibration': benchmark_calibration,
+              'rebin': benchmark_rebin,
+              'align': benchmark_align,
+              'extract_rois': benchmark_extract_rois,
+              'roi_counts': benchmark_roi_counts,
+              'refresh': benchmark_refresh,
+              'display': benchmark_display,
+              'array_transfer': benchmark_array_transfer,
+              'med_readout': benchmark_med_readout,
+              'cache': benchmark_cache,
+              'connect': benchmark_connect,
+              'async_pv': benchmark_async_pv,
+              'acquire_wait': benchmark_acquire_wait,
+              'mapped_med': benchmark_mapped_med,
+              'netcdf': benchmark_netcdf,
+              'file_io': benchmark_file_io,
+              'fit_many': benchmark_fit_many,
+              'predict_gaussian_spectrum': benchmark_predict_gaussian_spectrum,
+              'fit_peaks': benchmark_fit_peaks,
+              'fit_background': benchmark_fit_background,
+              'med_fit_background': benchmark_med_fit_background}
+
+if (__name__ == '__main__'):
+   names = sys.argv[1:]
+   if (len(names) == 0): names = list(benchmarks.keys())
+   for name in names:
+      benchmarks[name]()
+      print('')
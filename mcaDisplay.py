@@ -15,9 +15,21 @@ Modifications:
       - Remember MCA detector name and use it as default
    Sept. 26, 2002 MLR
       - Fixed bugs in the "Add Peaks" and "Add ROIs" functions of JCPDS.
+   Oct. 18, 2026
+      - Detectors are opened in cached mode, so the timer does not read the
+        calibration, presets, elapsed time and ROIs over the network.
+      - Added mcaDisplay_plot.  update_spectrum() decimates the visible range
+        to the width of the plot, and only sends elements whose data or
+        bounds have changed.
+      - Added mcaDisplay_refresh.  timer() only looks at a detector when its
+        monitors have fired, and lengthens the interval when drawing is
+        slow.  The frame rate and the number of dropped frames are shown
+        under the elapsed time.
+      - draw_jcpds() converts all of the reflections to channels at once.
 """
 import os
 import math
+import time
 # import cPickle
 import pickle as cPickle
 import numpy as np
@@ -77,6 +89,7 @@ class mcaDisplay_file:
 class mcaDisplay_display:
    def __init__(self):
       self.update_time = .5
+      self.decimate    = 1 # Draw min/max of channels in each pixel column
       self.current_time = 0.
       self.current_counts = 0
       self.current_bgd = 0
@@ -146,6 +159,155 @@ class mcaDisplay_mca:
       self.elapsed      = Mca.McaElapsed()
       self.roi          = []
 
+############################################################
+class mcaDisplay_plot:
+   """
+   Sends spectra to the Blt graph.  When decimate is set and the visible
+   range has more channels than the plot has pixels, each pixel column is
+   drawn as the minimum and maximum of the channels it covers.  This looks the
+   same as plotting every channel, but sends much less data to Tk.
+   The x vectors are cached, and an element is only configured again when its
+   data or bounds have changed.
+   """
+   def __init__(self, graph, decimate=1):
+      self.graph    = graph
+      self.decimate = decimate
+      self.xcache   = {}   # x vectors, indexed by (first, last, npixels)
+      self.sent     = {}   # (xdata, ydata) last sent to each element
+      self.shown    = None # Arguments of the last element_show()
+      self.logscale = None # Arguments of the last yaxis_configure()
+
+   def invalidate(self):
+      """ Forces all elements to be sent again on the next draw """
+      self.sent = {}
+      self.shown = None
+      self.logscale = None
+
+   def width(self):
+      """ Returns the width of the plot in pixels """
+      width = self.graph.winfo_width()
+      # The window is 1 pixel wide until it has been mapped
+      if (width <= 1): width = 1000
+      return width
+
+   def xdata(self, first, last, npixels):
+      key = (first, last, npixels)
+      xdata = self.xcache.get(key)
+      if (xdata == None):
+         if (npixels == 0):
+            xdata = tuple(range(first, last+1))
+         else:
+            xdata = tuple(np.repeat(self.columns(first, last, npixels),
+                                    2).tolist())
+         if (len(self.xcache) > 100): self.xcache.clear()
+         self.xcache[key] = xdata
+      return xdata
+
+   def columns(self, first, last, npixels):
+      # The first channel in each pixel column
+      nchans = last - first + 1
+      return first + (np.arange(npixels) * nchans) // npixels
+
+   def element(self, name, data, first, last, npixels=None):
+      """
+      Draws channels first to last of data in an element.  npixels is the
+      number of pixel columns these channels span, the default is the plot
+      width.
+      """
+      if (npixels == None): npixels = self.width()
+      nchans = last - first + 1
+      if ((not self.decimate) or (nchans <= 2*npixels)): npixels = 0
+      xdata = self.xdata(first, last, npixels)
+      ydata = np.asarray(data[first:last+1])
+      if (npixels):
+         offsets = self.columns(first, last, npixels) - first
+         y = np.empty(2*npixels, ydata.dtype)
+         y[0::2] = np.minimum.reduceat(ydata, offsets)
+         y[1::2] = np.maximum.reduceat(ydata, offsets)
+         ydata = y
+      ydata = tuple(ydata.tolist())
+      sent = self.sent.get(name)
+      if ((sent != None) and (sent[0] is xdata) and (sent[1] == ydata)):
+         return
+      self.graph.element_configure(name, xdata=xdata, ydata=ydata)
+      self.sent[name] = (xdata, ydata)
+
+   def show(self, elements, logscale):
+      """ Shows the list of elements, with a log or linear y axis """
+      if (logscale != self.logscale):
+         self.graph.yaxis_configure(logscale=logscale)
+         self.logscale = logscale
+      if (elements != self.shown):
+         self.graph.element_show(elements)
+         self.shown = elements
+
+############################################################
+class mcaDisplay_refresh:
+   """
+   Schedules the display updates done by mcaDisplay.timer().
+   - Monitor events are coalesced: an update only looks at a detector if its
+     monitor counts have changed, and several new spectra that arrived since
+     the last update are drawn once.  The ones that were not drawn are counted
+     as dropped frames.
+   - The interval between updates is the display update time, lengthened
+     so that drawing takes at most the fraction max_load of the time.
+     This keeps the GUI responsive when drawing is slow.
+   """
+   def __init__(self, update_time=.5, max_load=.5):
+      self.update_time = update_time
+      self.max_load    = max_load
+      self.interval    = update_time # Time until the next update
+      self.draw_time   = 0.          # Average time to draw a frame
+      self.start_time  = 0.
+      self.counts      = {}          # Monitor counts at the last update
+      self.frames      = 0           # Frames drawn
+      self.dropped     = 0           # Frames dropped
+      self.fps         = 0.          # Frames per second
+      self.fps_time    = time.time()
+      self.fps_frames  = 0
+
+   def new_events(self, name, mca):
+      """
+      Returns the number of new acquire status, elapsed time and data events
+      from mca.get_monitor_counts() since the last call for name, or None if
+      there are none.  All events are new if the mca for name has changed.
+      """
+      counts = mca.get_monitor_counts()
+      previous = self.counts.get(name)
+      if ((previous == None) or (previous[0] is not mca)):
+         previous = (mca, (0,) * len(counts))
+      if (previous[1] == counts): return None
+      self.counts[name] = (mca, counts)
+      return tuple([c-p for c,p in zip(counts, previous[1])])
+
+   def start(self):
+      """
+      Called at the start of an update.
+      """
+      self.start_time = time.time()
+
+   def stop(self, drew=0):
+      """
+      Called at the end of an update.  drew is the number of new frames that
+      were available; 1 was drawn and the rest were dropped.  Computes the
+      interval until the next update.  Returns 1 if the frame rate has been
+      recomputed.
+      """
+      now = time.time()
+      if (drew):
+         cost = now - self.start_time
+         if (self.frames == 0): self.draw_time = cost
+         else: self.draw_time = .8*self.draw_time + .2*cost
+         self.frames = self.frames + 1
+         self.fps_frames = self.fps_frames + 1
+         self.dropped = self.dropped + drew - 1
+      self.interval = max(self.update_time, self.draw_time/self.max_load)
+      if (now - self.fps_time < max(1., 2.*self.interval)): return 0
+      self.fps = self.fps_frames / (now - self.fps_time)
+      self.fps_time = now
+      self.fps_frames = 0
+      return 1
+
 
 ############################################################
 class mcaDisplay:
@@ -200,6 +362,7 @@ class mcaDisplay:
       self.new_inputs()
       if (file != None): self.open_file(file)
       if (detector != None): self.open_detector(detector)
+      self.refresh = mcaDisplay_refresh(self.display.update_time)
       self.after_id=self.widgets.top.after(
                             int(self.display.update_time*1000), self.timer)
 
@@ -343,6 +506,20 @@ class mcaDisplay:
                                 foreground=self.colors.label_foreground,
                                 background=self.colors.label_background)
       t.pack(side=LEFT)
+      row = Frame(status); row.pack()
+      t = Label(row, text='FPS:', width=5); t.pack(side=LEFT)
+      self.widgets.fps = t = Label(row, width=8, relief='groove',
+                                text='0.0',
+                                foreground=self.colors.label_foreground,
+                                background=self.colors.label_background)
+      t.pack(side=LEFT)
+      row = Frame(status); row.pack()
+      t = Label(row, text='Drop:', width=5); t.pack(side=LEFT)
+      self.widgets.dropped = t = Label(row, width=8, relief='groove',
+                                text='0',
+                                foreground=self.colors.label_foreground,
+                                background=self.colors.label_background)
+      t.pack(side=LEFT)
 
       roi = Frame(control_column, borderwidth=1, relief='solid')
       roi.pack(anchor=N, fill=X, pady=fypad)
@@ -441,6 +618,7 @@ class mcaDisplay:
          roi = 'ROI'+str(i)
          t.line_create(roi, symbol="", label="", pixels=2, color=self.colors.roi)
       t.legend_configure(hide=1)
+      self.plot = mcaDisplay_plot(t, self.display.decimate)
       self.markers = {'left': 'MarkersLeft',
                       'right': 'MarkersRight',
                       'cursor': 'MarkersCursor'}
@@ -1019,12 +1197,21 @@ class mcaDisplay:
 
    ############################################################
    def timer(self):
+      refresh = self.refresh
+      refresh.update_time = self.display.update_time
+      refresh.start()
       redraw_needed = 0
       stats_changed = 0
       # if (self.windows.mouse_button == 0):
       if (1):
          if ((self.foreground.mca != None) and
             (self.foreground.is_detector)):
+            # Only look at the detector if one of its monitors has fired
+            events = refresh.new_events('foreground', self.foreground.mca)
+         else:    # Foreground is not detector
+            events = None
+            self.display.current_acqg = 0
+         if (events != None):
             new_flag = self.foreground.mca.new_acquire_status()
             if (new_flag):
                acqg = self.foreground.mca.get_acquire_status()
@@ -1057,15 +1244,17 @@ class mcaDisplay:
                self.display.current_time = self.foreground.elapsed.read_time
                self.display.prev_counts = self.display.current_counts
                self.display.prev_bgd = self.display.current_bgd
-               redraw_needed = 1
-         else:    # Foreground is not detector
-            self.display.current_acqg = 0
+               redraw_needed = max(events[2], 1)
 
          if (self.background.mca != None) and (self.background.is_detector):
+            events = refresh.new_events('background', self.background.mca)
+         else:
+            events = None
+         if (events != None):
             new_flag = self.background.mca.new_data()
             if (new_flag):
                self.background.data = self.background.mca.get_data()
-               redraw_needed = 1
+               redraw_needed = max(redraw_needed, 1)
             new_flag = self.background.mca.new_elapsed()
             if (new_flag):
                self.background.elapsed = self.background.mca.get_elapsed()
@@ -1074,22 +1263,27 @@ class mcaDisplay:
          stats_changed = 1  # User is moving cursor or markers
       if (redraw_needed): self.update_spectrum()
       if (stats_changed): self.show_stats()
+      if (refresh.stop(redraw_needed)):
+         self.widgets.fps.configure(text='%.1f' % refresh.fps)
+         self.widgets.dropped.configure(text=str(refresh.dropped))
       self.after_id=self.widgets.top.after(
-                            int(self.display.update_time*1000), self.timer)
+                            int(refresh.interval*1000), self.timer)
 
 
    ############################################################
    def update_spectrum(self, rescale=0):
       graph = self.widgets.plot
+      plot = self.plot
+      plot.decimate = self.display.decimate
       hmax = min((self.display.hmax), (self.foreground.nchans-1))
       hmin = max(self.display.hmin, 0)
-      xdata = tuple(range(hmin, hmax+1))
       if (rescale):
          graph.xaxis_configure(max=hmax, min=hmin)
+         plot.invalidate()
+      # ROIs are decimated on the same scale as the spectra
+      npixels = plot.width()
       if (self.foreground.valid):
-         ydata = self.foreground.data[hmin:hmax+1]
-         graph.element_configure('foreground', xdata=xdata,
-                                               ydata=tuple(ydata))
+         plot.element('foreground', self.foreground.data, hmin, hmax, npixels)
 #            visible_data = self.foreground.data[self.display.hmin:
 #                                                self.display.hmax+1]
 #            ymin = min(visible_data)
@@ -1101,9 +1295,7 @@ class mcaDisplay:
          # There is a bug in Blt log plot if all channels are 0, sets
          # small minimum.  Work around by setting channel 0 to 1 for now
          self.background.data[0]=1
-         ydata = self.background.data[hmin:hmax+1]
-         graph.element_configure('background', xdata=xdata,
-                                               ydata=tuple(ydata))
+         plot.element('background', self.background.data, hmin, hmax, npixels)
          display.append('background')
       for i in range(self.foreground.nrois):
          roi = 'ROI'+str(i)
@@ -1112,12 +1304,11 @@ class mcaDisplay:
          if (left > hmax) or (right < hmin): continue
          left = max(left, hmin)
          right = min(right, hmax)
-         graph.element_configure(roi,
-                                 xdata=tuple(range(left, right)),
-                                 ydata=tuple(self.foreground.data[left:right]))
+         if (right <= left): continue
+         plot.element(roi, self.foreground.data, left, right-1,
+                      (npixels * (right-left)) // (hmax-hmin+1))
          display.append(roi)
-      graph.yaxis_configure(logscale=self.display.vlog)
-      graph.element_show(display)
+      plot.show(display, self.display.vlog)
 
       self.lmarker(self.display.lmarker)
       self.rmarker(self.display.rmarker)
@@ -1395,7 +1586,9 @@ class mcaDisplay:
    ############################################################
    def open_detector(self, name, background=0):
       try:
-         mca = hardwareMca.hardwareMca(name)
+         # The timer reads the calibration, elapsed time, etc. repeatedly, so
+         # these are served from monitors rather than read each time
+         mca = hardwareMca.hardwareMca(name, cache=1)
          self.open(mca, name, background=background)
       except:
          tkMessageBox.showerror(title='mcaDisplay Error',
@@ -1764,8 +1957,8 @@ class mcaDisplay:
       for m in markers: graph.marker_configure(m, hide=1)
       material = jcpds.name
       marker = 0
-      for r in refl:
-         chan = self.foreground.mca.d_to_channel(r.d, clip=1)
+      chans = self.foreground.mca.d_to_channel([r.d for r in refl], clip=1)
+      for chan in chans.tolist():
          # Change marker coordinates
          graph.marker_configure(markers[marker], hide=0,
                               coords=(chan, '-Inf', chan, 'Inf'))
@@ -135,7 +135,7 @@ Perform Levenberg-Marquardt least-squares minimization, based on MINPACK-1.
     # stop the calculation.
     status = 0
     if (dojac):
-       pderiv = Numeric.zeros([len(x), len(p)], Numeric.Float)
+       pderiv = Numeric.zeros([len(x), len(p)], float)
        for j in range(len(p)):
          pderiv[:,j] = FGRAD(x, p, j)
     else:
@@ -403,7 +403,6 @@ Perform Levenberg-Marquardt least-squares minimization, based on MINPACK-1.
 
 # import Numeric
 import numpy as Numeric
-import types
 
 
 #     Original FORTRAN documentation
@@ -865,33 +864,33 @@ Keywords:
          return
 
       ## Parameters can either be stored in parinfo, or x. x takes precedence if it exists
-      if (xall == None) and (parinfo == None):
+      if (xall is None) and (parinfo is None):
          self.errmsg = 'ERROR: must pass parameters in P or PARINFO'
          return
 
       ## Be sure that PARINFO is of the right type
-      if (parinfo != None):
-         if (type(parinfo) != types.ListType):
+      if (parinfo is not None):
+         if (type(parinfo) != list):
             self.errmsg = 'ERROR: PARINFO must be a list of dictionaries.'
             return
          else:
-            if (type(parinfo[0]) != types.DictionaryType):
+            if (type(parinfo[0]) != dict):
               self.errmsg = 'ERROR: PARINFO must be a list of dictionaries.'
               return
-         if ((xall != None) and (len(xall) != len(parinfo))):
+         if ((xall is not None) and (len(xall) != len(parinfo))):
             self.errmsg = 'ERROR: number of elements in PARINFO and P must agree'
             return
 
       ## If the parameters were not specified at the command line, then
       ## extract them from PARINFO
-      if (xall == None):
+      if (xall is None):
          xall = self.parinfo(parinfo, 'value')
-         if (xall == None):
+         if (xall is None):
             self.errmsg = 'ERROR: either P or PARINFO(*)["value"] must be supplied.'
             return
 
-      ## Make sure parameters are Numeric arrays of type Numeric.Float
-      xall = Numeric.asarray(xall, Numeric.Float)
+      ## Make sure parameters are Numeric arrays of type float
+      xall = Numeric.asarray(xall, float)
 
       npar = len(xall)
       self.fnorm  = -1.
@@ -921,15 +920,15 @@ Keywords:
       minstep = self.parinfo(parinfo, 'mpminstep', default=0., n=npar)
       qmin = minstep * 0  ## Remove minstep for now!!
       qmax = maxstep != 0
-      wh = Numeric.nonzero(((qmin!=0.) & (qmax!=0.)) & (maxstep < minstep))
+      wh = Numeric.nonzero(((qmin!=0.) & (qmax!=0.)) & (maxstep < minstep))[0]
       if (len(wh) > 0):
          self.errmsg = 'ERROR: MPMINSTEP is greater than MPMAXSTEP'
          return
-      wh = Numeric.nonzero((qmin!=0.) & (qmax!=0.))
+      wh = Numeric.nonzero((qmin!=0.) & (qmax!=0.))[0]
       qminmax = len(wh > 0)
 
       ## Finish up the free parameters
-      ifree = Numeric.nonzero(pfixed != 1)
+      ifree = Numeric.nonzero(pfixed != 1)[0]
       nfree = len(ifree)
       if nfree == 0:
          self.errmsg = 'ERROR: no free parameters'
@@ -942,16 +941,16 @@ Keywords:
       ## LIMITED parameters ?
       limited = self.parinfo(parinfo, 'limited', default=[0,0])
       limits = self.parinfo(parinfo, 'limits', default=[0.,0.])
-      if (limited != None) and (limits != None):
+      if (limited is not None) and (limits is not None):
          ## Error checking on limits in parinfo
          wh = Numeric.nonzero((limited[:,0] & (xall < limits[:,0])) |
-                              (limited[:,1] & (xall > limits[:,1])))
+                              (limited[:,1] & (xall > limits[:,1])))[0]
          if (len(wh) > 0):
             self.errmsg = 'ERROR: parameters are not within PARINFO limits'
             return
          wh = Numeric.nonzero((limited[:,0] & limited[:,1]) &
                               (limits[:,0] >= limits[:,1]) &
-                              (pfixed == 0))
+                              (pfixed == 0))[0]
          if (len(wh) > 0):
             self.errmsg = 'ERROR: PARINFO parameter limits are not consistent'
             return
@@ -962,7 +961,7 @@ Keywords:
          qllim = Numeric.take(limited[:,0], ifree)
          llim  = Numeric.take(limits [:,0], ifree)
 
-         wh = Numeric.nonzero((qulim!=0.) | (qllim!=0.))
+         wh = Numeric.nonzero((qulim!=0.) | (qllim!=0.))[0]
          if (len(wh) > 0): qanylim = 1
          else: qanylim = 0
       else:
@@ -983,12 +982,12 @@ Keywords:
       if (rescale != 0):
          self.errmsg = 'ERROR: DIAG parameter scales are inconsistent'
          if (len(diag) < n): return
-         wh = Numeric.nonzero(diag <= 0)
+         wh = Numeric.nonzero(diag <= 0)[0]
          if (len(wh) > 0): return
          self.errmsg = ''
 
-      # Make sure x is a Numeric array of type Numeric.Float
-      x = Numeric.asarray(x, Numeric.Float)
+      # Make sure x is a Numeric array of type float
+      x = Numeric.asarray(x, float)
       
       [self.status, fvec] = self.call(fcn, self.params, functkw)
       if (self.status < 0):
@@ -1017,7 +1016,7 @@ Keywords:
          Numeric.put(self.params, ifree, x)
          if (self.qanytied): self.params = self.tie(self.params, ptied)
 
-         if (nprint > 0) and (iterfunct != None):
+         if (nprint > 0) and (iterfunct is not None):
             if (((self.niter-1) % nprint) == 0):
                mperr = 0
                xnew0 = self.params.copy()
@@ -1026,7 +1025,7 @@ Keywords:
                status = iterfunct(fcn, self.params, self.niter, self.fnorm**2, 
                   functkw=functkw, parinfo=parinfo, quiet=quiet, 
                   dof=dof, **iterkw)
-               if (status != None): self.status = status
+               if (status is not None): self.status = status
 
                ## Check for user termination
                if (self.status < 0):  
@@ -1046,16 +1045,16 @@ Keywords:
                        epsfcn=epsfcn, 
                        autoderivative=autoderivative, dstep=dstep, 
                        functkw=functkw, ifree=ifree, xall=self.params)
-         if (fjac == None):
+         if (fjac is None):
             self.errmsg = 'WARNING: premature termination by FDJAC2'
             return
 
          ## Determine if any of the parameters are pegged at the limits
          if (qanylim):
             catch_msg = 'zeroing derivatives of pegged parameters'
-            whlpeg = Numeric.nonzero(qllim & (x == llim))
+            whlpeg = Numeric.nonzero(qllim & (x == llim))[0]
             nlpeg = len(whlpeg)
-            whupeg = Numeric.nonzero(qulim & (x == ulim))
+            whupeg = Numeric.nonzero(qulim & (x == ulim))[0]
             nupeg = len(whupeg)
             ## See if any "pegged" values should keep their derivatives
             if (nlpeg > 0):
@@ -1078,7 +1077,7 @@ Keywords:
          if (self.niter == 1):
             if ((rescale==0) or (len(diag) < n)):
                diag = wa2.copy()
-               wh = Numeric.nonzero(diag == 0)
+               wh = Numeric.nonzero(diag == 0)[0]
                Numeric.put(diag, wh, 1.)
       
             ## On the first iteration, calculate the norm of the scaled x
@@ -1168,12 +1167,12 @@ Keywords:
                         Numeric.take(wa1, whupeg), min(wa1), 0.))
 
                   dwa1 = abs(wa1) > machep
-                  whl = Numeric.nonzero(((dwa1!=0.) & qllim) & ((x + wa1) < llim))
+                  whl = Numeric.nonzero(((dwa1!=0.) & qllim) & ((x + wa1) < llim))[0]
                   if (len(whl) > 0):
                      t = ((Numeric.take(llim, whl) - Numeric.take(x, whl)) /
                            Numeric.take(wa1, whl))
                      alpha = min(alpha, min(t))
-                  whu = Numeric.nonzero(((dwa1!=0.) & qulim) & ((x + wa1) > ulim))
+                  whu = Numeric.nonzero(((dwa1!=0.) & qulim) & ((x + wa1) > ulim))[0]
                   if (len(whu) > 0):
                      t = ((Numeric.take(ulim, whu) - Numeric.take(x, whu)) /
                            Numeric.take(wa1, whu))
@@ -1182,7 +1181,7 @@ Keywords:
                ## Obey any max step values.
                if (qminmax):
                   nwa1 = wa1 * alpha
-                  whmax = Numeric.nonzero((qmax != 0.) & (maxstep > 0))
+                  whmax = Numeric.nonzero((qmax != 0.) & (maxstep > 0))[0]
                   if (len(whmax) > 0):
                      mrat = max(Numeric.take(nwa1, whmax) /
                                 Numeric.take(maxstep, whmax))
@@ -1194,9 +1193,9 @@ Keywords:
 
                ## Adjust the final output values.  If the step put us exactly
                ## on a boundary, make sure it is exact.
-               wh = Numeric.nonzero((qulim!=0.) & (wa2 >= ulim*(1-machep)))
+               wh = Numeric.nonzero((qulim!=0.) & (wa2 >= ulim*(1-machep)))[0]
                if (len(wh) > 0): Numeric.put(wa2, wh, Numeric.take(ulim, wh))
-               wh = Numeric.nonzero((qllim!=0.) & (wa2 <= llim*(1+machep)))
+               wh = Numeric.nonzero((qllim!=0.) & (wa2 <= llim*(1+machep)))[0]
                if (len(wh) > 0): Numeric.put(wa2, wh, Numeric.take(llim, wh))
             # endelse
             wa3 = diag * wa1
@@ -1302,15 +1301,15 @@ Keywords:
          catch_msg = 'in the termination phase'
          self.fnorm = self.enorm(fvec)
 
-      if ((self.fnorm != None) and (fnorm1 != None)):
+      if ((self.fnorm is not None) and (fnorm1 is not None)):
          self.fnorm = max([self.fnorm, fnorm1])
          self.fnorm = self.fnorm**2.
 
       self.covar = None
       self.perror = None
       ## (very carefully) set the covariance matrix COVAR
-      if ((self.status > 0) and (nocovar==0) and (n != None)
-                     and (fjac != None) and (ipvt != None)):
+      if ((self.status > 0) and (nocovar==0) and (n is not None)
+                     and (fjac is not None) and (ipvt is not None)):
          sz = Numeric.shape(fjac)
          if ((n > 0) and (sz[0] >= n) and (sz[1] >= n)
              and (len(ipvt) >= n)):
@@ -1321,16 +1320,16 @@ Keywords:
           
             ## Fill in actual covariance matrix, accounting for fixed
             ## parameters.
-            self.covar = Numeric.zeros([nn, nn], Numeric.Float)
+            self.covar = Numeric.zeros([nn, nn], float)
             for i in range(n):
                indices = ifree+ifree[i]*n
                Numeric.put(self.covar, indices, cv[:,i])
           
             ## Compute errors in parameters
             catch_msg = 'computing parameter errors'
-            self.perror = Numeric.zeros(nn, Numeric.Float)
+            self.perror = Numeric.zeros(nn, float)
             d = Numeric.diagonal(self.covar)
-            wh = Numeric.nonzero(d >= 0)
+            wh = Numeric.nonzero(d >= 0)[0]
             if len(wh) > 0:
               Numeric.put(self.perror, wh, Numeric.sqrt(Numeric.take(d, wh)))
       return
@@ -1344,7 +1343,7 @@ Keywords:
 
       if (self.debug): print('Entering defiter...')
       if (quiet): return
-      if (fnorm == None):
+      if (fnorm is None):
          [status, fvec] = self.call(fcn, x, functkw)
          fnorm = self.enorm(fvec)**2
 
@@ -1352,11 +1351,11 @@ Keywords:
       nprint = len(x)
       print("Iter ", ('%6i' % iter),"   CHI-SQUARE = ",('%.10g' % fnorm)," DOF = ", ('%i' % dof))
       for i in range(nprint):
-         if (parinfo != None) and (parinfo[i].has_key('parname')):
+         if (parinfo is not None) and ('parname' in parinfo[i]):
             p = '   ' + parinfo[i]['parname'] + ' = '
          else:
             p = '   P' + str(i) + ' = '
-         if (parinfo != None) and (parinfo[i].has_key('mpprint')):
+         if (parinfo is not None) and ('mpprint' in parinfo[i]):
             iprint = parinfo[i]['mpprint']
          else:
             iprint = 1
@@ -1384,25 +1383,25 @@ Keywords:
    ## Procedure to parse the parameter values in PARINFO, which is a list of dictionaries
    def parinfo(self, parinfo=None, key='a', default=None, n=0):
       if (self.debug): print('Entering parinfo...')
-      if (n == 0) and (parinfo != None): n = len(parinfo)
+      if (n == 0) and (parinfo is not None): n = len(parinfo)
       if (n == 0):
          values = default
          return(values)
 
       values = []
       for i in range(n):
-         if ((parinfo != None) and (parinfo[i].has_key(key))):
+         if ((parinfo is not None) and (key in parinfo[i])):
            values.append(parinfo[i][key])
          else:
            values.append(default)
 
       # Convert to numeric arrays if possible
       test = default
-      if (type(default) == types.ListType): test=default[0]
-      if (type(test) == types.IntType):
-         values = Numeric.asarray(values, Numeric.Int)
-      elif (type(test) == types.FloatType):
-         values = Numeric.asarray(values, Numeric.Float)
+      if (type(default) == list): test=default[0]
+      if (type(test) == int):
+         values = Numeric.asarray(values, int)
+      elif (type(test) == float):
+         values = Numeric.asarray(values, float)
       return(values)
 
 
@@ -1412,7 +1411,7 @@ Keywords:
       if (self.debug): print('Entering call...')
       if (self.qanytied): x = self.tie(x, self.ptied)
       self.nfev = self.nfev + 1
-      if (fjac == None):
+      if (fjac is None):
          [status, f] = fcn(x, fjac=fjac, **functkw)
          if (self.damp > 0):
             ## Apply the damping if requested.  This replaces the residuals
@@ -1443,8 +1442,8 @@ Keywords:
 
            ## This is hopefully a compromise between speed and robustness.
            ## Need to do this because of the possibility of over- or underflow.
-           mx = max(vec)
-           mn = min(vec)
+           mx = Numeric.max(vec)
+           mn = Numeric.min(vec)
            mx = max(abs(mx), abs(mn))
            if mx == 0: return(vec[0]*0.)
            if mx > agiant or mx < adwarf:
@@ -1461,10 +1460,10 @@ Keywords:
 
       if (self.debug): print('Entering fdjac2...')
       machep = self.machar.machep
-      if epsfcn == None:  epsfcn = machep
-      if xall == None:    xall = x
-      if ifree == None:   ifree = Numeric.arange(len(xall))
-      if step == None:    step = x * 0.
+      if epsfcn is None:  epsfcn = machep
+      if xall is None:    xall = x
+      if ifree is None:   ifree = Numeric.arange(len(xall))
+      if step is None:    step = x * 0.
       nall = len(xall)
 
       eps = Numeric.sqrt(max([epsfcn, machep]))
@@ -1474,11 +1473,13 @@ Keywords:
       ## Compute analytical derivative if requested
       if (autoderivative == 0):
          mperr = 0
-         fjac = Numeric.zeros(nall, Numeric.Float)
-         Numeric.Put(fjac, ifree, 1.0)  ## Specify which parameters need derivatives
-         [status, fp] = self.call(fcn, xall, functkw, fjac=fjac)
+         fjac = Numeric.zeros(nall, float)
+         Numeric.put(fjac, ifree, 1.0)  ## Specify which parameters need derivatives
+         [status, fp, pderiv] = self.call(fcn, xall, functkw, fjac=fjac)
+         if (status < 0): return(None)
 
-         if len(fjac) != m*nall:
+         fjac = Numeric.array(pderiv, float)
+         if Numeric.size(fjac) != m*nall:
              print('ERROR: Derivative matrix was not computed properly.')
              return(None)
 
@@ -1491,34 +1492,36 @@ Keywords:
          if len(ifree) < nall:
             fjac = fjac[:,ifree]
             fjac.shape = [m, n]
-            return(fjac)
+         return(fjac)
 
-      fjac = Numeric.zeros([m, n], Numeric.Float)
+      fjac = Numeric.zeros([m, n], float)
 
       h = eps * abs(x)
 
       ## if STEP is given, use that
-      if step != None:
+      if step is not None:
          stepi = Numeric.take(step, ifree)
-         wh = Numeric.nonzero(stepi > 0)
+         wh = Numeric.nonzero(stepi > 0)[0]
          if (len(wh) > 0): Numeric.put(h, wh, Numeric.take(stepi, wh))
 
       ## if relative step is given, use that
       if (len(dstep) > 0):
          dstepi = Numeric.take(dstep, ifree)
-         wh = Numeric.nonzero(dstepi > 0)
+         wh = Numeric.nonzero(dstepi > 0)[0]
          if len(wh) > 0: Numeric.put(h, wh, abs(Numeric.take(dstepi,wh)*Numeric.take(x,wh)))
 
       ## In case any of the step values are zero
-      wh = Numeric.nonzero(h == 0)
+      wh = Numeric.nonzero(h == 0)[0]
       if len(wh) > 0: Numeric.put(h, wh, eps)
 
       ## Reverse the sign of the step if we are up against the parameter
       ## limit, or if the user requested it.
+      ## dside is given for all parameters, select the free ones
+      dside = Numeric.take(dside, ifree)
       mask = dside == -1
       if len(ulimited) > 0 and len(ulimit) > 0:
-         mask = mask or (ulimited and (x > ulimit-h))
-         wh = Numeric.nonzero(mask)
+         mask = mask | ((ulimited != 0) & (x > ulimit-h))
+         wh = Numeric.nonzero(mask)[0]
          if len(wh) > 0: Numeric.put(h, wh, -Numeric.take(h, wh))
       ## Loop through parameters, computing the derivative for each
       for j in range(n):
@@ -1678,7 +1681,7 @@ Keywords:
       n = sz[1]
 
       ## Compute the initial column norms and initialize arrays
-      acnorm = Numeric.zeros(n, Numeric.Float)
+      acnorm = Numeric.zeros(n, float)
       for j in range(n):
          acnorm[j] = self.enorm(a[:,j])
       rdiag = acnorm.copy()
@@ -1691,7 +1694,7 @@ Keywords:
          if (pivot != 0):
             ## Bring the column of largest norm into the pivot position
             rmax = max(rdiag[j:])
-            kmax = Numeric.nonzero(rdiag[j:] == rmax)
+            kmax = Numeric.nonzero(rdiag[j:] == rmax)[0]
             ct = len(kmax)
             kmax = kmax + j
             if ct > 0:
@@ -1833,7 +1836,7 @@ Keywords:
 
       for j in range(n):
          r[j:n,j] = r[j,j:n]
-      x = Numeric.diagonal(r)
+      x = Numeric.diagonal(r).copy()
       wa = qtb.copy()
 
       ## Eliminate the diagonal matrix d using a givens rotation
@@ -1877,7 +1880,7 @@ Keywords:
       ## Solve the triangular system for z.  If the system is singular
       ## then obtain a least squares solution
       nsing = n
-      wh = Numeric.nonzero(sdiag == 0)
+      wh = Numeric.nonzero(sdiag == 0)[0]
       if (len(wh) > 0):
          nsing = wh[0]
          wa[nsing:] = 0
@@ -2002,7 +2005,7 @@ Keywords:
       ## jacobian is rank-deficient, obtain a least-squares solution
       nsing = n
       wa1 = qtb.copy()
-      wh = Numeric.nonzero(Numeric.diagonal(r) == 0)
+      wh = Numeric.nonzero(Numeric.diagonal(r) == 0)[0]
       if len(wh) > 0:
          nsing = wh[0]
          wa1[wh[0]:] = 0
@@ -2100,7 +2103,7 @@ Keywords:
    ## Procedure to tie one parameter to another.
    def tie(self, p, ptied=None):
       if (self.debug): print('Entering tie...')
-      if (ptied == None): return
+      if (ptied is None): return
       for i in range(len(ptied)):
          if ptied[i] == '': continue
          cmd = 'p[' + str(i) + '] = ' + ptied[i]
@@ -2178,7 +2181,7 @@ Keywords:
    def calc_covar(self, rr, ipvt=None, tol=1.e-14):
 
       if (self.debug): print('Entering calc_covar...')
-      if Numeric.rank(rr) != 2:
+      if Numeric.ndim(rr) != 2:
          print('ERROR: r must be a two-dimensional matrix')
          return(-1)
       s = Numeric.shape(rr)
@@ -2187,7 +2190,7 @@ Keywords:
          print('ERROR: r must be a square matrix')
          return(-1)
 
-      if (ipvt == None): ipvt = Numeric.arange(n)
+      if (ipvt is None): ipvt = Numeric.arange(n)
       r = rr.copy()
       r.shape = [n,n]
 
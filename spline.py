@@ -17,6 +17,14 @@ Example usage:
 Uses "searchsorted" from the Numeric module, aka "binarysearch" in older
 versions.
 
+Modifications:
+   Oct. 18, 2026
+      - Added SplineMap and second_derivatives(), which compute splines
+        for many sets of points at once.  The tridiagonal system is solved
+        with loops over the points that operate on all of the sets together.
+        Spline uses them, and evaluates arrays without a Python loop.
+      - The high_slope end condition used the wrong element of the
+        decomposition.
 """
 
 import func
@@ -48,49 +56,8 @@ class Spline(func.FuncOps):
    
     #def calc_ypp(self):
 	def calc_ypp(self):
-		x_vals = self.x_vals
-		y_vals = self.y_vals
-		n = len(x_vals)
-		y2_vals  = np.zeros(n, float)
-		u        = np.zeros(n-1, float)
-		
-		if self.use_low_slope:
-			u[0] = (3.0/(x_vals[1]-x_vals[0])) * \
-			((y_vals[1]-y_vals[0])/
-				(x_vals[1]-x_vals[0])-self.low_slope)
-			y2_vals[0] = -0.5
-		else:
-			u[0] = 0.0
-			y2_vals[0] = 0.0   # natural spline
-			
-		for i in range(1, n-1):
-			sig = (x_vals[i]-x_vals[i-1]) / \
-			(x_vals[i+1]-x_vals[i-1])
-			p   = sig*y2_vals[i-1]+2.0
-			y2_vals[i] = (sig-1.0)/p
-			u[i] = (y_vals[i+1]-y_vals[i]) / \
-			(x_vals[i+1]-x_vals[i]) - \
-			(y_vals[i]-y_vals[i-1])/ \
-			(x_vals[i]-x_vals[i-1])
-			u[i] = (6.0*u[i]/(x_vals[i+1]-x_vals[i-1]) - 
-				sig*u[i-1]) / p
-			
-		if self.use_high_slope:
-			qn = 0.5
-			un = (3.0/(x_vals[n-1]-x_vals[n-2])) * \
-			(self.high_slope - (y_vals[n-1]-y_vals[n-2]) /
-			(x_vals[n-1]-x_vals[n-2]))
-		else:
-			qn = 0.0
-			un = 0.0    # natural spline
-		
-		y2_vals[n-1] = (un-qn*u[n-2])/(qn*y2_vals[n-1]+1.0)
-
-		rng = range(n-1)
-		rng.reverse()
-		for k in rng:         # backsubstitution step
-			y2_vals[k] = y2_vals[k]*y2_vals[k+1]+u[k]
-		self.y2_vals = y2_vals
+		self.y2_vals = second_derivatives(self.x_vals, self.y_vals,
+		                                  self.low_slope, self.high_slope)
       
       
     # compute approximation
@@ -98,7 +65,8 @@ class Spline(func.FuncOps):
     #def __call__(self, arg):
 		"Simulate a ufunc; handle being called on an array."
 		if type(arg) == func.ArrayType:
-			return func.array_map(self.call, arg)
+			return SplineMap(self.x_vals, arg)(self.y_vals,
+			                                   y2=self.y2_vals)
 		else:
 			return self.call(arg)
 
@@ -159,6 +127,120 @@ class LinInt(func.FuncOps):
 		b = (x - self.x_vals[pos-1]) / h
 		return a*self.y_vals[pos-1] + b*self.y_vals[pos]
 
+def _decompose(x, use_low_slope=0, use_high_slope=0):
+    # The decomposition of the tridiagonal system for the second derivatives
+    # of splines through points x[..., n].  Only depends on x, so it can be
+    # reused for different y.  The arrays are transposed to [n, ...].
+    x = np.asarray(x, float)
+    n = x.shape[-1]
+    x = np.moveaxis(x, -1, 0)
+    sig = np.zeros(x.shape)
+    sig[1:n-1] = (x[1:n-1]-x[0:n-2]) / (x[2:n]-x[0:n-2])
+    p = np.ones(x.shape)
+    c = np.zeros(x.shape)
+    if use_low_slope: c[0] = -0.5
+    for i in range(1, n-1):
+        p[i] = sig[i]*c[i-1]+2.0
+        c[i] = (sig[i]-1.0)/p[i]
+    if use_high_slope: p[n-1] = 0.5*c[n-2]+1.0
+    return (x, sig, p, c)
+
+def second_derivatives(x, y, low_slope=None, high_slope=None,
+                       decomposition=None):
+    """
+    Returns the second derivatives of the cubic splines through the points
+    (x[..., i], y[..., i]).  The last dimension of x and y is the points, and
+    the splines for all of the other dimensions are computed together.
+    Natural splines are computed unless the slope at either end is given.
+    decomposition is the output of _decompose() for x, which is computed
+    if not given.
+    """
+    if decomposition is None:
+        decomposition = _decompose(x, low_slope is not None,
+                                   high_slope is not None)
+    x, sig, p, c = decomposition
+    y = np.moveaxis(np.asarray(y, float), -1, 0)
+    n = len(x)
+    u = np.zeros(np.broadcast(x, y).shape)
+    if low_slope is not None:
+        u[0] = (3.0/(x[1]-x[0])) * ((y[1]-y[0])/(x[1]-x[0])-low_slope)
+    u[1:n-1] = ((y[2:n]-y[1:n-1])/(x[2:n]-x[1:n-1]) -
+                (y[1:n-1]-y[0:n-2])/(x[1:n-1]-x[0:n-2]))
+    u[1:n-1] = 6.0*u[1:n-1]/(x[2:n]-x[0:n-2])
+    for i in range(1, n-1):
+        u[i] = (u[i] - sig[i]*u[i-1]) / p[i]
+    y2 = np.zeros(u.shape)
+    if high_slope is not None:
+        un = (3.0/(x[n-1]-x[n-2])) * \
+             (high_slope - (y[n-1]-y[n-2])/(x[n-1]-x[n-2]))
+        y2[n-1] = (un-0.5*u[n-2])/p[n-1]
+    for k in range(n-2, -1, -1):     # backsubstitution step
+        y2[k] = c[k]*y2[k+1]+u[k]
+    return np.moveaxis(y2, 0, -1)
+
+class SplineMap:
+    """
+    Cubic spline interpolation of values given at points x1 onto points x2,
+    computed once for x1 and x2 so that it can be applied to many sets of
+    values.  x1 and x2 can be 1-D, or 2-D [nsets, npoints] to interpolate
+    several sets at once, each with its own points.  Natural splines are
+    used, and points outside the range of x1 get the end values, as with
+    Spline.
+
+    Example:
+    >>> m = SplineMap(energy, ref_energy)   # energy is [n_detectors, nchans]
+    >>> aligned = m(data)                   # data is [n_detectors, nchans]
+    """
+    def __init__(self, x1, x2):
+        x1 = np.asarray(x1, float)
+        x2 = np.asarray(x2, float)
+        self.shape = np.broadcast(x1[..., 0:1], x2).shape
+        x1 = np.broadcast_to(x1, self.shape[:-1] + x1.shape[-1:])
+        x2 = np.broadcast_to(x2, self.shape)
+        self.decomposition = _decompose(x1)
+        n = x1.shape[-1]
+        pos = np.zeros(self.shape, int)
+        for index in np.ndindex(self.shape[:-1]):
+            pos[index] = np.searchsorted(x1[index], x2[index])
+        pos = np.clip(pos, 1, n-1)
+        x_lo = np.take_along_axis(x1, pos-1, -1)
+        x_hi = np.take_along_axis(x1, pos, -1)
+        h = x_hi - x_lo
+        if np.any(h == 0.0):
+            raise ValueError(BadInput)
+        a = (x_hi - x2) / h
+        b = (x2 - x_lo) / h
+        # Outside the range of x1 use the end values
+        low = x2 <= x1[..., 0:1]
+        high = x2 >= x1[..., n-1:n]
+        a[low] = 1.0; b[low] = 0.0
+        a[high] = 0.0; b[high] = 1.0
+        self.pos = pos
+        self.a = a
+        self.b = b
+        self.ca = (a*a*a - a) * h*h/6.0
+        self.cb = (b*b*b - b) * h*h/6.0
+        self.ca[low | high] = 0.0
+        self.cb[low | high] = 0.0
+
+    def __call__(self, y1, y2=None):
+        """
+        Returns the interpolated values for values y1 at the points x1.
+        y2 are the second derivatives of the splines, which are computed if
+        not given.
+        """
+        y1 = np.asarray(y1, float)
+        if y2 is None:
+            y2 = second_derivatives(None, y1,
+                                    decomposition=self.decomposition)
+        y1 = np.broadcast_to(y1, self.shape[:-1] + y1.shape[-1:])
+        y2 = np.broadcast_to(y2, y1.shape)
+        pos = self.pos
+        return (self.a*np.take_along_axis(y1, pos-1, -1) +
+                self.b*np.take_along_axis(y1, pos, -1) +
+                self.ca*np.take_along_axis(y2, pos-1, -1) +
+                self.cb*np.take_along_axis(y2, pos, -1))
+
 def spline_interpolate(x1, y1, x2):
     """
     Given a function at a set of points (x1, y1), interpolate to